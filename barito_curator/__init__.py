@@ -2,6 +2,19 @@ import os
 import logging
 import argparse
 
+from barito_curator.daemon import (DEFAULT_JITTER, DEFAULT_REFRESH_INTERVAL,
+                                   DEFAULT_SWEEP_INTERVAL, run_daemon)
+from barito_curator.ilm import reconcile_ilm_in_barito
+from barito_curator.metrics import enable_metrics
+from barito_curator.plan import apply_plan, write_plan
+from barito_curator.profiling import enable_profiling
+from barito_curator.resilience import (DEFAULT_CLUSTER_TIMEOUT,
+                                       DEFAULT_COOLDOWN,
+                                       DEFAULT_FAILURE_THRESHOLD,
+                                       DEFAULT_MAX_ATTEMPTS, CircuitBreaker,
+                                       ResiliencePolicy)
+from barito_curator.sharding import Shard
+from barito_curator.state import StateStore
 from barito_curator.utils import delete_expired_indices_in_barito
 
 
@@ -13,15 +26,174 @@ def main():
                         dest='dry_run',
                         action='store_true',
                         help="Log without actually doing actions")
+    parser.add_argument('--engine',
+                        choices=['threads', 'asyncio'],
+                        default='threads',
+                        help="Execution engine used to process clusters")
+    parser.add_argument('--concurrency',
+                        type=int,
+                        help="Maximum clusters processed at once by the "
+                        "asyncio engine, default 64")
+    parser.add_argument('--deadline',
+                        type=float,
+                        help="Seconds after which a one-shot run starts no "
+                        "further cluster sweeps")
+    parser.add_argument('--cluster-timeout',
+                        dest='cluster_timeout',
+                        type=float,
+                        default=DEFAULT_CLUSTER_TIMEOUT,
+                        help="Seconds a single cluster may spend on ping, "
+                        "listing and deletion")
+    parser.add_argument('--max-attempts',
+                        dest='max_attempts',
+                        type=int,
+                        default=DEFAULT_MAX_ATTEMPTS,
+                        help="Attempts for requests failing with retryable "
+                        "errors")
+    parser.add_argument('--breaker-threshold',
+                        dest='breaker_threshold',
+                        type=int,
+                        default=DEFAULT_FAILURE_THRESHOLD,
+                        help="Consecutive failures after which a cluster is "
+                        "skipped")
+    parser.add_argument('--breaker-cooldown',
+                        dest='breaker_cooldown',
+                        type=float,
+                        default=DEFAULT_COOLDOWN,
+                        help="Seconds a failing cluster is skipped for")
+    parser.add_argument('--state-file',
+                        dest='state_file',
+                        help="SQLite file remembering evaluated indices, "
+                        "enables incremental runs")
+    parser.add_argument('--daemon',
+                        action='store_true',
+                        help="Keep running and sweep every cluster on a "
+                        "schedule")
+    parser.add_argument('--sweep-interval',
+                        dest='sweep_interval',
+                        type=float,
+                        default=DEFAULT_SWEEP_INTERVAL,
+                        help="Seconds between sweeps of a cluster in daemon "
+                        "mode")
+    parser.add_argument('--refresh-interval',
+                        dest='refresh_interval',
+                        type=float,
+                        default=DEFAULT_REFRESH_INTERVAL,
+                        help="Seconds between Barito Market profile refreshes "
+                        "in daemon mode")
+    parser.add_argument('--jitter',
+                        type=float,
+                        default=DEFAULT_JITTER,
+                        help="Random fraction added to or removed from each "
+                        "sweep interval in daemon mode")
+    parser.add_argument('--metrics-textfile',
+                        dest='metrics_textfile',
+                        help="Write Prometheus metrics to this file after a "
+                        "one-shot run, for the node-exporter textfile "
+                        "collector")
+    parser.add_argument('--metrics-port',
+                        dest='metrics_port',
+                        type=int,
+                        help="Serve Prometheus metrics on this port in daemon "
+                        "mode")
+    parser.add_argument('--profile',
+                        dest='profile_path',
+                        help="Write timing spans per cluster and phase to "
+                        "this Chrome trace file and log the slowest ones")
+    parser.add_argument('--profile-cpu',
+                        dest='profile_cpu',
+                        action='store_true',
+                        help="Also capture the filter phase with cProfile "
+                        "into the trace file path plus .prof")
+    parser.add_argument('--shard-index',
+                        dest='shard_index',
+                        type=int,
+                        default=0,
+                        help="Shard of the cluster fleet handled by this "
+                        "replica, from 0")
+    parser.add_argument('--shard-count',
+                        dest='shard_count',
+                        type=int,
+                        default=1,
+                        help="Number of replicas the cluster fleet is split "
+                        "across")
+    subparsers = parser.add_subparsers(dest='command')
+    plan_parser = subparsers.add_parser(
+        'plan', help="Write expired indices per cluster to a plan file")
+    plan_parser.add_argument('plan_path', metavar='PLAN')
+    apply_parser = subparsers.add_parser(
+        'apply', help="Delete the indices listed in a plan file")
+    apply_parser.add_argument('plan_path', metavar='PLAN')
+    subparsers.add_parser(
+        'reconcile',
+        help="Push retention as ILM policies and index templates into each "
+        "cluster")
     args = parser.parse_args()
+    try:
+        shard = Shard(args.shard_index, args.shard_count)
+    except ValueError as e:
+        parser.error(str(e))
+    if shard.count == 1:
+        shard = None
 
-    api_url = os.environ['BARITO_API_URL']
-    client_key = os.environ['BARITO_API_CLIENT_KEY']
+    if args.command != 'apply':
+        api_url = os.environ['BARITO_API_URL']
+        client_key = os.environ['BARITO_API_CLIENT_KEY']
     if 'DELETE_TIMEOUT' in os.environ:
-        delete_timeout = os.environ['DELETE_TIMEOUT']
+        delete_timeout = int(os.environ['DELETE_TIMEOUT'])
     else:
         delete_timeout = 3600
+    profile_cache_path = os.environ.get('BARITO_API_CACHE_PATH')
 
     logging.basicConfig(level=logging.INFO)
-    delete_expired_indices_in_barito(logging.getLogger(), api_url, client_key, delete_timeout,
-                                     args.dry_run)
+    state = StateStore(args.state_file) if args.state_file else None
+    policy = ResiliencePolicy(args.cluster_timeout,
+                              args.max_attempts,
+                              breaker=CircuitBreaker(state,
+                                                     args.breaker_threshold,
+                                                     args.breaker_cooldown))
+    metrics = None
+    if args.metrics_textfile or args.metrics_port:
+        metrics = enable_metrics()
+    profiler = None
+    if args.profile_path:
+        profiler = enable_profiling(args.profile_cpu)
+    try:
+        if args.command == 'plan':
+            write_plan(logging.getLogger(), api_url, client_key,
+                       args.plan_path, profile_cache_path, shard)
+        elif args.command == 'apply':
+            apply_plan(logging.getLogger(), args.plan_path, delete_timeout,
+                       args.dry_run, state)
+        elif args.command == 'reconcile':
+            reconcile_ilm_in_barito(logging.getLogger(), api_url, client_key,
+                                    args.dry_run, profile_cache_path, shard)
+        elif args.daemon:
+            if args.metrics_port:
+                metrics.start_http_server(args.metrics_port)
+            run_daemon(logging.getLogger(), api_url, client_key, delete_timeout,
+                       args.dry_run, profile_cache_path, state,
+                       args.sweep_interval, args.refresh_interval, args.jitter,
+                       policy, shard=shard)
+        elif args.engine == 'asyncio':
+            from barito_curator.aio import (
+                DEFAULT_CONCURRENCY, delete_expired_indices_in_barito_async)
+            delete_expired_indices_in_barito_async(logging.getLogger(), api_url,
+                                                   client_key, delete_timeout,
+                                                   args.dry_run,
+                                                   args.concurrency or DEFAULT_CONCURRENCY,
+                                                   profile_cache_path, state,
+                                                   args.deadline, policy, shard)
+        else:
+            delete_expired_indices_in_barito(logging.getLogger(), api_url, client_key,
+                                             delete_timeout, args.dry_run,
+                                             profile_cache_path, state,
+                                             args.deadline, policy, shard)
+    finally:
+        if state is not None:
+            state.close()
+        if args.metrics_textfile and not args.daemon:
+            metrics.write_textfile(args.metrics_textfile)
+        if profiler is not None:
+            profiler.write(args.profile_path)
+            profiler.log_summary(logging.getLogger())
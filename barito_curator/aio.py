@@ -0,0 +1,281 @@
+import asyncio
+import time
+
+from barito_curator.budget import parse_disk_allocation
+from barito_curator.deletion import BatchedDeletion
+from barito_curator.expiry import classify_indices
+from barito_curator.metadata import fetch_clusters
+from barito_curator.metrics import count_deleted, count_failure, time_phase
+from barito_curator.profiling import trace_span
+from barito_curator.resilience import (ClusterGuard, DeadlineExceeded,
+                                       ResiliencePolicy)
+from barito_curator.scheduling import ClusterSample, schedule_samples
+from barito_curator.tiers import apply_tier_actions_async
+from barito_curator.utils import (CLIENT_TIMEOUT, build_client_options,
+                                  filter_expired_index_names,
+                                  filter_over_budget_index_names,
+                                  is_circuit_closed, parse_store_size)
+
+DEFAULT_CONCURRENCY = 64
+
+
+async def connect_to_elasticsearch_async(addresses, timeout=CLIENT_TIMEOUT,
+                                        sniff=False):
+    from elasticsearch import AsyncElasticsearch
+
+    if isinstance(addresses, str):
+        addresses = [addresses]
+    elastic = AsyncElasticsearch(
+        addresses, **build_client_options(addresses, timeout, sniff))
+    if not await elastic.ping():
+        await elastic.close()
+        raise ConnectionError(
+            f"Unable to ping ElasticSearch: {', '.join(addresses)}")
+    return elastic
+
+
+async def list_indices_async(elastic):
+    return {
+        row['index']: parse_store_size(row['store.size'])
+        for row in await elastic.cat.indices(format='json',
+                                             h='index,store.size',
+                                             bytes='b',
+                                             expand_wildcards='open,closed')
+    }
+
+
+async def read_disk_allocation_async(elastic):
+    return parse_disk_allocation(await elastic.cat.allocation(
+        format='json', h='disk.used,disk.total', bytes='b'))
+
+
+async def count_pending_tasks_async(elastic):
+    return len((await elastic.cluster.pending_tasks())['tasks'])
+
+
+async def find_existing_indices_async(elastic, index_names):
+    return list(await elastic.indices.get_alias(index=','.join(index_names),
+                                                ignore_unavailable=True))
+
+
+async def read_pending_tasks_async(logger, elastic, guard):
+    from elasticsearch import TransportError
+
+    try:
+        return await guard.call_async('delete', count_pending_tasks_async,
+                                      elastic)
+    except (TransportError, DeadlineExceeded) as e:
+        logger.warning(f"Unable to read pending tasks: {e}")
+        return None
+
+
+async def read_existing_indices_async(logger, elastic, index_names, guard):
+    from elasticsearch import TransportError
+
+    try:
+        return await guard.call_async('delete', find_existing_indices_async,
+                                      elastic, index_names)
+    except (TransportError, DeadlineExceeded) as e:
+        logger.warning(f"Unable to check {len(index_names)} indices: {e}")
+        return index_names
+
+
+async def delete_indices_async(logger, elastic, index_names, delete_timeout,
+                               dry_run=False, guard=None):
+    from elasticsearch import TransportError
+
+    if dry_run:
+        for index_name in index_names:
+            logger.info(f"DRY-RUN: delete index `{index_name}`")
+        return []
+
+    guard = guard or ClusterGuard()
+    deletion = BatchedDeletion(index_names)
+    batch = deletion.next_batch()
+    while batch:
+        if guard.remaining() <= 0:
+            logger.warning("Cluster deadline reached, leaving remaining "
+                           "indices for the next run")
+            break
+        logger.info(f"Deleting {len(batch)} indices: {', '.join(batch)}")
+        started = time.monotonic()
+        try:
+            await elastic.indices.delete(
+                index=','.join(batch),
+                ignore_unavailable=True,
+                **guard.build_delete_params(delete_timeout))
+        except TransportError as e:
+            logger.warning(f"Unable to delete {len(batch)} indices: {e}")
+            deletion.record_failure(
+                batch, await read_existing_indices_async(logger, elastic,
+                                                         batch, guard))
+        else:
+            deletion.record_success(
+                batch, time.monotonic() - started,
+                await read_pending_tasks_async(logger, elastic, guard))
+        batch = deletion.next_batch()
+
+    for index_name in deletion.failed:
+        logger.warning(f"Unable to delete index `{index_name}` after retries")
+    return deletion.deleted
+
+
+async def delete_expired_indices_with_client_async(logger, elastic, cluster,
+                                                   delete_timeout,
+                                                   dry_run=False, state=None,
+                                                   index_sizes=None,
+                                                   disk_allocation=None,
+                                                   guard=None):
+    guard = guard or ClusterGuard()
+    if index_sizes is None:
+        with time_phase(cluster.address, 'list'):
+            index_sizes = await guard.call_async('list', list_indices_async,
+                                                 elastic)
+    with time_phase(cluster.address, 'filter'):
+        expired_index_names = filter_expired_index_names(
+            logger, index_sizes, cluster, state)
+    if cluster.disk_watermark is not None:
+        with time_phase(cluster.address, 'budget'):
+            if disk_allocation is None:
+                disk_allocation = await guard.call_async(
+                    'budget', read_disk_allocation_async, elastic)
+            over_budget_index_names = filter_over_budget_index_names(
+                logger, index_sizes, cluster, *disk_allocation,
+                expired_index_names)
+        expired_index_names = expired_index_names + over_budget_index_names
+    with time_phase(cluster.address, 'delete'):
+        deleted_index_names = await delete_indices_async(
+            logger, elastic, expired_index_names, delete_timeout, dry_run,
+            guard)
+    count_deleted(
+        cluster.address, len(deleted_index_names),
+        sum(index_sizes.get(index_name) or 0
+            for index_name in deleted_index_names))
+    if state is not None:
+        state.record_deleted(cluster.address, deleted_index_names)
+    if cluster.has_log_tiers:
+        with time_phase(cluster.address, 'tier'):
+            await apply_tier_actions_async(
+                logger, elastic, cluster,
+                index_sizes.keys() - set(expired_index_names), dry_run, state,
+                guard)
+    return deleted_index_names
+
+
+async def connect_with_guard_async(cluster, guard):
+    with time_phase(cluster.address, 'ping'):
+        return await guard.call_async('ping', connect_to_elasticsearch_async,
+                                      cluster.addresses,
+                                      min(CLIENT_TIMEOUT, guard.remaining()),
+                                      cluster.sniff)
+
+
+async def read_cluster_health_async(elastic):
+    return (await elastic.cluster.health())['status']
+
+
+async def sample_cluster_async(logger, cluster, policy=None):
+    policy = policy or ResiliencePolicy()
+    if not is_circuit_closed(logger, cluster, policy):
+        return None
+    started = time.monotonic()
+    guard = policy.new_guard()
+    elastic = None
+    try:
+        elastic = await connect_with_guard_async(cluster, guard)
+        with time_phase(cluster.address, 'sample'):
+            status = await guard.call_async('sample',
+                                            read_cluster_health_async, elastic)
+            disk_used, disk_total = await guard.call_async(
+                'sample', read_disk_allocation_async, elastic)
+            index_sizes = await guard.call_async('sample', list_indices_async,
+                                                 elastic)
+    except Exception as e:
+        logger.getChild(f"Cluster `{cluster.address}`").warning(
+            f"Unable to sample cluster: {e}")
+        count_failure(cluster.address)
+        policy.record_failure(cluster.address)
+        return None
+    finally:
+        if elastic is not None:
+            await elastic.close()
+    overdue_count = len(classify_indices(cluster, index_sizes).expired)
+    return ClusterSample(cluster, status, disk_used, disk_total,
+                         overdue_count, time.monotonic() - started)
+
+
+async def delete_expired_indices_in_sample_async(logger, sample,
+                                                 delete_timeout, dry_run=False,
+                                                 state=None, stop_at=None,
+                                                 policy=None):
+    policy = policy or ResiliencePolicy()
+    cluster = sample.cluster
+    child_logger = logger.getChild(f"Cluster `{cluster.address}`")
+    if stop_at is not None and time.monotonic() >= stop_at:
+        child_logger.warning("Skipping cluster: run deadline reached")
+        return
+    try:
+        with trace_span('sweep', cluster.address, 'cluster'):
+            guard = policy.new_guard(sample.sample_time)
+            elastic = await connect_with_guard_async(cluster, guard)
+            try:
+                await delete_expired_indices_with_client_async(
+                    child_logger, elastic, cluster, delete_timeout, dry_run,
+                    state, guard=guard)
+            finally:
+                await elastic.close()
+    except Exception as e:
+        child_logger.warning(f"Unable to delete expired indices: {e}")
+        count_failure(cluster.address)
+        policy.record_failure(cluster.address)
+    else:
+        policy.record_success(cluster.address)
+
+
+async def delete_expired_indices_in_clusters_async(
+        logger, clusters, delete_timeout, dry_run=False,
+        concurrency=DEFAULT_CONCURRENCY, state=None, deadline=None,
+        policy=None):
+    stop_at = None if deadline is None else time.monotonic() + deadline
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def sample_with_limit(cluster):
+        async with semaphore:
+            return await sample_cluster_async(logger, cluster, policy)
+
+    async def delete_with_limit(sample):
+        async with semaphore:
+            await delete_expired_indices_in_sample_async(
+                logger, sample, delete_timeout, dry_run, state, stop_at,
+                policy)
+
+    samples = [
+        sample for sample in await asyncio.gather(
+            *(sample_with_limit(cluster) for cluster in clusters))
+        if sample is not None
+    ]
+    scheduled = schedule_samples(logger, samples)
+    # The semaphore wakes waiters in order, so the most urgent clusters are
+    # started first.
+    await asyncio.gather(*(delete_with_limit(sample) for sample in scheduled))
+
+
+def delete_expired_indices_in_barito_async(logger,
+                                           api_url,
+                                           client_key,
+                                           delete_timeout,
+                                           dry_run=False,
+                                           concurrency=DEFAULT_CONCURRENCY,
+                                           profile_cache_path=None,
+                                           state=None,
+                                           deadline=None,
+                                           policy=None,
+                                           shard=None):
+    with time_phase('', 'fetch'):
+        clusters = fetch_clusters(api_url, client_key, profile_cache_path,
+                                  shard)
+    asyncio.run(
+        delete_expired_indices_in_clusters_async(logger, clusters,
+                                                 delete_timeout, dry_run,
+                                                 concurrency, state,
+                                                 deadline, policy))
@@ -0,0 +1,54 @@
+import heapq
+from datetime import datetime
+
+from barito_curator.expiry import INDEX_DATE_FORMAT, split_index_name
+
+
+def parse_disk_allocation(rows):
+    disk_used = disk_total = 0
+    for row in rows:
+        # Unassigned shards are reported on a row without disk figures.
+        if row.get('disk.total'):
+            disk_used += int(row['disk.used'])
+            disk_total += int(row['disk.total'])
+    return disk_used, disk_total
+
+
+def read_disk_allocation(elastic):
+    return parse_disk_allocation(
+        elastic.cat.allocation(format='json',
+                               h='disk.used,disk.total',
+                               bytes='b'))
+
+
+def select_over_budget_indices(cluster, index_sizes, disk_used, disk_total,
+                               excluded_index_names=frozenset(), now=None):
+    if cluster.disk_watermark is None or not disk_total:
+        return []
+    excess = disk_used - disk_total * cluster.disk_watermark / 100 - sum(
+        index_sizes.get(index_name) or 0
+        for index_name in excluded_index_names)
+    if excess <= 0:
+        return []
+
+    # Today's indices are still being written to and are never selected, and
+    # closed indices, whose size is unknown, are left to retention.
+    today = (now or datetime.today()).strftime(INDEX_DATE_FORMAT)
+    candidates = []
+    for index_name, size in index_sizes.items():
+        if index_name in excluded_index_names or size is None:
+            continue
+        parsed = split_index_name(index_name, cluster.index_name_parser)
+        if parsed is None or parsed[1] >= today:
+            continue
+        topic, index_date_str = parsed
+        candidates.append((cluster.get_log_priority(topic), index_date_str,
+                           index_name))
+    heapq.heapify(candidates)
+
+    selected = []
+    while excess > 0 and candidates:
+        _, _, index_name = heapq.heappop(candidates)
+        selected.append(index_name)
+        excess -= index_sizes[index_name]
+    return selected
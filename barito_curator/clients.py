@@ -0,0 +1,42 @@
+import threading
+
+from barito_curator.metrics import time_phase
+from barito_curator.utils import CLIENT_TIMEOUT, connect_to_elasticsearch
+
+
+class ClientPool:
+    def __init__(self):
+        self.__clients = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__clients)
+
+    def get(self, cluster, guard):
+        with self.__lock:
+            client = self.__clients.get(cluster.address)
+        if client is not None and client[0] == cluster.addresses:
+            return client[1]
+        if client is not None:
+            self.discard(cluster.address)
+
+        with time_phase(cluster.address, 'ping'):
+            elastic = guard.call('ping', connect_to_elasticsearch,
+                                 cluster.addresses, CLIENT_TIMEOUT,
+                                 cluster.sniff)
+        with self.__lock:
+            self.__clients[cluster.address] = cluster.addresses, elastic
+        return elastic
+
+    def discard(self, address):
+        with self.__lock:
+            client = self.__clients.pop(address, None)
+        if client is not None:
+            client[1].close()
+
+    def close(self):
+        with self.__lock:
+            addresses = list(self.__clients)
+        for address in addresses:
+            self.discard(address)
@@ -0,0 +1,160 @@
+import heapq
+import random
+import signal
+import threading
+import time
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+from barito_curator.clients import ClientPool
+from barito_curator.metadata import fetch_clusters
+from barito_curator.metrics import count_failure, time_phase
+from barito_curator.profiling import trace_span
+from barito_curator.resilience import CircuitBreaker, ResiliencePolicy
+from barito_curator.utils import (delete_expired_indices_with_client,
+                                  is_circuit_closed)
+
+DEFAULT_SWEEP_INTERVAL = 3600
+DEFAULT_REFRESH_INTERVAL = 600
+DEFAULT_JITTER = 0.1
+
+
+class Daemon:
+    def __init__(self,
+                 logger,
+                 api_url,
+                 client_key,
+                 delete_timeout,
+                 dry_run=False,
+                 profile_cache_path=None,
+                 state=None,
+                 sweep_interval=DEFAULT_SWEEP_INTERVAL,
+                 refresh_interval=DEFAULT_REFRESH_INTERVAL,
+                 jitter=DEFAULT_JITTER,
+                 policy=None,
+                 workers=None,
+                 shard=None):
+        self.__logger = logger
+        self.__api_url = api_url
+        self.__client_key = client_key
+        self.__delete_timeout = delete_timeout
+        self.__dry_run = dry_run
+        self.__profile_cache_path = profile_cache_path
+        self.__state = state
+        self.__sweep_interval = sweep_interval
+        self.__refresh_interval = refresh_interval
+        self.__jitter = jitter
+        self.__policy = policy or ResiliencePolicy(
+            breaker=CircuitBreaker(state))
+        self.__workers = workers or cpu_count()
+        self.__shard = shard
+
+        self.__lock = threading.Lock()
+        self.__stopping = threading.Event()
+        self.__clusters = {}
+        self.__clients = ClientPool()
+        self.__schedule = []
+        self.__in_flight = set()
+        self.__next_refresh = 0
+
+    @property
+    def clusters(self):
+        return dict(self.__clusters)
+
+    def stop(self):
+        self.__stopping.set()
+
+    def next_sweep_delay(self):
+        jitter = random.uniform(-self.__jitter, self.__jitter)
+        return self.__sweep_interval * (1 + jitter)
+
+    def refresh_clusters(self, now):
+        self.__next_refresh = now + self.__refresh_interval
+        try:
+            with time_phase('', 'fetch'):
+                clusters = fetch_clusters(self.__api_url, self.__client_key,
+                                          self.__profile_cache_path,
+                                          self.__shard)
+        except Exception as e:
+            self.__logger.warning(f"Unable to refresh clusters: {e}")
+            return
+
+        with self.__lock:
+            addresses = {cluster.address for cluster in clusters}
+            for address in self.__clusters.keys() - addresses:
+                self.__clients.discard(address)
+            for cluster in clusters:
+                if cluster.address not in self.__clusters:
+                    heapq.heappush(
+                        self.__schedule,
+                        (now + random.uniform(0, self.__sweep_interval),
+                         cluster.address))
+            self.__clusters = {cluster.address: cluster for cluster in clusters}
+
+    def pop_due_clusters(self, now):
+        due_clusters = []
+        with self.__lock:
+            while self.__schedule and self.__schedule[0][0] <= now:
+                _, address = heapq.heappop(self.__schedule)
+                cluster = self.__clusters.get(address)
+                if cluster is None or address in self.__in_flight:
+                    continue
+                self.__in_flight.add(address)
+                due_clusters.append(cluster)
+        return due_clusters
+
+    def sweep(self, cluster):
+        child_logger = self.__logger.getChild(f"Cluster `{cluster.address}`")
+        try:
+            if not is_circuit_closed(self.__logger, cluster, self.__policy):
+                return
+            guard = self.__policy.new_guard()
+            with trace_span('sweep', cluster.address, 'cluster'):
+                delete_expired_indices_with_client(
+                    child_logger, self.__clients.get(cluster, guard), cluster,
+                    self.__delete_timeout, self.__dry_run, self.__state,
+                    guard=guard)
+        except Exception as e:
+            child_logger.warning(f"Unable to delete expired indices: {e}")
+            count_failure(cluster.address)
+            self.__policy.record_failure(cluster.address)
+            self.__clients.discard(cluster.address)
+        else:
+            self.__policy.record_success(cluster.address)
+        finally:
+            with self.__lock:
+                self.__in_flight.discard(cluster.address)
+                if cluster.address in self.__clusters:
+                    heapq.heappush(self.__schedule,
+                                   (time.monotonic() + self.next_sweep_delay(),
+                                    cluster.address))
+
+    def wait_timeout(self, now):
+        with self.__lock:
+            next_sweep = self.__schedule[0][0] if self.__schedule else None
+        if next_sweep is None:
+            return max(0, self.__next_refresh - now)
+        return max(0, min(next_sweep, self.__next_refresh) - now)
+
+    def run(self):
+        pool = ThreadPool(self.__workers)
+        try:
+            while not self.__stopping.is_set():
+                now = time.monotonic()
+                if now >= self.__next_refresh:
+                    self.refresh_clusters(now)
+                for cluster in self.pop_due_clusters(now):
+                    pool.apply_async(self.sweep, (cluster, ))
+                self.__stopping.wait(self.wait_timeout(time.monotonic()))
+        finally:
+            self.__logger.info("Stopping, waiting for running sweeps")
+            pool.close()
+            pool.join()
+            self.__clients.close()
+
+
+def run_daemon(logger, *args, **kwargs):
+    daemon = Daemon(logger, *args, **kwargs)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: daemon.stop())
+    daemon.run()
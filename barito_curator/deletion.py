@@ -0,0 +1,113 @@
+from collections import deque
+
+MAX_BATCH_LENGTH = 3072
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class AdaptiveBatchSizer:
+    def __init__(self,
+                 initial_size=32,
+                 min_size=1,
+                 max_size=512,
+                 target_latency=10.0,
+                 max_pending_tasks=20):
+        self.__size = initial_size
+        self.__min_size = min_size
+        self.__max_size = max_size
+        self.__target_latency = target_latency
+        self.__max_pending_tasks = max_pending_tasks
+
+    @property
+    def size(self):
+        return self.__size
+
+    def shrink(self):
+        self.__size = max(self.__min_size, self.__size // 2)
+
+    def grow(self):
+        self.__size = min(self.__max_size,
+                          self.__size + max(1, self.__size // 4))
+
+    def record(self, latency, pending_tasks=None):
+        # Without a pending task count, only the latency is judged.
+        if (latency > self.__target_latency
+                or pending_tasks is not None
+                and pending_tasks > self.__max_pending_tasks):
+            self.shrink()
+        elif (latency < self.__target_latency / 2
+              and (pending_tasks is None
+                   or pending_tasks <= self.__max_pending_tasks / 2)):
+            self.grow()
+
+
+class BatchedDeletion:
+    def __init__(self,
+                 index_names,
+                 sizer=None,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 max_length=MAX_BATCH_LENGTH):
+        self.__pending = deque(index_names)
+        self.__sizer = sizer or AdaptiveBatchSizer()
+        self.__max_attempts = max_attempts
+        self.__max_length = max_length
+        self.__attempts = {}
+        self.__deleted = []
+        self.__failed = []
+
+    @property
+    def sizer(self):
+        return self.__sizer
+
+    @property
+    def deleted(self):
+        return self.__deleted
+
+    @property
+    def failed(self):
+        return self.__failed
+
+    def next_batch(self):
+        batch = []
+        length = 0
+        while self.__pending and len(batch) < self.__sizer.size:
+            index_name = self.__pending[0]
+            if batch and length + len(index_name) + 1 > self.__max_length:
+                break
+            batch.append(self.__pending.popleft())
+            length += len(index_name) + 1
+        return batch
+
+    def record_success(self, batch, latency, pending_tasks=None):
+        self.__deleted.extend(batch)
+        self.__sizer.record(latency, pending_tasks)
+
+    def record_failure(self, batch, remaining_index_names):
+        self.__sizer.shrink()
+        remaining_index_names = set(remaining_index_names)
+        retries = []
+        for index_name in batch:
+            if index_name not in remaining_index_names:
+                self.__deleted.append(index_name)
+                continue
+            self.__attempts[index_name] = self.__attempts.get(index_name,
+                                                              0) + 1
+            if self.__attempts[index_name] >= self.__max_attempts:
+                self.__failed.append(index_name)
+            else:
+                retries.append(index_name)
+        self.__pending.extendleft(reversed(retries))
+        return retries
+
+
+def chunk_index_names(index_names, max_length=MAX_BATCH_LENGTH):
+    chunk = []
+    length = 0
+    for index_name in index_names:
+        if chunk and length + len(index_name) + 1 > max_length:
+            yield chunk
+            chunk = []
+            length = 0
+        chunk.append(index_name)
+        length += len(index_name) + 1
+    if chunk:
+        yield chunk
@@ -0,0 +1,201 @@
+import re
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+INDEX_DATE_FORMAT = "%Y.%m.%d"
+INDEX_HOUR_FORMAT = "%Y.%m.%d.%H"
+INDEX_KEY_CACHE_SIZE = 65536
+
+IndexClassification = namedtuple('IndexClassification',
+                                 ['expired', 'kept', 'unparseable'])
+
+# `pattern` is a regular expression for the date part of an index name, with
+# `{year}`, `{month}`, `{day}` and, for hourly indices, `{hour}` placeholders.
+IndexDateFormat = namedtuple('IndexDateFormat', ['name', 'pattern'])
+
+INDEX_DATE_FORMATS = [
+    IndexDateFormat('daily', r'{year}\.{month}\.{day}'),
+    IndexDateFormat('hourly', r'{year}\.{month}\.{day}\.{hour}'),
+    IndexDateFormat('rollover', r'{year}\.{month}\.{day}-\d+'),
+    IndexDateFormat('iso', r'{year}-{month}-{day}'),
+]
+INDEX_DATE_FORMATS_BY_NAME = {
+    index_date_format.name: index_date_format
+    for index_date_format in INDEX_DATE_FORMATS
+}
+
+DATE_FIELD_PATTERNS = {
+    'year': r'\d{4}',
+    'month': r'0[1-9]|1[0-2]',
+    'day': r'0[1-9]|[12]\d|3[01]',
+    'hour': r'[01]\d|2[0-3]',
+}
+
+
+def is_hourly(index_key):
+    return len(index_key) > len("0000.00.00")
+
+
+def get_index_key_format(index_key):
+    return INDEX_HOUR_FORMAT if is_hourly(index_key) else INDEX_DATE_FORMAT
+
+
+# The date patterns only bound each field, so dates such as 2020.02.30 are
+# rejected here, once per distinct key.
+@lru_cache(maxsize=INDEX_KEY_CACHE_SIZE)
+def is_valid_index_key(index_key):
+    try:
+        datetime.strptime(index_key, get_index_key_format(index_key))
+    except ValueError:
+        return False
+    return True
+
+
+class IndexNameParser:
+    def __init__(self, index_date_formats=INDEX_DATE_FORMATS):
+        alternatives = []
+        self.__key_groups = {}
+        for position, index_date_format in enumerate(index_date_formats):
+            group_prefix = f"f{position}_"
+            try:
+                pattern = index_date_format.pattern.format(
+                    **{
+                        field: f"(?P<{group_prefix}{field}>{pattern})"
+                        for field, pattern in DATE_FIELD_PATTERNS.items()
+                    })
+            except (KeyError, IndexError) as e:
+                raise ValueError(f"Invalid index date format "
+                                 f"`{index_date_format.pattern}`: {e}")
+            key_fields = ['year', 'month', 'day']
+            if f"(?P<{group_prefix}hour>" in pattern:
+                key_fields.append('hour')
+            if any(f"(?P<{group_prefix}{field}>" not in pattern
+                   for field in key_fields):
+                raise ValueError(f"Index date format "
+                                 f"`{index_date_format.pattern}` needs a "
+                                 f"year, month and day")
+            # Each alternative is wrapped in its own group, so the match
+            # itself names the format and no other format is looked at.
+            alternatives.append(f"(?P<f{position}>{pattern})")
+            self.__key_groups[f"f{position}"] = [
+                f"{group_prefix}{field}" for field in key_fields
+            ]
+        # The topic is greedy so that, like splitting on the last dash, the
+        # shortest date part that parses is taken.
+        self.__regex = re.compile(
+            f"(?P<topic>.+)-(?:{'|'.join(alternatives)})")
+
+    def parse(self, index_name):
+        match = self.__regex.fullmatch(index_name)
+        if match is None:
+            return None
+        key = '.'.join(match.group(*self.__key_groups[match.lastgroup]))
+        if not is_valid_index_key(key):
+            return None
+        return match.group('topic'), key
+
+
+DEFAULT_INDEX_NAME_PARSER = IndexNameParser()
+
+
+def build_index_date_formats(specs):
+    # Built-in formats are named; anything else is taken as a pattern.
+    return [
+        INDEX_DATE_FORMATS_BY_NAME.get(spec) or IndexDateFormat(spec, spec)
+        for spec in specs
+    ]
+
+
+@lru_cache(maxsize=None)
+def get_index_name_parser(specs=None):
+    if specs is None:
+        return DEFAULT_INDEX_NAME_PARSER
+    return IndexNameParser(build_index_date_formats(specs))
+
+
+def build_cutoff(now, log_retention_days):
+    # An index dated D is expired when D at midnight is before
+    # `now - retention`, so any time past midnight moves the cutoff a day on.
+    deletion_date = now - timedelta(days=log_retention_days)
+    if deletion_date.time() != time():
+        deletion_date += timedelta(days=1)
+    return deletion_date.strftime(INDEX_DATE_FORMAT)
+
+
+def build_hour_cutoff(now, log_retention_days):
+    # Same as `build_cutoff`, at the start of the hour of hourly indices.
+    deletion_date = now - timedelta(days=log_retention_days)
+    if deletion_date != deletion_date.replace(minute=0, second=0,
+                                              microsecond=0):
+        deletion_date += timedelta(hours=1)
+    return deletion_date.strftime(INDEX_HOUR_FORMAT)
+
+
+def split_index_name(index_name, parser=DEFAULT_INDEX_NAME_PARSER):
+    return parser.parse(index_name)
+
+
+class ExpiryEvaluator:
+    def __init__(self, cluster, now=None):
+        self.__cluster = cluster
+        self.__parser = cluster.index_name_parser
+        self.__now = now or datetime.today()
+        self.__log_retention_days = {}
+        self.__cutoffs = {}
+
+    @property
+    def now(self):
+        return self.__now
+
+    def get_log_retention_days(self, topic):
+        log_retention_days = self.__log_retention_days.get(topic)
+        if log_retention_days is None:
+            log_retention_days = self.__cluster.get_log_retention_days(topic)
+            self.__log_retention_days[topic] = log_retention_days
+        return log_retention_days
+
+    def get_cutoff(self, topic, hourly=False):
+        cutoff = self.__cutoffs.get((topic, hourly))
+        if cutoff is None:
+            build = build_hour_cutoff if hourly else build_cutoff
+            cutoff = build(self.__now, self.get_log_retention_days(topic))
+            self.__cutoffs[topic, hourly] = cutoff
+        return cutoff
+
+    def get_index_cutoff(self, topic, index_key):
+        return self.get_cutoff(topic, is_hourly(index_key))
+
+    def split_index_name(self, index_name):
+        return self.__parser.parse(index_name)
+
+    def get_expiry_date(self, index_name):
+        parsed = self.split_index_name(index_name)
+        if parsed is None:
+            return None
+        topic, index_key = parsed
+        key_format = get_index_key_format(index_key)
+        expiry_date = datetime.strptime(index_key, key_format) + \
+            timedelta(days=self.get_log_retention_days(topic))
+        return expiry_date.strftime(key_format)
+
+    def is_expiry_due(self, expiry_date):
+        if is_hourly(expiry_date):
+            return expiry_date < build_hour_cutoff(self.__now, 0)
+        return expiry_date < build_cutoff(self.__now, 0)
+
+    def classify(self, index_names):
+        expired, kept, unparseable = set(), set(), set()
+        for index_name in index_names:
+            parsed = self.split_index_name(index_name)
+            if parsed is None:
+                unparseable.add(index_name)
+            elif parsed[1] < self.get_index_cutoff(*parsed):
+                expired.add(index_name)
+            else:
+                kept.add(index_name)
+        return IndexClassification(expired, kept, unparseable)
+
+
+def classify_indices(cluster, index_names, now=None):
+    return ExpiryEvaluator(cluster, now).classify(index_names)
@@ -0,0 +1,269 @@
+import hashlib
+from fnmatch import fnmatchcase
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+from barito_curator.deletion import chunk_index_names
+from barito_curator.metadata import MergedCluster, fetch_clusters
+from barito_curator.metrics import count_failure, time_phase
+from barito_curator.topics import WILDCARD_CHARACTERS, count_literal_characters
+from barito_curator.utils import connect_to_elasticsearch
+
+MANAGED_BY = 'barito-curator'
+MANAGED_PREFIX = f"{MANAGED_BY}-"
+DEFAULT_TEMPLATE_NAME = f"{MANAGED_PREFIX}default"
+DEFAULT_TEMPLATE_ORDER = 100
+# Index patterns only support `*`; this matches dated index names without
+# touching undated indices, which the curator never deletes either.
+DATED_INDEX_SUFFIX = '-20*'
+
+
+def get_policy_name(retention_days):
+    return f"{MANAGED_PREFIX}retention-{retention_days}d"
+
+
+def get_template_name(topic_pattern):
+    digest = hashlib.sha1(topic_pattern.encode()).hexdigest()[:12]
+    return f"{MANAGED_PREFIX}topic-{digest}"
+
+
+def build_policy(retention_days):
+    return {
+        '_meta': {
+            'managed_by': MANAGED_BY,
+            'retention_days': retention_days
+        },
+        'phases': {
+            'delete': {
+                'min_age': f"{retention_days}d",
+                'actions': {
+                    'delete': {}
+                }
+            }
+        }
+    }
+
+
+def build_template(index_pattern, retention_days, order):
+    return {
+        'index_patterns': [index_pattern],
+        'order': order,
+        'settings': {
+            'index': {
+                'lifecycle': {
+                    'name': get_policy_name(retention_days)
+                }
+            }
+        }
+    }
+
+
+def is_expressible(topic_pattern):
+    return WILDCARD_CHARACTERS.isdisjoint(topic_pattern.replace('*', ''))
+
+
+def rank_topic_patterns(topic_patterns):
+    # Same precedence as TopicMatcher: exact topics, then the most literal
+    # characters, then the pattern listed first.
+    ranked = sorted(
+        (('*' in pattern, -count_literal_characters(pattern), order), pattern)
+        for order, pattern in enumerate(topic_patterns))
+    return [pattern for _, pattern in ranked]
+
+
+def build_desired_state(cluster):
+    log_retention_days_per_app = cluster.log_retention_days_per_app
+    topic_patterns = rank_topic_patterns(list(log_retention_days_per_app))
+    templates = {
+        DEFAULT_TEMPLATE_NAME:
+        build_template(f"*{DATED_INDEX_SUFFIX}",
+                       cluster.default_log_retention_days,
+                       DEFAULT_TEMPLATE_ORDER)
+    }
+    # Legacy templates merge by order, so a higher order wins the lifecycle
+    # setting while the cluster's own mapping templates still apply.
+    for rank, topic_pattern in enumerate(topic_patterns):
+        templates[get_template_name(topic_pattern)] = build_template(
+            f"{topic_pattern}{DATED_INDEX_SUFFIX}",
+            log_retention_days_per_app[topic_pattern],
+            DEFAULT_TEMPLATE_ORDER + len(topic_patterns) - rank)
+    retention_days = {cluster.default_log_retention_days}
+    retention_days.update(log_retention_days_per_app.values())
+    policies = {
+        get_policy_name(days): build_policy(days)
+        for days in sorted(retention_days)
+    }
+    return policies, templates
+
+
+def read_managed_state(elastic):
+    policies = {
+        name: lifecycle.get('policy', {})
+        for name, lifecycle in elastic.ilm.get_lifecycle().items()
+        if name.startswith(MANAGED_PREFIX)
+    }
+    templates = elastic.indices.get_template(name=f"{MANAGED_PREFIX}*")
+    return policies, templates
+
+
+def read_index_policies(elastic):
+    return {
+        index_name: index_settings['settings'].get('index.lifecycle.name')
+        for index_name, index_settings in elastic.indices.get_settings(
+            index=f"*{DATED_INDEX_SUFFIX}",
+            name='index.lifecycle.name',
+            flat_settings=True).items()
+    }
+
+
+def build_index_updates(desired_templates, index_policies):
+    # Templates only set the policy of new indices, so existing indices on a
+    # managed policy are moved to the one the highest matching template
+    # names now.
+    ranked_templates = sorted(
+        ((template['order'], template['index_patterns'][0],
+          template['settings']['index']['lifecycle']['name'])
+         for template in desired_templates.values()),
+        reverse=True)
+    index_updates = {}
+    for index_name, policy_name in sorted(index_policies.items()):
+        if not policy_name or not policy_name.startswith(MANAGED_PREFIX):
+            continue
+        desired_policy_name = next(
+            (name for _, pattern, name in ranked_templates
+             if fnmatchcase(index_name, pattern)), policy_name)
+        if desired_policy_name != policy_name:
+            index_updates.setdefault(desired_policy_name,
+                                     []).append(index_name)
+    return index_updates
+
+
+def summarize_phases(phases):
+    # Elasticsearch fills in defaults for actions, so only the ages and the
+    # actions themselves are compared.
+    return {
+        name: (phase.get('min_age'), sorted(phase.get('actions', {})))
+        for name, phase in (phases or {}).items()
+    }
+
+
+def is_policy_current(existing, desired):
+    return existing.get('_meta') == desired['_meta'] and summarize_phases(
+        existing.get('phases')) == summarize_phases(desired['phases'])
+
+
+def is_template_current(existing, desired):
+    return existing.get('index_patterns') == desired['index_patterns'] and \
+        existing.get('order') == desired['order'] and \
+        existing.get('settings') == desired['settings']
+
+
+def diff_managed_state(desired_policies, desired_templates, existing_policies,
+                       existing_templates, index_updates=None):
+    changes = []
+    for name, policy in desired_policies.items():
+        if not is_policy_current(existing_policies.get(name, {}), policy):
+            changes.append(('put_policy', name))
+    for name, template in desired_templates.items():
+        if name not in existing_templates or not is_template_current(
+                existing_templates[name], template):
+            changes.append(('put_template', name))
+    changes.extend(('put_index_policy', name)
+                   for name in sorted(index_updates or {}))
+    # Stale templates are removed before the policies they point to.
+    changes.extend(('delete_template', name)
+                   for name in sorted(existing_templates.keys() -
+                                      desired_templates.keys()))
+    changes.extend(('delete_policy', name)
+                   for name in sorted(existing_policies.keys() -
+                                      desired_policies.keys()))
+    return changes
+
+
+def apply_change(logger, elastic, change, desired_policies, desired_templates,
+                 index_updates=None):
+    from elasticsearch import TransportError
+
+    operation, name = change
+    if operation == 'put_policy':
+        elastic.ilm.put_lifecycle(policy=name,
+                                  body={'policy': desired_policies[name]})
+    elif operation == 'put_template':
+        elastic.indices.put_template(name=name, body=desired_templates[name])
+    elif operation == 'put_index_policy':
+        for index_names in chunk_index_names(index_updates[name]):
+            elastic.indices.put_settings(
+                index=','.join(index_names),
+                body={'index.lifecycle.name': name})
+    elif operation == 'delete_template':
+        elastic.indices.delete_template(name=name)
+    else:
+        try:
+            elastic.ilm.delete_lifecycle(policy=name)
+        except TransportError as e:
+            logger.warning(f"Keeping policy `{name}` in use: {e}")
+            return False
+    return True
+
+
+def reconcile_cluster(logger, elastic, cluster, dry_run=False):
+    # Templates pick one rule per index, which cannot express the maximum
+    # over overlapping rules from several Markets.
+    if isinstance(cluster, MergedCluster):
+        first, *rest = cluster.members
+        if any(member.default_log_retention_days !=
+               first.default_log_retention_days
+               or member.log_retention_days_per_app !=
+               first.log_retention_days_per_app
+               for member in rest):
+            logger.warning("Skipping cluster: Barito Markets disagree on "
+                           "its retention rules")
+            return []
+    unexpressible = [
+        topic_pattern for topic_pattern in cluster.log_retention_days_per_app
+        if not is_expressible(topic_pattern)
+    ]
+    if unexpressible:
+        logger.warning(
+            "Skipping cluster: topic patterns cannot be expressed as index "
+            f"templates: {', '.join(unexpressible)}")
+        return []
+
+    desired_policies, desired_templates = build_desired_state(cluster)
+    index_updates = build_index_updates(desired_templates,
+                                        read_index_policies(elastic))
+    changes = diff_managed_state(desired_policies, desired_templates,
+                                 *read_managed_state(elastic), index_updates)
+    applied = []
+    for change in changes:
+        operation, name = change
+        if dry_run:
+            logger.info(f"DRY-RUN: {operation} `{name}`")
+            continue
+        logger.info(f"Applying {operation} `{name}`")
+        if apply_change(logger, elastic, change, desired_policies,
+                        desired_templates, index_updates):
+            applied.append(change)
+    return applied
+
+
+def reconcile_ilm_in_barito(logger, api_url, client_key, dry_run=False,
+                            profile_cache_path=None, shard=None):
+    with time_phase('', 'fetch'):
+        clusters = fetch_clusters(api_url, client_key, profile_cache_path,
+                                  shard)
+
+    def reconcile(cluster):
+        child_logger = logger.getChild(f"Cluster `{cluster.address}`")
+        try:
+            with time_phase(cluster.address, 'ping'):
+                elastic = connect_to_elasticsearch(cluster.addresses,
+                                                   sniff=cluster.sniff)
+            with time_phase(cluster.address, 'reconcile'):
+                reconcile_cluster(child_logger, elastic, cluster, dry_run)
+        except Exception as e:
+            child_logger.warning(f"Unable to reconcile ILM policies: {e}")
+            count_failure(cluster.address)
+
+    pool = ThreadPool(cpu_count())
+    pool.map(reconcile, clusters)
@@ -1,33 +1,360 @@
-import requests
+import codecs
+import json
+import logging
+import os
+from itertools import chain
+from multiprocessing.pool import ThreadPool
 
+from barito_curator.expiry import INDEX_DATE_FORMATS, get_index_name_parser
+from barito_curator.topics import TopicMatcher
 
-def fetch(api_url, client_key):
-    return requests.get(api_url, params=[('client_key', client_key)]).json()
+FETCH_TIMEOUT = (10, 60)
+FETCH_RETRIES = 3
+FETCH_BACKOFF_FACTOR = 1
+FETCH_CHUNK_SIZE = 64 * 1024
+
+LOGGER = logging.getLogger(__name__)
+
+_session = None
+
+
+def build_session(retries=FETCH_RETRIES, backoff_factor=FETCH_BACKOFF_FACTOR):
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=retries,
+                  backoff_factor=backoff_factor,
+                  status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'Accept': 'application/json',
+        'Accept-Encoding': 'gzip',
+        'Connection': 'keep-alive',
+    })
+    return session
+
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = build_session()
+    return _session
+
+
+def iter_json_array(chunks):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    for chunk in chunks:
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError("Expected a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item
+    raise ValueError("Unexpected end of JSON array")
+
+
+def iter_decoded_chunks(byte_chunks, cache_file=None):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for byte_chunk in byte_chunks:
+        if cache_file is not None:
+            cache_file.write(byte_chunk)
+        yield decoder.decode(byte_chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def read_cached_etag(cache_path):
+    try:
+        with open(f"{cache_path}.etag") as etag_file:
+            return etag_file.read().strip() or None
+    except OSError:
+        return None
+
+
+def read_cached_profile(cache_path):
+    with open(cache_path, 'rb') as cache_file:
+        yield from iter_json_array(
+            iter_decoded_chunks(iter(lambda: cache_file.read(FETCH_CHUNK_SIZE), b'')))
+
+
+def fetch(api_url, client_key, session=None, cache_path=None):
+    session = session or get_session()
+    headers = {}
+    etag = read_cached_etag(cache_path) if cache_path else None
+    if etag and os.path.exists(cache_path):
+        headers['If-None-Match'] = etag
+
+    with session.get(api_url,
+                     params=[('client_key', client_key)],
+                     headers=headers,
+                     timeout=FETCH_TIMEOUT,
+                     stream=True) as response:
+        if response.status_code == 304:
+            yield from read_cached_profile(cache_path)
+            return
+        response.raise_for_status()
+
+        byte_chunks = response.iter_content(FETCH_CHUNK_SIZE)
+        if not cache_path:
+            yield from iter_json_array(iter_decoded_chunks(byte_chunks))
+            return
+
+        with open(f"{cache_path}.tmp", 'wb') as cache_file:
+            yield from iter_json_array(
+                iter_decoded_chunks(byte_chunks, cache_file))
+        os.replace(f"{cache_path}.tmp", cache_path)
+        with open(f"{cache_path}.etag", 'w') as etag_file:
+            etag_file.write(response.headers.get('ETag', ''))
 
 
 def parse_json_structure(json_clusters):
     return [
         Cluster(json_cluster["ipaddress"], json_cluster["log_retention_days"],
-                json_cluster["log_retention_days_per_topic"])
+                json_cluster["log_retention_days_per_topic"],
+                json_cluster.get("disk_watermark"),
+                json_cluster.get("log_priority_per_topic"),
+                json_cluster.get("ipaddresses"),
+                json_cluster.get("sniff", False),
+                json_cluster.get("log_tiers"),
+                json_cluster.get("log_tiers_per_topic"),
+                json_cluster.get("index_date_formats"))
         for json_cluster in json_clusters
     ]
 
 
-def fetch_clusters(api_url, client_key):
-    return parse_json_structure(fetch(api_url, client_key))
+def split_markets(api_url, client_key):
+    api_urls = [url.strip() for url in api_url.split(',') if url.strip()]
+    client_keys = [key.strip() for key in client_key.split(',')]
+    if len(client_keys) == 1:
+        client_keys *= len(api_urls)
+    if not api_urls or len(client_keys) != len(api_urls):
+        raise ValueError(
+            "Expected one Barito Market client key, or one per Market URL")
+    return list(zip(api_urls, client_keys))
+
+
+def fetch_market_clusters(api_url, client_key, cache_path=None):
+    import requests
+
+    try:
+        return parse_json_structure(
+            fetch(api_url, client_key, cache_path=cache_path))
+    except (requests.RequestException, ValueError) as e:
+        if not cache_path or not os.path.exists(cache_path):
+            raise
+        LOGGER.warning(
+            f"Unable to fetch Barito Market profile, using cached profile: {e}")
+        return parse_json_structure(read_cached_profile(cache_path))
+
+
+def merge_cluster_group(clusters):
+    # A cluster listed by several Markets keeps an index for as long as any
+    # of them wants it, so retention, priority and watermark take the most
+    # lenient value and tiers only apply when every Market agrees on them.
+    # Patterns from different Markets can overlap, so retention and priority
+    # are looked up in every Market and the per-topic maps only summarize them.
+    first = clusters[0]
+    log_retention_days_per_app = {
+        topic: max(cluster.get_log_retention_days(topic)
+                   for cluster in clusters)
+        for topic in chain.from_iterable(cluster.log_retention_days_per_app
+                                         for cluster in clusters)
+    }
+    log_priority_per_app = {
+        topic: max(cluster.get_log_priority(topic) for cluster in clusters)
+        for topic in chain.from_iterable(cluster.log_priority_per_app
+                                         for cluster in clusters)
+    }
+    disk_watermarks = [cluster.disk_watermark for cluster in clusters]
+    addresses = dict.fromkeys(
+        chain.from_iterable(cluster.addresses for cluster in clusters))
+    log_tiers, log_tiers_per_app = first.log_tiers, first.log_tiers_per_app
+    if any(cluster.log_tiers != log_tiers
+           or cluster.log_tiers_per_app != log_tiers_per_app
+           for cluster in clusters):
+        LOGGER.warning(f"Ignoring tiers of cluster `{first.address}`: "
+                       "Barito Markets disagree on them")
+        log_tiers, log_tiers_per_app = None, None
+    index_date_formats = None
+    if any(cluster.index_date_formats is not None for cluster in clusters):
+        default_formats = [
+            index_date_format.name for index_date_format in INDEX_DATE_FORMATS
+        ]
+        index_date_formats = list(
+            dict.fromkeys(
+                chain.from_iterable(cluster.index_date_formats
+                                    or default_formats
+                                    for cluster in clusters)))
+    return MergedCluster(
+        clusters,
+        first.address,
+        max(cluster.default_log_retention_days for cluster in clusters),
+        log_retention_days_per_app,
+        disk_watermark=None if None in disk_watermarks else max(disk_watermarks),
+        log_priority_per_app=log_priority_per_app,
+        addresses=list(addresses),
+        sniff=all(cluster.sniff for cluster in clusters),
+        log_tiers=log_tiers,
+        log_tiers_per_app=log_tiers_per_app,
+        index_date_formats=index_date_formats)
+
+
+def merge_clusters(clusters):
+    groups = {}
+    for cluster in clusters:
+        groups.setdefault(cluster.address, []).append(cluster)
+    return [
+        group[0] if len(group) == 1 else merge_cluster_group(group)
+        for group in groups.values()
+    ]
+
+
+def fetch_clusters(api_url, client_key, cache_path=None, shard=None):
+    markets = split_markets(api_url, client_key)
+    if len(markets) == 1:
+        clusters = fetch_market_clusters(*markets[0], cache_path)
+    else:
+
+        def fetch_market(indexed_market):
+            index, (market_api_url, market_client_key) = indexed_market
+            return fetch_market_clusters(
+                market_api_url, market_client_key,
+                f"{cache_path}.{index}" if cache_path else None)
+
+        pool = ThreadPool(len(markets))
+        try:
+            clusters = list(
+                chain.from_iterable(
+                    pool.map(fetch_market, enumerate(markets))))
+        finally:
+            pool.close()
+    clusters = merge_clusters(clusters)
+    if shard is None:
+        return clusters
+    selected = shard.select(clusters)
+    LOGGER.info(f"Shard {shard.index} of {shard.count} handles "
+                f"{len(selected)} of {len(clusters)} clusters")
+    return selected
 
 
 class Cluster:
     def __init__(self, address, default_log_retention_days,
-                 log_retention_days_per_app):
+                 log_retention_days_per_app, disk_watermark=None,
+                 log_priority_per_app=None, addresses=None, sniff=False,
+                 log_tiers=None, log_tiers_per_app=None,
+                 index_date_formats=None):
         self.__address = address
+        self.__addresses = list(addresses or [address])
+        self.__sniff = sniff
         self.__default_log_retention_days = default_log_retention_days
         self.__log_retention_days_per_app = log_retention_days_per_app
+        self.__disk_watermark = disk_watermark
+        self.__log_priority_per_app = log_priority_per_app or {}
+        self.__log_retention_days_matcher = TopicMatcher(
+            log_retention_days_per_app, default_log_retention_days)
+        self.__log_priority_matcher = TopicMatcher(self.__log_priority_per_app,
+                                                   0)
+        self.__log_tiers = list(log_tiers or [])
+        self.__log_tiers_per_app = log_tiers_per_app or {}
+        self.__log_tiers_matcher = TopicMatcher(self.__log_tiers_per_app,
+                                                self.__log_tiers)
+        self.__index_date_formats = None if index_date_formats is None else \
+            tuple(index_date_formats)
+        self.__index_name_parser = get_index_name_parser(
+            self.__index_date_formats)
 
     @property
     def address(self):
         return self.__address
 
+    @property
+    def addresses(self):
+        return list(self.__addresses)
+
+    @property
+    def sniff(self):
+        return self.__sniff
+
+    @property
+    def default_log_retention_days(self):
+        return self.__default_log_retention_days
+
+    @property
+    def log_retention_days_per_app(self):
+        return dict(self.__log_retention_days_per_app)
+
+    @property
+    def disk_watermark(self):
+        return self.__disk_watermark
+
+    @property
+    def log_priority_per_app(self):
+        return dict(self.__log_priority_per_app)
+
+    @property
+    def log_tiers(self):
+        return list(self.__log_tiers)
+
+    @property
+    def log_tiers_per_app(self):
+        return dict(self.__log_tiers_per_app)
+
+    @property
+    def index_date_formats(self):
+        return None if self.__index_date_formats is None else list(
+            self.__index_date_formats)
+
+    @property
+    def index_name_parser(self):
+        return self.__index_name_parser
+
+    @property
+    def has_log_tiers(self):
+        return bool(self.__log_tiers or self.__log_tiers_per_app)
+
+    def get_log_retention_days(self, app_name):
+        return self.__log_retention_days_matcher.match(app_name)
+
+    def get_log_priority(self, app_name):
+        return self.__log_priority_matcher.match(app_name)
+
+    def get_log_tiers(self, app_name):
+        return self.__log_tiers_matcher.match(app_name)
+
+
+class MergedCluster(Cluster):
+    def __init__(self, members, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__members = list(members)
+
+    @property
+    def members(self):
+        return list(self.__members)
+
     def get_log_retention_days(self, app_name):
-        return self.__log_retention_days_per_app.get(
-            app_name, self.__default_log_retention_days)
+        return max(member.get_log_retention_days(app_name)
+                   for member in self.__members)
+
+    def get_log_priority(self, app_name):
+        return max(member.get_log_priority(app_name)
+                   for member in self.__members)
@@ -0,0 +1,96 @@
+import time
+from contextlib import contextmanager
+
+from barito_curator.profiling import trace_span
+
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+                 600)
+
+_metrics = None
+
+
+class Metrics:
+    def __init__(self):
+        from prometheus_client import (CollectorRegistry, Counter, Gauge,
+                                       Histogram)
+
+        self.registry = CollectorRegistry()
+        self.phase_duration = Histogram(
+            'barito_curator_phase_duration_seconds',
+            'Duration of a curation pipeline phase', ['cluster', 'phase'],
+            buckets=PHASE_BUCKETS,
+            registry=self.registry)
+        self.indices_evaluated = Counter(
+            'barito_curator_indices_evaluated',
+            'Indices checked against retention', ['cluster'],
+            registry=self.registry)
+        self.indices_unparseable = Counter(
+            'barito_curator_indices_unparseable',
+            'Indices without date information in their name', ['cluster'],
+            registry=self.registry)
+        self.indices_deleted = Counter('barito_curator_indices_deleted',
+                                       'Indices deleted', ['cluster'],
+                                       registry=self.registry)
+        self.bytes_freed = Counter('barito_curator_freed_bytes',
+                                   'Store size of deleted indices',
+                                   ['cluster'],
+                                   registry=self.registry)
+        self.cluster_failures = Counter(
+            'barito_curator_cluster_failures',
+            'Cluster sweeps that ended with an error', ['cluster'],
+            registry=self.registry)
+        self.last_run = Gauge('barito_curator_last_run_timestamp_seconds',
+                              'Time the last one-shot run finished',
+                              registry=self.registry)
+
+    def write_textfile(self, path):
+        from prometheus_client import write_to_textfile
+
+        self.last_run.set(time.time())
+        write_to_textfile(path, self.registry)
+
+    def start_http_server(self, port):
+        from prometheus_client import start_http_server
+
+        start_http_server(port, registry=self.registry)
+
+
+def enable_metrics():
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+def get_metrics():
+    return _metrics
+
+
+@contextmanager
+def time_phase(cluster_address, phase):
+    with trace_span(phase, cluster_address):
+        if _metrics is None:
+            yield
+            return
+        with _metrics.phase_duration.labels(cluster_address, phase).time():
+            yield
+
+
+def count_evaluated(cluster_address, evaluated, unparseable):
+    if _metrics is None:
+        return
+    _metrics.indices_evaluated.labels(cluster_address).inc(evaluated)
+    _metrics.indices_unparseable.labels(cluster_address).inc(unparseable)
+
+
+def count_deleted(cluster_address, deleted, bytes_freed):
+    if _metrics is None:
+        return
+    _metrics.indices_deleted.labels(cluster_address).inc(deleted)
+    _metrics.bytes_freed.labels(cluster_address).inc(bytes_freed)
+
+
+def count_failure(cluster_address):
+    if _metrics is None:
+        return
+    _metrics.cluster_failures.labels(cluster_address).inc()
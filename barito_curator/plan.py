@@ -0,0 +1,125 @@
+import json
+import threading
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+from barito_curator.deletion import chunk_index_names
+from barito_curator.expiry import ExpiryEvaluator
+from barito_curator.metadata import fetch_clusters
+from barito_curator.metrics import count_failure, time_phase
+from barito_curator.utils import (connect_to_elasticsearch, delete_indices,
+                                  find_existing_indices, list_indices)
+
+
+def build_cluster_plan(logger, elastic, cluster, now=None):
+    evaluator = ExpiryEvaluator(cluster, now)
+    with time_phase(cluster.address, 'list'):
+        index_names = list_indices(elastic)
+    with time_phase(cluster.address, 'filter'):
+        classification = evaluator.classify(index_names)
+    for index_name in sorted(classification.unparseable):
+        logger.warning(
+            f"Unable to check index `{index_name}`: No date information in index name")
+
+    rules = {}
+    for index_name in sorted(classification.expired):
+        topic, index_key = evaluator.split_index_name(index_name)
+        cutoff = evaluator.get_index_cutoff(topic, index_key)
+        rule = rules.get((topic, cutoff))
+        if rule is None:
+            rule = rules[topic, cutoff] = {
+                'topic': topic,
+                'retention_days': evaluator.get_log_retention_days(topic),
+                'cutoff': cutoff,
+                'indices': [],
+            }
+        rule['indices'].append(index_name)
+    return {
+        'address': cluster.address,
+        'addresses': cluster.addresses,
+        'planned_at': evaluator.now.isoformat(),
+        'rules': list(rules.values()),
+    }
+
+
+def write_plan(logger, api_url, client_key, plan_path,
+               profile_cache_path=None, shard=None):
+    with time_phase('', 'fetch'):
+        clusters = fetch_clusters(api_url, client_key, profile_cache_path,
+                                  shard)
+    lock = threading.Lock()
+
+    with open(plan_path, 'w') as plan_file:
+
+        def plan_cluster(cluster):
+            child_logger = logger.getChild(f"Cluster `{cluster.address}`")
+            try:
+                with time_phase(cluster.address, 'ping'):
+                    elastic = connect_to_elasticsearch(
+                        cluster.addresses, sniff=cluster.sniff)
+                cluster_plan = build_cluster_plan(child_logger, elastic,
+                                                  cluster)
+            except Exception as e:
+                child_logger.warning(f"Unable to plan expired indices: {e}")
+                count_failure(cluster.address)
+                return
+            line = json.dumps(cluster_plan, separators=(',', ':'))
+            with lock:
+                plan_file.write(f"{line}\n")
+
+        pool = ThreadPool(cpu_count())
+        pool.map(plan_cluster, clusters)
+
+
+def read_plan(plan_path):
+    with open(plan_path) as plan_file:
+        for line in plan_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_planned_indices(cluster_plan):
+    for rule in cluster_plan['rules']:
+        yield from rule['indices']
+
+
+def apply_cluster_plan(logger, elastic, cluster_plan, delete_timeout,
+                       dry_run=False, state=None):
+    address = cluster_plan['address']
+    planned_index_names = list(iter_planned_indices(cluster_plan))
+    with time_phase(address, 'list'):
+        existing_index_names = set()
+        for chunk in chunk_index_names(planned_index_names):
+            existing_index_names.update(find_existing_indices(elastic, chunk))
+    index_names = [
+        index_name for index_name in planned_index_names
+        if index_name in existing_index_names
+    ]
+    if len(index_names) < len(planned_index_names):
+        logger.info(f"Skipping {len(planned_index_names) - len(index_names)} "
+                    "planned indices that no longer exist")
+
+    with time_phase(address, 'delete'):
+        deleted_index_names = delete_indices(logger, elastic, index_names,
+                                             delete_timeout, dry_run)
+    if state is not None:
+        state.record_deleted(address, deleted_index_names)
+    return deleted_index_names
+
+
+def apply_plan(logger, plan_path, delete_timeout, dry_run=False, state=None):
+    def apply_cluster(cluster_plan):
+        address = cluster_plan['address']
+        child_logger = logger.getChild(f"Cluster `{address}`")
+        try:
+            with time_phase(address, 'ping'):
+                elastic = connect_to_elasticsearch(
+                    cluster_plan.get('addresses', [address]))
+            apply_cluster_plan(child_logger, elastic, cluster_plan,
+                               delete_timeout, dry_run, state)
+        except Exception as e:
+            child_logger.warning(f"Unable to apply plan: {e}")
+            count_failure(address)
+
+    pool = ThreadPool(cpu_count())
+    pool.map(apply_cluster, read_plan(plan_path))
@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Phases spending their time in the curator itself rather than waiting on
+# Elasticsearch, captured with cProfile when asked for.
+HOT_PHASES = frozenset(['filter'])
+MAX_TRACE_EVENTS = 1000000
+SUMMARY_SIZE = 5
+
+_profiler = None
+
+
+class Profiler:
+    def __init__(self, cprofile=False):
+        self.__cprofile = cprofile
+        self.__started = time.perf_counter()
+        self.__lock = threading.Lock()
+        self.__spans = []
+        self.__dropped = 0
+        self.__lanes = {}
+        self.__stats = None
+
+    def get_lane(self, cluster_address):
+        # One trace row per cluster, so spans of concurrent clusters, even
+        # on one event loop thread, nest inside their own row only.
+        with self.__lock:
+            return self.__lanes.setdefault(cluster_address, len(self.__lanes))
+
+    def record(self, name, category, cluster_address, started, duration):
+        lane = self.get_lane(cluster_address)
+        with self.__lock:
+            if len(self.__spans) >= MAX_TRACE_EVENTS:
+                self.__dropped += 1
+                return
+            self.__spans.append((name, category, cluster_address, lane,
+                                 started - self.__started, duration))
+
+    def start_cprofile(self, name):
+        if not self.__cprofile or name not in HOT_PHASES:
+            return None
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active on this thread.
+            return None
+        return profile
+
+    def stop_cprofile(self, profile):
+        import pstats
+
+        profile.disable()
+        with self.__lock:
+            if self.__stats is None:
+                self.__stats = pstats.Stats(profile)
+            else:
+                self.__stats.add(profile)
+
+    def build_trace_events(self):
+        with self.__lock:
+            spans = list(self.__spans)
+            lanes = dict(self.__lanes)
+        pid = os.getpid()
+        events = [{
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': pid,
+            'tid': lane,
+            'args': {
+                'name': cluster_address or 'Barito Market'
+            }
+        } for cluster_address, lane in lanes.items()]
+        events.extend({
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round(started * 1e6),
+            'dur': round(duration * 1e6),
+            'pid': pid,
+            'tid': lane,
+            'args': {
+                'cluster': cluster_address
+            }
+        } for name, category, cluster_address, lane, started, duration in
+                      spans)
+        return events
+
+    def write(self, path):
+        with open(path, 'w') as trace_file:
+            json.dump(
+                {
+                    'traceEvents': self.build_trace_events(),
+                    'displayTimeUnit': 'ms'
+                }, trace_file)
+        if self.__stats is not None:
+            self.__stats.dump_stats(f"{path}.prof")
+
+    def summarize(self, size=SUMMARY_SIZE):
+        with self.__lock:
+            spans = sorted(self.__spans, key=lambda span: span[4])
+        cluster_durations = {}
+        phase_durations = {}
+        span_ends = {}
+        for name, category, cluster_address, _, started, duration in spans:
+            if category == 'phase':
+                phase_durations[name] = phase_durations.get(name, 0) + duration
+            # Only outermost spans count, nested ones are already included.
+            span_end = span_ends.get(cluster_address)
+            if span_end is not None and started < span_end:
+                continue
+            span_ends[cluster_address] = started + duration
+            if cluster_address:
+                cluster_durations[cluster_address] = cluster_durations.get(
+                    cluster_address, 0) + duration
+
+        def slowest(durations):
+            return sorted(durations.items(), key=lambda item: -item[1])[:size]
+
+        return slowest(cluster_durations), slowest(phase_durations)
+
+    def log_summary(self, logger):
+        slowest_clusters, slowest_phases = self.summarize()
+        logger.info("Slowest clusters: " + ', '.join(
+            f"{address} {duration:.2f}s"
+            for address, duration in slowest_clusters))
+        logger.info("Slowest phases: " + ', '.join(
+            f"{phase} {duration:.2f}s" for phase, duration in slowest_phases))
+        if self.__dropped:
+            logger.warning(
+                f"Dropped {self.__dropped} spans past {MAX_TRACE_EVENTS}")
+
+
+def enable_profiling(cprofile=False):
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(cprofile)
+    return _profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+@contextmanager
+def trace_span(name, cluster_address='', category='phase'):
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    profile = profiler.start_cprofile(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        if profile is not None:
+            profiler.stop_cprofile(profile)
+        profiler.record(name, category, cluster_address, started, duration)
@@ -0,0 +1,158 @@
+import asyncio
+import math
+import random
+import threading
+import time
+
+DEFAULT_CLUSTER_TIMEOUT = 1800
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF_FACTOR = 1.0
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN = 3600
+RETRYABLE_STATUS_CODES = frozenset([429, 502, 503, 504])
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def is_retryable(error):
+    from elasticsearch import ConnectionError as ElasticConnectionError
+    from elasticsearch import TransportError
+
+    # Connection errors and timeouts never reached the cluster or were cut
+    # short; the requests retried here are reads or idempotent deletes.
+    if isinstance(error, (ElasticConnectionError, ConnectionError)):
+        return True
+    if isinstance(error, TransportError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+class ClusterGuard:
+    def __init__(self, timeout=None, max_attempts=1,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR):
+        self.__expires_at = math.inf if timeout is None else \
+            time.monotonic() + timeout
+        self.__max_attempts = max_attempts
+        self.__backoff_factor = backoff_factor
+
+    def remaining(self):
+        return max(0.0, self.__expires_at - time.monotonic())
+
+    def request_timeout(self):
+        remaining = self.remaining()
+        return None if remaining == math.inf else remaining
+
+    def build_delete_params(self, delete_timeout):
+        request_timeout = self.request_timeout()
+        if request_timeout is None:
+            return {'master_timeout': f"{delete_timeout}s"}
+        master_timeout = max(1, min(delete_timeout, int(request_timeout)))
+        return {
+            'master_timeout': f"{master_timeout}s",
+            'request_timeout': request_timeout
+        }
+
+    def check(self, phase):
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"Cluster deadline exceeded before {phase}")
+
+    def get_backoff(self, attempt):
+        delay = self.__backoff_factor * 2**(attempt - 1)
+        return random.uniform(delay / 2, delay)
+
+    def should_retry(self, error, attempt, delay):
+        return attempt < self.__max_attempts and is_retryable(error) and \
+            delay < self.remaining()
+
+    def call(self, phase, func, *args, **kwargs):
+        attempt = 1
+        while True:
+            self.check(phase)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                delay = self.get_backoff(attempt)
+                if not self.should_retry(e, attempt, delay):
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, phase, func, *args, **kwargs):
+        attempt = 1
+        while True:
+            self.check(phase)
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                delay = self.get_backoff(attempt)
+                if not self.should_retry(e, attempt, delay):
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class CircuitBreaker:
+    def __init__(self, state=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown=DEFAULT_COOLDOWN):
+        self.__state = state
+        self.__failure_threshold = failure_threshold
+        self.__cooldown = cooldown
+        self.__failures = {}
+        self.__lock = threading.Lock()
+
+    def get_failures(self, address):
+        if self.__state is not None:
+            return self.__state.get_cluster_failures(address)
+        with self.__lock:
+            return self.__failures.get(address)
+
+    def is_open(self, address, now=None):
+        failures = self.get_failures(address)
+        if failures is None:
+            return False
+        failure_count, failed_at = failures
+        return failure_count >= self.__failure_threshold and \
+            (now or time.time()) < failed_at + self.__cooldown
+
+    def record_success(self, address):
+        if self.__state is not None:
+            self.__state.clear_cluster_failures(address)
+            return
+        with self.__lock:
+            self.__failures.pop(address, None)
+
+    def record_failure(self, address, now=None):
+        now = now or time.time()
+        if self.__state is not None:
+            self.__state.record_cluster_failure(address, now)
+            return
+        with self.__lock:
+            failure_count, _ = self.__failures.get(address, (0, now))
+            self.__failures[address] = failure_count + 1, now
+
+
+class ResiliencePolicy:
+    def __init__(self, cluster_timeout=DEFAULT_CLUSTER_TIMEOUT,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR, breaker=None):
+        self.__cluster_timeout = cluster_timeout
+        self.__max_attempts = max_attempts
+        self.__backoff_factor = backoff_factor
+        self.__breaker = breaker
+
+    def new_guard(self, spent=0):
+        return ClusterGuard(self.__cluster_timeout - spent,
+                            self.__max_attempts, self.__backoff_factor)
+
+    def allows(self, address):
+        return self.__breaker is None or not self.__breaker.is_open(address)
+
+    def record_success(self, address):
+        if self.__breaker is not None:
+            self.__breaker.record_success(address)
+
+    def record_failure(self, address):
+        if self.__breaker is not None:
+            self.__breaker.record_failure(address)
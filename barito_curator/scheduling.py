@@ -0,0 +1,36 @@
+from collections import namedtuple
+
+# Elasticsearch's own default high disk watermark, used for clusters that do
+# not configure one.
+DEFAULT_DISK_WATERMARK = 90
+
+# Only the figures needed to order the sweeps are kept, so sampling a large
+# fleet holds neither index listings nor open clients.
+ClusterSample = namedtuple('ClusterSample', [
+    'cluster', 'status', 'disk_used', 'disk_total', 'overdue_count',
+    'sample_time'
+])
+
+
+def get_disk_headroom(sample):
+    disk_watermark = sample.cluster.disk_watermark
+    if disk_watermark is None:
+        disk_watermark = DEFAULT_DISK_WATERMARK
+    if not sample.disk_total:
+        return disk_watermark / 100
+    return disk_watermark / 100 - sample.disk_used / sample.disk_total
+
+
+def get_urgency_key(sample):
+    return get_disk_headroom(sample), -sample.overdue_count
+
+
+def schedule_samples(logger, samples):
+    scheduled = []
+    for sample in samples:
+        if sample.status == 'red':
+            logger.getChild(f"Cluster `{sample.cluster.address}`").warning(
+                "Skipping cluster: health is red")
+        else:
+            scheduled.append(sample)
+    return sorted(scheduled, key=get_urgency_key)
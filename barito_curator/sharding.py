@@ -0,0 +1,37 @@
+import hashlib
+
+
+def get_shard_score(address, shard_index):
+    digest = hashlib.sha1(f"{shard_index}/{address}".encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def get_shard_index(address, shard_count):
+    # Rendezvous hashing: going from n to n + 1 shards only moves the clusters
+    # the new shard wins, about 1 / (n + 1) of them, and none between the
+    # existing shards.
+    return max(range(shard_count),
+               key=lambda shard_index: get_shard_score(address, shard_index))
+
+
+class Shard:
+    def __init__(self, index=0, count=1):
+        if not 0 <= index < count:
+            raise ValueError(
+                f"Shard index {index} is outside of 0 to {count - 1}")
+        self.__index = index
+        self.__count = count
+
+    @property
+    def index(self):
+        return self.__index
+
+    @property
+    def count(self):
+        return self.__count
+
+    def owns(self, address):
+        return get_shard_index(address, self.__count) == self.__index
+
+    def select(self, clusters):
+        return [cluster for cluster in clusters if self.owns(cluster.address)]
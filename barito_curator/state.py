@@ -0,0 +1,182 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from barito_curator.expiry import ExpiryEvaluator, IndexClassification
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clusters (
+    address TEXT PRIMARY KEY,
+    retention_fingerprint TEXT NOT NULL,
+    evaluated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS indices (
+    address TEXT NOT NULL,
+    index_name TEXT NOT NULL,
+    expiry_date TEXT,
+    PRIMARY KEY (address, index_name)
+);
+CREATE TABLE IF NOT EXISTS deletions (
+    address TEXT NOT NULL,
+    index_name TEXT NOT NULL,
+    deleted_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cluster_failures (
+    address TEXT PRIMARY KEY,
+    failure_count INTEGER NOT NULL,
+    failed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tier_actions (
+    address TEXT NOT NULL,
+    index_name TEXT NOT NULL,
+    action TEXT NOT NULL,
+    applied_at TEXT NOT NULL,
+    PRIMARY KEY (address, index_name, action)
+);
+"""
+
+
+def build_retention_fingerprint(cluster):
+    settings = [
+        cluster.default_log_retention_days, cluster.log_retention_days_per_app
+    ]
+    # Left out when unset, so states written before formats were
+    # configurable stay valid.
+    if cluster.index_date_formats is not None:
+        settings.append(cluster.index_date_formats)
+    settings = json.dumps(settings, sort_keys=True)
+    return hashlib.sha1(settings.encode()).hexdigest()
+
+
+class StateStore:
+    def __init__(self, path):
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__lock = threading.Lock()
+        with self.__lock, self.__connection:
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+            self.__connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def get_known_indices(self, cluster):
+        fingerprint = build_retention_fingerprint(cluster)
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT retention_fingerprint FROM clusters WHERE address = ?',
+                (cluster.address, )).fetchone()
+            if row is None or row[0] != fingerprint:
+                return {}
+            return dict(
+                self.__connection.execute(
+                    'SELECT index_name, expiry_date FROM indices '
+                    'WHERE address = ?', (cluster.address, )))
+
+    def save_indices(self, cluster, now, known_indices, index_names,
+                     new_expiry_dates):
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                'INSERT OR REPLACE INTO clusters VALUES (?, ?, ?)',
+                (cluster.address, build_retention_fingerprint(cluster),
+                 now.isoformat()))
+            if not known_indices:
+                self.__connection.execute(
+                    'DELETE FROM indices WHERE address = ?',
+                    (cluster.address, ))
+            else:
+                self.__connection.executemany(
+                    'DELETE FROM indices WHERE address = ? AND index_name = ?',
+                    ((cluster.address, index_name)
+                     for index_name in known_indices.keys() - index_names))
+            self.__connection.executemany(
+                'INSERT OR REPLACE INTO indices VALUES (?, ?, ?)',
+                ((cluster.address, index_name, expiry_date)
+                 for index_name, expiry_date in new_expiry_dates.items()))
+
+    def classify(self, cluster, index_names, now=None):
+        evaluator = ExpiryEvaluator(cluster, now)
+        known_indices = self.get_known_indices(cluster)
+        index_names = set(index_names)
+
+        # Names without an expiry date are parsed again on every run, so ones
+        # a newer parser understands are not left unparseable forever.
+        known_expiry_dates = {
+            index_name: known_indices[index_name]
+            for index_name in index_names & known_indices.keys()
+            if known_indices[index_name] is not None
+        }
+        classification = evaluator.classify(index_names -
+                                            known_expiry_dates.keys())
+        expired = set(classification.expired)
+        kept = set(classification.kept)
+        for index_name, expiry_date in known_expiry_dates.items():
+            if evaluator.is_expiry_due(expiry_date):
+                expired.add(index_name)
+            else:
+                kept.add(index_name)
+
+        new_expiry_dates = {
+            index_name: evaluator.get_expiry_date(index_name)
+            for index_name in classification.expired | classification.kept
+        }
+        new_unparseable = classification.unparseable - known_indices.keys()
+        new_expiry_dates.update(
+            (index_name, None) for index_name in new_unparseable)
+        self.save_indices(cluster, evaluator.now, known_indices, index_names,
+                          new_expiry_dates)
+        return IndexClassification(expired, kept, new_unparseable)
+
+    def record_deleted(self, address, index_names, now=None):
+        deleted_at = (now or datetime.today()).isoformat()
+        with self.__lock, self.__connection:
+            self.__connection.executemany(
+                'DELETE FROM indices WHERE address = ? AND index_name = ?',
+                ((address, index_name) for index_name in index_names))
+            self.__connection.executemany(
+                'DELETE FROM tier_actions WHERE address = ? AND index_name = ?',
+                ((address, index_name) for index_name in index_names))
+            self.__connection.executemany(
+                'INSERT INTO deletions VALUES (?, ?, ?)',
+                ((address, index_name, deleted_at)
+                 for index_name in index_names))
+
+    def get_cluster_failures(self, address):
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT failure_count, failed_at FROM cluster_failures '
+                'WHERE address = ?', (address, )).fetchone()
+        return None if row is None else tuple(row)
+
+    def record_cluster_failure(self, address, failed_at):
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                'INSERT INTO cluster_failures VALUES (?, 1, ?) '
+                'ON CONFLICT (address) DO UPDATE SET '
+                'failure_count = failure_count + 1, failed_at = excluded.failed_at',
+                (address, failed_at))
+
+    def clear_cluster_failures(self, address):
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                'DELETE FROM cluster_failures WHERE address = ?', (address, ))
+
+    def get_tier_actions(self, address):
+        with self.__lock:
+            rows = self.__connection.execute(
+                'SELECT index_name, action FROM tier_actions WHERE address = ?',
+                (address, )).fetchall()
+        tier_actions = {}
+        for index_name, action in rows:
+            tier_actions.setdefault(index_name, set()).add(action)
+        return tier_actions
+
+    def record_tier_actions(self, address, action, index_names, now=None):
+        applied_at = (now or datetime.today()).isoformat()
+        with self.__lock, self.__connection:
+            self.__connection.executemany(
+                'INSERT OR REPLACE INTO tier_actions VALUES (?, ?, ?, ?)',
+                ((address, index_name, action, applied_at)
+                 for index_name in index_names))
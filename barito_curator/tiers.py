@@ -0,0 +1,270 @@
+import asyncio
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+from barito_curator.deletion import chunk_index_names
+from barito_curator.expiry import (build_cutoff, build_hour_cutoff, is_hourly,
+                                   split_index_name)
+from barito_curator.resilience import ClusterGuard, DeadlineExceeded
+
+FORCEMERGE = 'forcemerge'
+READ_ONLY = 'read_only'
+CLOSE = 'close'
+TIER_ACTIONS = (FORCEMERGE, READ_ONLY, CLOSE)
+DEFAULT_TIER_CONCURRENCY = 2
+TIER_SETTINGS = 'index.blocks.write,index.number_of_shards'
+
+
+def select_tier_actions(cluster, index_names, done_actions=None, now=None):
+    now = now or datetime.today()
+    done_actions = done_actions or {}
+    cutoffs = {}
+    selected = {action: [] for action in TIER_ACTIONS}
+    for index_name in sorted(index_names):
+        parsed = split_index_name(index_name, cluster.index_name_parser)
+        if parsed is None:
+            continue
+        topic, index_key = parsed
+        due_actions = set()
+        for tier in cluster.get_log_tiers(topic):
+            action, after_days = tier.get('action'), tier.get('after_days')
+            if action not in selected or after_days is None:
+                continue
+            cutoff_key = after_days, is_hourly(index_key)
+            if cutoff_key not in cutoffs:
+                cutoffs[cutoff_key] = (build_hour_cutoff
+                                       if cutoff_key[1] else build_cutoff)(
+                                           now, after_days)
+            if index_key < cutoffs[cutoff_key]:
+                due_actions.add(action)
+        # A closed index can be neither merged nor blocked, so closing
+        # supersedes the earlier tiers.
+        if CLOSE in due_actions:
+            due_actions = {CLOSE}
+        for action in due_actions - done_actions.get(index_name, set()):
+            selected[action].append(index_name)
+    return {action: names for action, names in selected.items() if names}
+
+
+def get_tier_index_names(tier_actions):
+    return sorted({
+        index_name
+        for index_names in tier_actions.values() for index_name in index_names
+    })
+
+
+# Without a state file, earlier runs' work is read back from the cluster: a
+# closed index needs nothing more, a write block means read_only is done and
+# at most one segment per primary shard means the force merge is.
+def parse_done_tier_actions(statuses, settings, stats):
+    done_actions = {
+        row['index']: set(TIER_ACTIONS)
+        for row in statuses if row['status'] == 'close'
+    }
+    segment_counts = {
+        index_name: index_stats['primaries']['segments']['count']
+        for index_name, index_stats in stats.get('indices', {}).items()
+    }
+    for index_name, index_settings in settings.items():
+        index_settings = index_settings['settings']
+        done = done_actions.setdefault(index_name, set())
+        if index_settings.get('index.blocks.write') == 'true':
+            done.add(READ_ONLY)
+        if index_name in segment_counts and segment_counts[index_name] <= int(
+                index_settings['index.number_of_shards']):
+            done.add(FORCEMERGE)
+    return done_actions
+
+
+def get_open_index(statuses):
+    return ','.join(row['index'] for row in statuses if row['status'] == 'open')
+
+
+def read_tier_status(elastic, index_names, params):
+    statuses = elastic.cat.indices(index=','.join(index_names),
+                                   h='index,status',
+                                   format='json',
+                                   **params)
+    open_index = get_open_index(statuses)
+    if not open_index:
+        return parse_done_tier_actions(statuses, {}, {})
+    settings = elastic.indices.get_settings(index=open_index,
+                                            name=TIER_SETTINGS,
+                                            flat_settings=True,
+                                            **params)
+    stats = elastic.indices.stats(index=open_index, metric='segments',
+                                  **params)
+    return parse_done_tier_actions(statuses, settings, stats)
+
+
+async def read_tier_status_async(elastic, index_names, params):
+    statuses = await elastic.cat.indices(index=','.join(index_names),
+                                         h='index,status',
+                                         format='json',
+                                         **params)
+    open_index = get_open_index(statuses)
+    if not open_index:
+        return parse_done_tier_actions(statuses, {}, {})
+    settings = await elastic.indices.get_settings(index=open_index,
+                                                  name=TIER_SETTINGS,
+                                                  flat_settings=True,
+                                                  **params)
+    stats = await elastic.indices.stats(index=open_index, metric='segments',
+                                        **params)
+    return parse_done_tier_actions(statuses, settings, stats)
+
+
+def read_done_tier_actions(elastic, tier_actions, guard):
+    done_actions = {}
+    for index_names in chunk_index_names(get_tier_index_names(tier_actions)):
+        done_actions.update(
+            guard.call('tier', read_tier_status, elastic, index_names,
+                       build_tier_params(guard)))
+    return done_actions
+
+
+async def read_done_tier_actions_async(elastic, tier_actions, guard):
+    done_actions = {}
+    for index_names in chunk_index_names(get_tier_index_names(tier_actions)):
+        done_actions.update(await guard.call_async(
+            'tier', read_tier_status_async, elastic, index_names,
+            build_tier_params(guard)))
+    return done_actions
+
+
+def build_tier_requests(tier_actions):
+    # Force merges are heavy and run one index at a time; settings updates
+    # and closes are cheap and batched like deletions.
+    requests = [(FORCEMERGE, [index_name])
+                for index_name in tier_actions.get(FORCEMERGE, [])]
+    for action in (READ_ONLY, CLOSE):
+        requests.extend((action, chunk)
+                        for chunk in chunk_index_names(
+                            tier_actions.get(action, [])))
+    return requests
+
+
+def build_tier_params(guard):
+    request_timeout = guard.request_timeout()
+    return {} if request_timeout is None else {
+        'request_timeout': request_timeout
+    }
+
+
+def run_tier_request(elastic, action, index_names, guard):
+    index = ','.join(index_names)
+    params = build_tier_params(guard)
+    if action == FORCEMERGE:
+        return elastic.indices.forcemerge(index=index,
+                                          max_num_segments=1,
+                                          **params)
+    if action == READ_ONLY:
+        return elastic.indices.put_settings(
+            index=index, body={'index.blocks.write': True}, **params)
+    return elastic.indices.close(index=index, **params)
+
+
+def log_dry_run(logger, tier_actions):
+    for action, index_names in tier_actions.items():
+        for index_name in index_names:
+            logger.info(f"DRY-RUN: {action} index `{index_name}`")
+
+
+def record_applied(cluster, results, state=None):
+    applied = {}
+    for action, index_names in results:
+        if index_names:
+            applied.setdefault(action, []).extend(index_names)
+    if state is not None:
+        for action, index_names in applied.items():
+            state.record_tier_actions(cluster.address, action, index_names)
+    return applied
+
+
+def apply_tier_actions(logger, elastic, cluster, index_names, dry_run=False,
+                       state=None, guard=None,
+                       concurrency=DEFAULT_TIER_CONCURRENCY, now=None):
+    from elasticsearch import TransportError
+
+    guard = guard or ClusterGuard()
+    done_actions = state.get_tier_actions(cluster.address) \
+        if state is not None else None
+    tier_actions = select_tier_actions(cluster, index_names, done_actions, now)
+    if state is None and tier_actions:
+        try:
+            done_actions = read_done_tier_actions(elastic, tier_actions, guard)
+        except (TransportError, DeadlineExceeded) as e:
+            logger.warning(f"Unable to read tier status: {e}")
+            return {}
+        tier_actions = select_tier_actions(cluster,
+                                           get_tier_index_names(tier_actions),
+                                           done_actions, now)
+    if dry_run:
+        log_dry_run(logger, tier_actions)
+        return {}
+
+    def run(request):
+        action, names = request
+        if guard.remaining() <= 0:
+            return action, []
+        logger.info(f"Applying {action} to {len(names)} indices: "
+                    f"{', '.join(names)}")
+        try:
+            run_tier_request(elastic, action, names, guard)
+        except TransportError as e:
+            logger.warning(f"Unable to {action} {len(names)} indices: {e}")
+            return action, []
+        return action, names
+
+    requests = build_tier_requests(tier_actions)
+    if not requests:
+        return {}
+    with ThreadPool(min(concurrency, len(requests))) as pool:
+        results = pool.map(run, requests, chunksize=1)
+    return record_applied(cluster, results, state)
+
+
+async def apply_tier_actions_async(logger, elastic, cluster, index_names,
+                                   dry_run=False, state=None, guard=None,
+                                   concurrency=DEFAULT_TIER_CONCURRENCY,
+                                   now=None):
+    from elasticsearch import TransportError
+
+    guard = guard or ClusterGuard()
+    done_actions = state.get_tier_actions(cluster.address) \
+        if state is not None else None
+    tier_actions = select_tier_actions(cluster, index_names, done_actions, now)
+    if state is None and tier_actions:
+        try:
+            done_actions = await read_done_tier_actions_async(
+                elastic, tier_actions, guard)
+        except (TransportError, DeadlineExceeded) as e:
+            logger.warning(f"Unable to read tier status: {e}")
+            return {}
+        tier_actions = select_tier_actions(cluster,
+                                           get_tier_index_names(tier_actions),
+                                           done_actions, now)
+    if dry_run:
+        log_dry_run(logger, tier_actions)
+        return {}
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(request):
+        action, names = request
+        async with semaphore:
+            if guard.remaining() <= 0:
+                return action, []
+            logger.info(f"Applying {action} to {len(names)} indices: "
+                        f"{', '.join(names)}")
+            try:
+                await run_tier_request(elastic, action, names, guard)
+            except TransportError as e:
+                logger.warning(
+                    f"Unable to {action} {len(names)} indices: {e}")
+                return action, []
+            return action, names
+
+    results = await asyncio.gather(
+        *(run(request) for request in build_tier_requests(tier_actions)))
+    return record_applied(cluster, results, state)
@@ -0,0 +1,110 @@
+import re
+
+WILDCARD_CHARACTERS = frozenset('*?[')
+
+
+def is_glob(pattern):
+    return not WILDCARD_CHARACTERS.isdisjoint(pattern)
+
+
+def translate_glob(pattern):
+    parts = []
+    position = 0
+    while position < len(pattern):
+        character = pattern[position]
+        position += 1
+        if character == '*':
+            parts.append('.*')
+        elif character == '?':
+            parts.append('.')
+        elif character == '[':
+            end = pattern.find(']', position + 1)
+            if end < 0:
+                parts.append(re.escape(character))
+                continue
+            characters = pattern[position:end].replace('\\', '\\\\')
+            if characters.startswith('!'):
+                characters = '^' + characters[1:]
+            parts.append(f"[{characters}]")
+            position = end + 1
+        else:
+            parts.append(re.escape(character))
+    return ''.join(parts)
+
+
+def count_literal_characters(pattern):
+    return len(re.sub(r'\[[^]]*\]|[*?]', '', pattern))
+
+
+# Exact topic names win over patterns. Between patterns, the one with the most
+# literal characters wins and ties go to the rule listed first.
+class TopicMatcher:
+    def __init__(self, rules, default=None):
+        self.__default = default
+        self.__exact = {}
+        self.__trie = {}
+        self.__cache = {}
+
+        globs = []
+        for order, (pattern, value) in enumerate(rules.items()):
+            if not is_glob(pattern):
+                self.__exact[pattern] = value
+            elif pattern.endswith('*') and not is_glob(pattern[:-1]):
+                self.__insert_prefix(pattern[:-1], order, value)
+            else:
+                globs.append(
+                    (-count_literal_characters(pattern), order, pattern, value))
+        globs.sort()
+        self.__glob_candidates = [(-specificity, order, value)
+                                  for specificity, order, _, value in globs]
+        self.__glob_regex = None
+        if globs:
+            self.__glob_regex = re.compile('|'.join(
+                f"(?P<g{index}>{translate_glob(pattern)})"
+                for index, (_, _, pattern, _) in enumerate(globs)))
+
+    def __insert_prefix(self, prefix, order, value):
+        node = self.__trie
+        for character in prefix:
+            node = node.setdefault(character, {})
+        # Keys of a trie node are single characters, so '' cannot clash.
+        node.setdefault('', (len(prefix), -order, value))
+
+    def __match_prefix(self, topic):
+        node = self.__trie
+        best = node.get('')
+        for character in topic:
+            node = node.get(character)
+            if node is None:
+                break
+            best = node.get('', best)
+        return best
+
+    def __match_glob(self, topic):
+        if self.__glob_regex is None:
+            return None
+        match = self.__glob_regex.fullmatch(topic)
+        if match is None:
+            return None
+        specificity, order, value = \
+            self.__glob_candidates[int(match.lastgroup[1:])]
+        return specificity, -order, value
+
+    def __lookup(self, topic):
+        if topic in self.__exact:
+            return self.__exact[topic]
+        candidates = [
+            candidate for candidate in (self.__match_prefix(topic),
+                                        self.__match_glob(topic))
+            if candidate is not None
+        ]
+        if not candidates:
+            return self.__default
+        return max(candidates, key=lambda candidate: candidate[:2])[2]
+
+    def match(self, topic):
+        try:
+            return self.__cache[topic]
+        except KeyError:
+            value = self.__cache[topic] = self.__lookup(topic)
+            return value
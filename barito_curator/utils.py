@@ -1,11 +1,23 @@
+import time
 from datetime import datetime, timedelta
 from multiprocessing import cpu_count
 from multiprocessing.pool import ThreadPool
 
-from curator import DeleteIndices, IndexList
-from elasticsearch import Elasticsearch
-
+from barito_curator.budget import (read_disk_allocation,
+                                   select_over_budget_indices)
+from barito_curator.deletion import BatchedDeletion
+from barito_curator.expiry import classify_indices
 from barito_curator.metadata import fetch_clusters
+from barito_curator.metrics import (count_deleted, count_evaluated,
+                                    count_failure, time_phase)
+from barito_curator.profiling import trace_span
+from barito_curator.resilience import (ClusterGuard, DeadlineExceeded,
+                                       ResiliencePolicy)
+from barito_curator.scheduling import ClusterSample, schedule_samples
+from barito_curator.tiers import apply_tier_actions
+
+CLIENT_TIMEOUT = 300
+SNIFF_INTERVAL = 60
 
 
 def is_index_expired(index_name, cluster):
@@ -33,43 +45,297 @@ def filter_expired_indices(logger, index_list, cluster):
             index_list._IndexList__not_actionable(index_name)
 
 
-def connect_to_elasticsearch(address):
-    elastic = Elasticsearch(address, timeout=300)
+def filter_expired_index_names(logger, index_names, cluster, state=None):
+    if state is None:
+        classification = classify_indices(cluster, index_names)
+    else:
+        classification = state.classify(cluster, index_names)
+    for index_name in sorted(classification.unparseable):
+        logger.warning(
+            f"Unable to check index `{index_name}`: No date information in index name")
+    count_evaluated(cluster.address, len(index_names),
+                    len(classification.unparseable))
+    return sorted(classification.expired)
+
+
+def filter_over_budget_index_names(logger, index_sizes, cluster, disk_used,
+                                   disk_total, expired_index_names):
+    over_budget_index_names = select_over_budget_indices(
+        cluster, index_sizes, disk_used, disk_total, set(expired_index_names))
+    if over_budget_index_names:
+        logger.info(f"Selected {len(over_budget_index_names)} indices to bring "
+                    f"disk usage under {cluster.disk_watermark}%")
+    return over_budget_index_names
+
+
+def build_client_options(addresses, timeout, sniff):
+    options = {
+        'timeout': timeout,
+        # The transport only fails over to the other nodes, retries with
+        # backoff are done by ClusterGuard.
+        'max_retries': len(addresses) - 1,
+        'http_compress': True,
+    }
+    if sniff:
+        options.update(sniff_on_start=True,
+                       sniff_on_connection_fail=True,
+                       sniffer_timeout=SNIFF_INTERVAL)
+    return options
+
+
+def connect_to_elasticsearch(addresses, timeout=CLIENT_TIMEOUT, sniff=False):
+    from elasticsearch import Elasticsearch
+
+    if isinstance(addresses, str):
+        addresses = [addresses]
+    elastic = Elasticsearch(addresses,
+                            **build_client_options(addresses, timeout, sniff))
     if not elastic.ping():
-        raise ConnectionError(f"Unable to ping ElasticSearch: {address}")
+        raise ConnectionError(
+            f"Unable to ping ElasticSearch: {', '.join(addresses)}")
     return elastic
 
 
 def build_delete_action_for_expired_indices(logger, cluster, delete_timeout):
+    from curator import DeleteIndices, IndexList
+
     elastic = connect_to_elasticsearch(cluster.address)
     index_list = IndexList(elastic)
     filter_expired_indices(logger, index_list, cluster)
     return DeleteIndices(index_list, master_timeout=delete_timeout)
 
 
-def delete_expired_indices(logger, cluster, delete_timeout, dry_run=False):
-    child_logger = logger.getChild(f"Cluster `{cluster.address}`")
+# Closed indices report no size; None keeps them apart from empty indices.
+def parse_store_size(store_size):
+    return int(store_size) if store_size else None
+
+
+def list_indices(elastic):
+    return {
+        row['index']: parse_store_size(row['store.size'])
+        for row in elastic.cat.indices(format='json',
+                                       h='index,store.size',
+                                       bytes='b',
+                                       expand_wildcards='open,closed')
+    }
+
+
+def count_pending_tasks(elastic):
+    return len(elastic.cluster.pending_tasks()['tasks'])
+
+
+def find_existing_indices(elastic, index_names):
+    return list(
+        elastic.indices.get_alias(index=','.join(index_names),
+                                  ignore_unavailable=True))
+
+
+# After a delete went through, failing follow-up reads must not lose it: the
+# sizer then goes by latency alone, and a batch whose indices cannot be
+# checked is retried as a whole.
+def read_pending_tasks(logger, elastic, guard):
+    from elasticsearch import TransportError
+
+    try:
+        return guard.call('delete', count_pending_tasks, elastic)
+    except (TransportError, DeadlineExceeded) as e:
+        logger.warning(f"Unable to read pending tasks: {e}")
+        return None
+
+
+def read_existing_indices(logger, elastic, index_names, guard):
+    from elasticsearch import TransportError
+
     try:
-        delete_action = build_delete_action_for_expired_indices(
-            child_logger, cluster, delete_timeout)
-        if dry_run:
-            delete_action.do_dry_run()
+        return guard.call('delete', find_existing_indices, elastic,
+                          index_names)
+    except (TransportError, DeadlineExceeded) as e:
+        logger.warning(f"Unable to check {len(index_names)} indices: {e}")
+        return index_names
+
+
+def delete_indices(logger, elastic, index_names, delete_timeout, dry_run=False,
+                   guard=None):
+    from elasticsearch import TransportError
+
+    if dry_run:
+        for index_name in index_names:
+            logger.info(f"DRY-RUN: delete index `{index_name}`")
+        return []
+
+    guard = guard or ClusterGuard()
+    deletion = BatchedDeletion(index_names)
+    batch = deletion.next_batch()
+    while batch:
+        if guard.remaining() <= 0:
+            logger.warning("Cluster deadline reached, leaving remaining "
+                           "indices for the next run")
+            break
+        logger.info(f"Deleting {len(batch)} indices: {', '.join(batch)}")
+        started = time.monotonic()
+        try:
+            elastic.indices.delete(index=','.join(batch),
+                                   ignore_unavailable=True,
+                                   **guard.build_delete_params(delete_timeout))
+        except TransportError as e:
+            logger.warning(f"Unable to delete {len(batch)} indices: {e}")
+            deletion.record_failure(
+                batch, read_existing_indices(logger, elastic, batch, guard))
         else:
-            delete_action.do_action()
+            deletion.record_success(
+                batch, time.monotonic() - started,
+                read_pending_tasks(logger, elastic, guard))
+        batch = deletion.next_batch()
+
+    for index_name in deletion.failed:
+        logger.warning(f"Unable to delete index `{index_name}` after retries")
+    return deletion.deleted
+
+
+def delete_expired_indices_with_client(logger, elastic, cluster,
+                                       delete_timeout, dry_run=False,
+                                       state=None, index_sizes=None,
+                                       disk_allocation=None, guard=None):
+    guard = guard or ClusterGuard()
+    if index_sizes is None:
+        with time_phase(cluster.address, 'list'):
+            index_sizes = guard.call('list', list_indices, elastic)
+    with time_phase(cluster.address, 'filter'):
+        expired_index_names = filter_expired_index_names(
+            logger, index_sizes, cluster, state)
+    if cluster.disk_watermark is not None:
+        with time_phase(cluster.address, 'budget'):
+            if disk_allocation is None:
+                disk_allocation = guard.call('budget', read_disk_allocation,
+                                             elastic)
+            over_budget_index_names = filter_over_budget_index_names(
+                logger, index_sizes, cluster, *disk_allocation,
+                expired_index_names)
+        expired_index_names = expired_index_names + over_budget_index_names
+    with time_phase(cluster.address, 'delete'):
+        deleted_index_names = delete_indices(logger, elastic,
+                                             expired_index_names,
+                                             delete_timeout, dry_run, guard)
+    count_deleted(
+        cluster.address, len(deleted_index_names),
+        sum(index_sizes.get(index_name) or 0
+            for index_name in deleted_index_names))
+    if state is not None:
+        state.record_deleted(cluster.address, deleted_index_names)
+    if cluster.has_log_tiers:
+        with time_phase(cluster.address, 'tier'):
+            apply_tier_actions(
+                logger, elastic, cluster,
+                index_sizes.keys() - set(expired_index_names), dry_run, state,
+                guard)
+    return deleted_index_names
+
+
+def connect_with_guard(cluster, guard):
+    with time_phase(cluster.address, 'ping'):
+        return guard.call('ping', connect_to_elasticsearch, cluster.addresses,
+                          min(CLIENT_TIMEOUT, guard.remaining()), cluster.sniff)
+
+
+def is_circuit_closed(logger, cluster, policy):
+    if policy.allows(cluster.address):
+        return True
+    logger.getChild(f"Cluster `{cluster.address}`").warning(
+        "Skipping cluster: circuit open after repeated failures")
+    return False
+
+
+def read_cluster_health(elastic):
+    return elastic.cluster.health()['status']
+
+
+def sample_cluster(logger, cluster, policy=None):
+    policy = policy or ResiliencePolicy()
+    if not is_circuit_closed(logger, cluster, policy):
+        return None
+    started = time.monotonic()
+    guard = policy.new_guard()
+    elastic = None
+    try:
+        elastic = connect_with_guard(cluster, guard)
+        with time_phase(cluster.address, 'sample'):
+            status = guard.call('sample', read_cluster_health, elastic)
+            disk_used, disk_total = guard.call('sample', read_disk_allocation,
+                                               elastic)
+            index_sizes = guard.call('sample', list_indices, elastic)
+    except Exception as e:
+        logger.getChild(f"Cluster `{cluster.address}`").warning(
+            f"Unable to sample cluster: {e}")
+        count_failure(cluster.address)
+        policy.record_failure(cluster.address)
+        return None
+    finally:
+        if elastic is not None:
+            elastic.close()
+    overdue_count = len(classify_indices(cluster, index_sizes).expired)
+    return ClusterSample(cluster, status, disk_used, disk_total,
+                         overdue_count, time.monotonic() - started)
+
+
+def delete_expired_indices_in_sample(logger, sample, delete_timeout,
+                                     dry_run=False, state=None, stop_at=None,
+                                     policy=None):
+    policy = policy or ResiliencePolicy()
+    cluster = sample.cluster
+    child_logger = logger.getChild(f"Cluster `{cluster.address}`")
+    if stop_at is not None and time.monotonic() >= stop_at:
+        child_logger.warning("Skipping cluster: run deadline reached")
+        return
+    try:
+        # Only the sampling time counts against the cluster timeout, not the
+        # wait for its turn in the schedule.
+        with trace_span('sweep', cluster.address, 'cluster'):
+            guard = policy.new_guard(sample.sample_time)
+            elastic = connect_with_guard(cluster, guard)
+            try:
+                delete_expired_indices_with_client(child_logger, elastic,
+                                                   cluster, delete_timeout,
+                                                   dry_run, state, guard=guard)
+            finally:
+                elastic.close()
     except Exception as e:
         child_logger.warning(f"Unable to delete expired indices: {e}")
+        count_failure(cluster.address)
+        policy.record_failure(cluster.address)
+    else:
+        policy.record_success(cluster.address)
 
 
-def delete_expired_indices_in_clusters(logger, clusters, delete_timeout, dry_run=False):
+def delete_expired_indices_in_clusters(logger, clusters, delete_timeout, dry_run=False,
+                                       state=None, deadline=None, policy=None):
+    stop_at = None if deadline is None else time.monotonic() + deadline
     pool = ThreadPool(cpu_count())
-    pool.map(lambda cluster: delete_expired_indices(logger, cluster, delete_timeout, dry_run),
-             clusters)
+    samples = [
+        sample for sample in pool.map(
+            lambda cluster: sample_cluster(logger, cluster, policy), clusters)
+        if sample is not None
+    ]
+    # One task at a time so the most urgent clusters are started first.
+    pool.map(lambda sample: delete_expired_indices_in_sample(
+        logger, sample, delete_timeout, dry_run, state=state, stop_at=stop_at,
+        policy=policy),
+             schedule_samples(logger, samples),
+             chunksize=1)
 
 
 def delete_expired_indices_in_barito(logger,
                                      api_url,
                                      client_key,
                                      delete_timeout,
-                                     dry_run=False):
-    clusters = fetch_clusters(api_url, client_key)
-    delete_expired_indices_in_clusters(logger, clusters, delete_timeout, dry_run)
+                                     dry_run=False,
+                                     profile_cache_path=None,
+                                     state=None,
+                                     deadline=None,
+                                     policy=None,
+                                     shard=None):
+    with time_phase('', 'fetch'):
+        clusters = fetch_clusters(api_url, client_key, profile_cache_path,
+                                  shard)
+    delete_expired_indices_in_clusters(logger, clusters, delete_timeout, dry_run,
+                                       state=state, deadline=deadline,
+                                       policy=policy)
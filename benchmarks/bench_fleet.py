@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fake_services import FakeServices  # noqa: E402
+
+
+def serve(connection, options):
+    services = FakeServices(**options).start()
+    connection.send(services.url)
+    connection.recv()
+    services.stop()
+
+
+def run_sweep(args, market_url):
+    logger = logging.getLogger()
+    if args.engine == 'asyncio':
+        from barito_curator.aio import delete_expired_indices_in_barito_async
+        delete_expired_indices_in_barito_async(logger, market_url, '', 3600,
+                                               args.dry_run, args.concurrency)
+    else:
+        from barito_curator.utils import delete_expired_indices_in_barito
+        delete_expired_indices_in_barito(logger, market_url, '', 3600,
+                                         args.dry_run)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a full sweep against fake Barito Market and '
+        'Elasticsearch services.')
+    parser.add_argument('--clusters', type=int, default=50)
+    parser.add_argument('--topics', type=int, default=100)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--retention-days', type=int, default=14)
+    parser.add_argument('--latency',
+                        type=float,
+                        default=0.0,
+                        help="Seconds added to every Elasticsearch request")
+    parser.add_argument('--error-rate',
+                        type=float,
+                        default=0.0,
+                        help="Share of Elasticsearch requests answered with 503")
+    parser.add_argument('--slow-masters',
+                        type=float,
+                        default=0.0,
+                        help="Share of clusters with a slow, busy master")
+    parser.add_argument('--slow-master-latency', type=float, default=1.0)
+    parser.add_argument('--engine',
+                        choices=['threads', 'asyncio'],
+                        default='threads')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('-d', '--dry-run', dest='dry_run', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    options = {
+        'clusters': args.clusters,
+        'topics': args.topics,
+        'days': args.days,
+        'retention_days': args.retention_days,
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'slow_masters': args.slow_masters,
+        'slow_master_latency': args.slow_master_latency,
+    }
+    connection, child_connection = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve,
+                                     args=(child_connection, options))
+    server.start()
+    url = connection.recv()
+    try:
+        started = time.perf_counter()
+        run_sweep(args, f"{url}/api/profile_curator")
+        elapsed = time.perf_counter() - started
+        with urlopen(f"{url}/_stats") as response:
+            stats = json.load(response)
+    finally:
+        connection.send('stop')
+        server.join()
+
+    requests = stats['requests_per_cluster']
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"clusters:             {args.clusters} x "
+          f"{args.topics * args.days} indices")
+    print(f"engine:               {args.engine}")
+    print(f"wall time:            {elapsed:.2f}s")
+    print(f"peak RSS:             {peak_rss_mb:.1f} MiB")
+    print(f"requests per cluster: mean {statistics.mean(requests):.1f}, "
+          f"max {max(requests)}")
+    print(f"market requests:      {stats['market_requests']}")
+    print(f"indices deleted:      {stats['deleted']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import time
+from urllib.parse import unquote
+
+from elasticsearch import Elasticsearch
+from elasticsearch.connection import Connection
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from curator import IndexList  # noqa: E402
+
+from barito_curator.utils import (filter_expired_index_names,  # noqa: E402
+                                  filter_expired_indices, list_indices)
+
+
+class FakeClusterConnection(Connection):
+    index_names = []
+    requests = []
+
+    def perform_request(self, method, url, params=None, body=None,
+                        timeout=None, ignore=(), headers=None):
+        self.requests.append((method, url))
+        path = unquote(url).strip('/').split('/')
+        if path == ['']:
+            data = {'version': {'number': '7.17.0', 'build_flavor': 'default'},
+                    'tagline': 'You Know, for Search'}
+        elif path == ['_all', '_settings']:
+            data = {name: self.settings(name) for name in self.index_names}
+        elif path[:3] == ['_cluster', 'state', 'metadata']:
+            data = {'metadata': {'indices': {
+                name: {'state': 'open', **self.settings(name)}
+                for name in path[3].split(',')
+            }}}
+        elif path[1:] == ['_stats', 'store,docs']:
+            data = {'indices': {
+                name: {'total': {'store': {'size_in_bytes': 1024},
+                                 'docs': {'count': 1}}}
+                for name in path[0].split(',')
+            }}
+        elif path == ['_cat', 'indices']:
+            data = [{'index': name, 'store.size': '1024'}
+                    for name in self.index_names]
+        else:
+            raise ValueError(f"Unexpected request: {method} {url}")
+        return 200, {'x-elastic-product': 'Elasticsearch'}, json.dumps(data)
+
+    @staticmethod
+    def settings(name):
+        return {'settings': {'index': {
+            'creation_date': '1577836800000',
+            'number_of_replicas': '1',
+            'number_of_shards': '1',
+        }}}
+
+
+class FakeCluster:
+    address = 'localhost'
+
+    def get_log_retention_days(self, topic):
+        return 7
+
+
+def build_index_names(topics, days):
+    return [
+        f"topic-{topic}-2020.{month:02}.{day:02}"
+        for topic in range(topics)
+        for month in range(1, 13)
+        for day in range(1, 29)
+    ][:topics * days]
+
+
+def run(name, func):
+    FakeClusterConnection.requests = []
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{name:>12}: {elapsed:8.3f}s "
+          f"{len(FakeClusterConnection.requests):6} requests")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare curator IndexList with the name-only listing.')
+    parser.add_argument('--topics', type=int, default=500)
+    parser.add_argument('--days', type=int, default=60)
+    args = parser.parse_args()
+
+    FakeClusterConnection.index_names = build_index_names(args.topics, args.days)
+    elastic = Elasticsearch(connection_class=FakeClusterConnection)
+    cluster = FakeCluster()
+    logger = type('NullLogger', (), {'warning': lambda *_: None})()
+
+    print(f"{len(FakeClusterConnection.index_names)} indices")
+    run('IndexList', lambda: filter_expired_indices(
+        logger, IndexList(elastic), cluster))
+    run('list_indices', lambda: filter_expired_index_names(
+        logger, list_indices(elastic), cluster))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+HEAVY_MODULES = ('aiohttp', 'curator', 'elasticsearch', 'requests')
+
+
+def measure_import(module):
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        check=True,
+        text=True).stderr
+    total_us = 0
+    loaded = set()
+    for line in output.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        name = name.strip()
+        if name == module:
+            total_us = int(cumulative)
+        if name.split('.')[0] in HEAVY_MODULES:
+            loaded.add(name.split('.')[0])
+    return total_us / 1000, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure barito_curator import time.')
+    parser.add_argument('--module', default='barito_curator')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-ms',
+                        type=float,
+                        help="Exit with an error when the median import "
+                        "time is above this limit")
+    args = parser.parse_args()
+
+    results = [measure_import(args.module) for _ in range(args.runs)]
+    median_ms = statistics.median(elapsed for elapsed, _ in results)
+    loaded = set().union(*(modules for _, modules in results))
+    print(f"{args.module}: median {median_ms:.1f}ms over {args.runs} runs")
+    print(f"heavy modules loaded: {', '.join(sorted(loaded)) or 'none'}")
+
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"import time regression: {median_ms:.1f}ms > {args.max_ms}ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
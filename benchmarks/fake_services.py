@@ -0,0 +1,215 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+INFO = {
+    'name': 'fake',
+    'cluster_name': 'fake',
+    'version': {
+        'number': '7.17.0',
+        'build_flavor': 'default'
+    },
+    'tagline': 'You Know, for Search',
+}
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class FakeServices:
+    def __init__(self,
+                 clusters=10,
+                 topics=100,
+                 days=30,
+                 retention_days=14,
+                 index_size=1024 * 1024,
+                 latency=0.0,
+                 error_rate=0.0,
+                 slow_masters=0.0,
+                 slow_master_latency=1.0,
+                 seed=0):
+        self.clusters = clusters
+        self.retention_days = retention_days
+        self.index_size = index_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_master_count = int(clusters * slow_masters)
+        self.slow_master_latency = slow_master_latency
+        self.random = random.Random(seed)
+
+        today = date.today()
+        self.index_names = [
+            f"topic-{topic}-{(today - timedelta(days=day)):%Y.%m.%d}"
+            for topic in range(topics) for day in range(days)
+        ]
+        self.index_positions = {
+            index_name: position
+            for position, index_name in enumerate(self.index_names)
+        }
+        self.deleted = [bytearray(len(self.index_names)) for _ in range(clusters)]
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def market_url(self):
+        return f"{self.url}/api/profile_curator"
+
+    def cluster_url(self, cluster_id):
+        return f"{self.url}/clusters/{cluster_id}"
+
+    def is_slow_master(self, cluster_id):
+        return cluster_id < self.slow_master_count
+
+    def profile(self):
+        return [{
+            'ipaddress': self.cluster_url(cluster_id),
+            'log_retention_days': self.retention_days,
+            'log_retention_days_per_topic': {},
+        } for cluster_id in range(self.clusters)]
+
+    def existing_indices(self, cluster_id, index_names=None):
+        deleted = self.deleted[cluster_id]
+        if index_names is None:
+            positions = range(len(self.index_names))
+        else:
+            positions = (self.index_positions[index_name]
+                         for index_name in index_names
+                         if index_name in self.index_positions)
+        return [
+            self.index_names[position] for position in positions
+            if not deleted[position]
+        ]
+
+    def delete_indices(self, cluster_id, index_names):
+        with self.lock:
+            for index_name in index_names:
+                position = self.index_positions.get(index_name)
+                if position is not None:
+                    self.deleted[cluster_id][position] = 1
+
+    def stats(self):
+        with self.lock:
+            requests = dict(self.requests)
+        per_cluster = [requests.get(cluster_id, 0)
+                       for cluster_id in range(self.clusters)]
+        return {
+            'market_requests': requests.get('market', 0),
+            'requests_per_cluster': per_cluster,
+            'deleted': sum(sum(deleted) for deleted in self.deleted),
+        }
+
+    def handle_cluster(self, cluster_id, method, path):
+        with self.lock:
+            self.requests[cluster_id] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if path and self.random.random() < self.error_rate:
+            return 503, {'error': 'unavailable', 'status': 503}
+
+        if not path:
+            return 200, INFO
+        if path == ['_cat', 'indices']:
+            return 200, [{
+                'index': index_name,
+                'store.size': str(self.index_size)
+            } for index_name in self.existing_indices(cluster_id)]
+        if path == ['_cluster', 'health']:
+            return 200, {'status': 'green'}
+        if path == ['_cat', 'allocation']:
+            existing = len(self.existing_indices(cluster_id))
+            return 200, [{
+                'disk.used': str(existing * self.index_size),
+                'disk.total': str(2 * len(self.index_names) * self.index_size)
+            }]
+        if path == ['_cluster', 'pending_tasks']:
+            pending = 15 if self.is_slow_master(cluster_id) else 0
+            return 200, {'tasks': [{}] * pending}
+        if len(path) == 2 and path[1] == '_alias':
+            return 200, {
+                index_name: {'aliases': {}}
+                for index_name in self.existing_indices(
+                    cluster_id, path[0].split(','))
+            }
+        if method == 'DELETE' and len(path) == 1:
+            if self.is_slow_master(cluster_id):
+                time.sleep(self.slow_master_latency)
+            self.delete_indices(cluster_id, path[0].split(','))
+            return 200, {'acknowledged': True}
+        return 404, {'error': f"unsupported {method} {'/'.join(path)}"}
+
+    def handle(self, method, raw_path):
+        url = urlsplit(raw_path)
+        path = [unquote(part) for part in url.path.split('/') if part]
+        if path == ['api', 'profile_curator']:
+            with self.lock:
+                self.requests['market'] += 1
+            return 200, self.profile()
+        if path == ['_stats']:
+            return 200, self.stats()
+        if len(path) >= 2 and path[0] == 'clusters':
+            return self.handle_cluster(int(path[1]), method, path[2:])
+        return 404, {'error': 'not found'}
+
+    def build_handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def respond(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                status, data = services.handle(method, self.path)
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('X-Elastic-Product', 'Elasticsearch')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if method != 'HEAD':
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self.respond('GET')
+
+            def do_HEAD(self):
+                self.respond('HEAD')
+
+            def do_DELETE(self):
+                self.respond('DELETE')
+
+            def do_PUT(self):
+                self.respond('PUT')
+
+            def do_POST(self):
+                self.respond('POST')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self, host='127.0.0.1', port=0):
+        self.server = FakeServer((host, port), self.build_handler())
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,216 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import ANY, AsyncMock, Mock, patch
+
+from elasticsearch import TransportError
+from faker import Faker
+
+from barito_curator.aio import (connect_to_elasticsearch_async,
+                                delete_expired_indices_in_clusters_async,
+                                delete_expired_indices_in_sample_async,
+                                delete_expired_indices_with_client_async,
+                                delete_indices_async, list_indices_async)
+from barito_curator.scheduling import ClusterSample
+
+
+class ConnectToElasticSearchAsyncTestCase(IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faker = Faker()
+
+    def setUp(self):
+        self.address = self.faker.ipv4()
+        self.es_connection_mock = AsyncMock()
+        self.es_connection_mock.ping = AsyncMock(return_value=True)
+        self.es_mock = Mock(return_value=self.es_connection_mock)
+
+    async def test_init_call(self):
+        with patch('elasticsearch.AsyncElasticsearch', self.es_mock):
+            await connect_to_elasticsearch_async(self.address)
+        self.es_mock.assert_called_once_with([self.address],
+                                             timeout=300,
+                                             max_retries=0,
+                                             http_compress=True)
+
+    async def test_return(self):
+        with patch('elasticsearch.AsyncElasticsearch', self.es_mock):
+            elastic = await connect_to_elasticsearch_async(self.address)
+        self.assertEqual(self.es_connection_mock, elastic)
+
+    async def test_unpingable(self):
+        self.es_connection_mock.ping.return_value = False
+        with self.assertRaises(ConnectionError):
+            with patch('elasticsearch.AsyncElasticsearch', self.es_mock):
+                await connect_to_elasticsearch_async(self.address)
+        self.es_connection_mock.close.assert_awaited_once_with()
+
+
+class ListIndicesAsyncTestCase(IsolatedAsyncioTestCase):
+    async def test_return(self):
+        elastic_mock = Mock()
+        elastic_mock.cat.indices = AsyncMock(return_value=[{
+            'index': 'a',
+            'store.size': '1024'
+        }])
+        self.assertEqual({'a': 1024}, await list_indices_async(elastic_mock))
+
+
+class DeleteIndicesAsyncTestCase(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.logger_mock = Mock()
+        self.elastic_mock = Mock()
+        self.elastic_mock.indices.delete = AsyncMock()
+        self.elastic_mock.indices.get_alias = AsyncMock(return_value={})
+        self.elastic_mock.cluster.pending_tasks = AsyncMock(
+            return_value={'tasks': []})
+
+    async def test_delete_call(self):
+        await delete_indices_async(self.logger_mock, self.elastic_mock,
+                                   ['a', 'b'], 10)
+        self.elastic_mock.indices.delete.assert_awaited_once_with(
+            index='a,b', master_timeout='10s', ignore_unavailable=True)
+
+    async def test_partial_failure_retried(self):
+        self.elastic_mock.indices.delete.side_effect = [
+            TransportError(500, 'error'), None
+        ]
+        self.elastic_mock.indices.get_alias.return_value = {'b': {}}
+        deleted = await delete_indices_async(self.logger_mock,
+                                             self.elastic_mock, ['a', 'b'],
+                                             10)
+        self.elastic_mock.indices.delete.assert_awaited_with(
+            index='b', master_timeout='10s', ignore_unavailable=True)
+        self.assertEqual(['a', 'b'], deleted)
+
+    async def test_follow_up_reads_unavailable(self):
+        self.elastic_mock.indices.delete.side_effect = [
+            TransportError(500, 'error'), None
+        ]
+        self.elastic_mock.indices.get_alias.side_effect = TransportError(
+            500, 'error')
+        self.elastic_mock.cluster.pending_tasks.side_effect = TransportError(
+            500, 'error')
+        self.assertEqual(['a', 'b'],
+                         await delete_indices_async(self.logger_mock,
+                                                    self.elastic_mock,
+                                                    ['a', 'b'], 10))
+
+    async def test_dry_run_not_deleting(self):
+        await delete_indices_async(self.logger_mock, self.elastic_mock,
+                                   ['a', 'b'], 10, dry_run=True)
+        self.assertFalse(self.elastic_mock.indices.delete.called)
+
+
+class DeleteExpiredIndicesWithClientAsyncTestCase(IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faker = Faker()
+
+    def setUp(self):
+        self.delete_timeout = 10
+        self.cluster_mock = Mock()
+        self.cluster_mock.disk_watermark = None
+        self.cluster_mock.has_log_tiers = False
+        self.logger_mock = Mock()
+        self.elastic_mock = AsyncMock()
+        self.index_names = {self.faker.domain_word(): 1024}
+        self.list_indices_mock = AsyncMock(return_value=self.index_names)
+        self.expired_index_names = [self.faker.domain_word()]
+        self.filter_mock = Mock(return_value=self.expired_index_names)
+        self.delete_indices_mock = AsyncMock(return_value=[])
+
+    async def call_target(self, **kwargs):
+        with patch('barito_curator.aio.list_indices_async',
+                   self.list_indices_mock), \
+                patch('barito_curator.aio.filter_expired_index_names',
+                      self.filter_mock), \
+                patch('barito_curator.aio.delete_indices_async',
+                      self.delete_indices_mock):
+            await delete_expired_indices_with_client_async(
+                self.logger_mock, self.elastic_mock, self.cluster_mock,
+                self.delete_timeout, **kwargs)
+
+    async def test_delete_indices_call(self):
+        await self.call_target(dry_run=True)
+        self.delete_indices_mock.assert_awaited_once_with(
+            self.logger_mock, self.elastic_mock, self.expired_index_names,
+            self.delete_timeout, True, ANY)
+
+    async def test_state_record_deleted(self):
+        state_mock = Mock()
+        self.delete_indices_mock.return_value = self.expired_index_names
+        await self.call_target(state=state_mock)
+        state_mock.record_deleted.assert_called_once_with(
+            self.cluster_mock.address, self.expired_index_names)
+
+
+class DeleteExpiredIndicesInClustersAsyncTestCase(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.logger_mock = Mock()
+        self.samples = [
+            ClusterSample(Mock(disk_watermark=None), 'green', 0, 0, 0, 0)
+            for _ in range(5)
+        ]
+        self.clusters = [sample.cluster for sample in self.samples]
+        self.running = 0
+        self.max_running = 0
+
+    async def fake_sample(self, logger, cluster, policy):
+        return {sample.cluster: sample for sample in self.samples}.get(cluster)
+
+    async def fake_delete(self, *args, **kwargs):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+
+    async def call_target(self, concurrency):
+        delete_mock = AsyncMock(side_effect=self.fake_delete)
+        with patch('barito_curator.aio.sample_cluster_async',
+                   AsyncMock(side_effect=self.fake_sample)), \
+                patch('barito_curator.aio.delete_expired_indices_in_sample_async',
+                      delete_mock):
+            await delete_expired_indices_in_clusters_async(
+                self.logger_mock, self.clusters, 10, False, concurrency)
+        return delete_mock
+
+    async def test_all_clusters(self):
+        delete_mock = await self.call_target(2)
+        self.assertEqual(len(self.clusters), delete_mock.await_count)
+
+    async def test_concurrency_limit(self):
+        await self.call_target(2)
+        self.assertEqual(2, self.max_running)
+
+    async def test_red_cluster_skipped(self):
+        self.samples[0] = self.samples[0]._replace(status='red')
+        delete_mock = await self.call_target(2)
+        self.assertEqual(len(self.clusters) - 1, delete_mock.await_count)
+
+
+class DeleteExpiredIndicesInSampleAsyncTestCase(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.sample = ClusterSample(Mock(), 'green', 900, 1000, 1, 0)
+        self.elastic_mock = AsyncMock()
+        self.logger_mock = Mock()
+
+    async def call_target(self, **kwargs):
+        with patch('barito_curator.aio.connect_to_elasticsearch_async',
+                   AsyncMock(return_value=self.elastic_mock)), \
+                patch('barito_curator.aio.delete_expired_indices_with_client_async'
+                      ) as delete_mock:
+            await delete_expired_indices_in_sample_async(
+                self.logger_mock, self.sample, 10, **kwargs)
+        return delete_mock
+
+    async def test_lists_again_and_closes_client(self):
+        delete_mock = await self.call_target()
+        delete_mock.assert_awaited_once_with(
+            self.logger_mock.getChild.return_value, self.elastic_mock,
+            self.sample.cluster, 10, False, None, guard=ANY)
+        self.elastic_mock.close.assert_awaited_once()
+
+    async def test_deadline_reached(self):
+        delete_mock = await self.call_target(stop_at=0)
+        delete_mock.assert_not_awaited()
+        self.elastic_mock.close.assert_not_awaited()
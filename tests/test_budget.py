@@ -0,0 +1,93 @@
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import Mock
+
+from barito_curator.budget import (parse_disk_allocation, read_disk_allocation,
+                                   select_over_budget_indices)
+from barito_curator.metadata import Cluster
+from barito_curator.utils import list_indices
+
+NOW = datetime(2020, 1, 5, 12)
+
+
+class ParseDiskAllocationTestCase(TestCase):
+    def test_sums_nodes(self):
+        self.assertEqual((300, 1000), parse_disk_allocation([
+            {'disk.used': '100', 'disk.total': '400'},
+            {'disk.used': '200', 'disk.total': '600'},
+        ]))
+
+    def test_skips_unassigned(self):
+        self.assertEqual((100, 400), parse_disk_allocation([
+            {'disk.used': '100', 'disk.total': '400'},
+            {'disk.used': None, 'disk.total': None},
+        ]))
+
+    def test_read_disk_allocation(self):
+        elastic = Mock()
+        elastic.cat.allocation.return_value = [
+            {'disk.used': '1', 'disk.total': '2'}]
+        self.assertEqual((1, 2), read_disk_allocation(elastic))
+        elastic.cat.allocation.assert_called_once_with(
+            format='json', h='disk.used,disk.total', bytes='b')
+
+
+class SelectOverBudgetIndicesTestCase(TestCase):
+    def setUp(self):
+        self.cluster = Cluster('a', 30, {}, 80, {'important': 10})
+        self.index_sizes = {
+            'app-2020.01.01': 100,
+            'app-2020.01.02': 100,
+            'app-2020.01.03': 100,
+            'app-2020.01.05': 100,
+            'important-2020.01.01': 100,
+            'test': 100,
+        }
+
+    def select(self, disk_used, excluded_index_names=frozenset(), cluster=None):
+        return select_over_budget_indices(cluster or self.cluster,
+                                          self.index_sizes, disk_used, 1000,
+                                          excluded_index_names, NOW)
+
+    def test_under_watermark(self):
+        self.assertEqual([], self.select(800))
+
+    def test_oldest_first(self):
+        self.assertEqual(['app-2020.01.01', 'app-2020.01.02'],
+                         self.select(950))
+
+    def test_lowest_priority_first(self):
+        self.assertEqual(
+            ['app-2020.01.01', 'app-2020.01.02', 'app-2020.01.03',
+             'important-2020.01.01'], self.select(1200))
+
+    def test_never_selects_today_or_unparseable(self):
+        self.assertNotIn('app-2020.01.05', self.select(5000))
+        self.assertNotIn('test', self.select(5000))
+
+    def test_expired_indices_count_as_freed(self):
+        self.assertEqual([], self.select(900, {'app-2020.01.01'}))
+        self.assertEqual(['app-2020.01.02'],
+                         self.select(1000, {'app-2020.01.01'}))
+
+    def test_no_watermark(self):
+        self.assertEqual([], self.select(5000, cluster=Cluster('a', 30, {})))
+
+    def test_skips_indices_closed_by_tiers(self):
+        cluster = Cluster('a', 30, {}, 80,
+                          log_tiers=[{'action': 'close', 'after_days': 2}])
+        elastic = Mock()
+        elastic.cat.indices.return_value = [
+            {'index': 'app-2020.01.01', 'store.size': ''},
+            {'index': 'app-2020.01.02', 'store.size': ''},
+            {'index': 'app-2020.01.03', 'store.size': '100'},
+            {'index': 'app-2020.01.04', 'store.size': '100'},
+        ]
+        self.assertEqual(['app-2020.01.03'],
+                         select_over_budget_indices(cluster,
+                                                    list_indices(elastic),
+                                                    900, 1000, now=NOW))
+
+    def test_unknown_disk_total(self):
+        self.assertEqual([], select_over_budget_indices(
+            self.cluster, self.index_sizes, 100, 0))
@@ -0,0 +1,44 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from barito_curator.clients import ClientPool
+from barito_curator.metadata import Cluster
+from barito_curator.resilience import ClusterGuard
+
+
+class ClientPoolTestCase(TestCase):
+    def setUp(self):
+        self.cluster = Cluster('a', 1, {}, addresses=['a', 'b'], sniff=True)
+        self.pool = ClientPool()
+        self.guard = ClusterGuard()
+        self.connect_mock = Mock(side_effect=lambda *args: Mock())
+        self.patcher = patch('barito_curator.clients.connect_to_elasticsearch',
+                             self.connect_mock)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_reuses_client(self):
+        elastic = self.pool.get(self.cluster, self.guard)
+        self.assertIs(elastic, self.pool.get(self.cluster, self.guard))
+        self.connect_mock.assert_called_once_with(['a', 'b'], 300, True)
+
+    def test_reconnects_when_nodes_change(self):
+        elastic = self.pool.get(self.cluster, self.guard)
+        self.pool.get(Cluster('a', 1, {}, addresses=['a', 'c']), self.guard)
+        elastic.close.assert_called_once_with()
+        self.assertEqual(2, self.connect_mock.call_count)
+        self.assertEqual(1, len(self.pool))
+
+    def test_discard(self):
+        elastic = self.pool.get(self.cluster, self.guard)
+        self.pool.discard('a')
+        elastic.close.assert_called_once_with()
+        self.assertEqual(0, len(self.pool))
+
+    def test_close(self):
+        elastic = self.pool.get(self.cluster, self.guard)
+        self.pool.close()
+        elastic.close.assert_called_once_with()
+        self.assertEqual(0, len(self.pool))
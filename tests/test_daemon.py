@@ -0,0 +1,133 @@
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from faker import Faker
+
+from barito_curator.daemon import Daemon
+from barito_curator.resilience import CircuitBreaker, ResiliencePolicy
+
+
+class DaemonTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faker = Faker()
+
+    def build_cluster_mock(self):
+        cluster_mock = Mock()
+        cluster_mock.address = self.faker.ipv4()
+        cluster_mock.disk_watermark = None
+        cluster_mock.has_log_tiers = False
+        return cluster_mock
+
+    def setUp(self):
+        self.logger_mock = Mock()
+        self.cluster_1_mock = self.build_cluster_mock()
+        self.cluster_2_mock = self.build_cluster_mock()
+        self.fetch_clusters_mock = Mock(
+            return_value=[self.cluster_1_mock, self.cluster_2_mock])
+        self.elastic_mock = Mock()
+        self.connect_mock = Mock(return_value=self.elastic_mock)
+        self.delete_mock = Mock()
+        self.daemon = Daemon(self.logger_mock,
+                             self.faker.url(),
+                             '',
+                             10,
+                             sweep_interval=100,
+                             refresh_interval=50,
+                             jitter=0.1)
+        self.patches = [
+            patch('barito_curator.daemon.fetch_clusters',
+                  self.fetch_clusters_mock),
+            patch('barito_curator.clients.connect_to_elasticsearch',
+                  self.connect_mock),
+            patch('barito_curator.daemon.delete_expired_indices_with_client',
+                  self.delete_mock),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patches:
+            patcher.stop()
+
+    def test_refresh_clusters(self):
+        self.daemon.refresh_clusters(0)
+        self.assertEqual(
+            {
+                self.cluster_1_mock.address: self.cluster_1_mock,
+                self.cluster_2_mock.address: self.cluster_2_mock
+            }, self.daemon.clusters)
+
+    def test_refresh_failure_keeps_clusters(self):
+        self.daemon.refresh_clusters(0)
+        self.fetch_clusters_mock.side_effect = ConnectionError()
+        self.daemon.refresh_clusters(50)
+        self.assertEqual(2, len(self.daemon.clusters))
+
+    def test_first_sweeps_spread(self):
+        self.daemon.refresh_clusters(0)
+        self.assertEqual([], self.daemon.pop_due_clusters(-1))
+        self.assertEqual(
+            {self.cluster_1_mock, self.cluster_2_mock},
+            set(self.daemon.pop_due_clusters(100)))
+
+    def test_in_flight_not_popped_twice(self):
+        self.daemon.refresh_clusters(0)
+        self.daemon.pop_due_clusters(100)
+        self.daemon.refresh_clusters(100)
+        self.assertEqual([], self.daemon.pop_due_clusters(200))
+
+    def test_removed_cluster_not_swept(self):
+        self.daemon.refresh_clusters(0)
+        self.fetch_clusters_mock.return_value = [self.cluster_1_mock]
+        self.daemon.refresh_clusters(50)
+        self.assertEqual([self.cluster_1_mock],
+                         self.daemon.pop_due_clusters(100))
+
+    def test_next_sweep_delay(self):
+        for _ in range(20):
+            self.assertTrue(90 <= self.daemon.next_sweep_delay() <= 110)
+
+    def test_sweep_reuses_client(self):
+        self.daemon.refresh_clusters(0)
+        self.daemon.sweep(self.cluster_1_mock)
+        self.daemon.sweep(self.cluster_1_mock)
+        self.connect_mock.assert_called_once_with(
+            self.cluster_1_mock.addresses, 300, self.cluster_1_mock.sniff)
+        self.assertEqual(2, self.delete_mock.call_count)
+
+    def test_sweep_failure_drops_client(self):
+        self.daemon.refresh_clusters(0)
+        self.delete_mock.side_effect = ConnectionError()
+        self.daemon.sweep(self.cluster_1_mock)
+        self.elastic_mock.close.assert_called_once_with()
+
+    def test_circuit_breaker_skips_failing_cluster(self):
+        daemon = Daemon(self.logger_mock,
+                        self.faker.url(),
+                        '',
+                        10,
+                        policy=ResiliencePolicy(
+                            breaker=CircuitBreaker(failure_threshold=2)))
+        daemon.refresh_clusters(0)
+        self.delete_mock.side_effect = ConnectionError()
+        daemon.sweep(self.cluster_1_mock)
+        daemon.sweep(self.cluster_1_mock)
+        daemon.sweep(self.cluster_1_mock)
+        self.assertEqual(2, self.delete_mock.call_count)
+
+    def test_sweep_reschedules(self):
+        self.daemon.refresh_clusters(0)
+        self.daemon.pop_due_clusters(100)
+        self.daemon.sweep(self.cluster_1_mock)
+        self.assertEqual([self.cluster_1_mock],
+                         self.daemon.pop_due_clusters(time.monotonic() + 200))
+
+    def test_stop(self):
+        thread = threading.Thread(target=self.daemon.run)
+        thread.start()
+        self.daemon.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
@@ -0,0 +1,100 @@
+from unittest import TestCase
+
+from barito_curator.deletion import (AdaptiveBatchSizer, BatchedDeletion,
+                                     chunk_index_names)
+
+
+class AdaptiveBatchSizerTestCase(TestCase):
+    def setUp(self):
+        self.sizer = AdaptiveBatchSizer(initial_size=8,
+                                        min_size=2,
+                                        max_size=10,
+                                        target_latency=4.0,
+                                        max_pending_tasks=10)
+
+    def test_grow_when_fast_and_idle(self):
+        self.sizer.record(1.0, 0)
+        self.assertEqual(10, self.sizer.size)
+
+    def test_grow_bounded(self):
+        for _ in range(5):
+            self.sizer.record(1.0, 0)
+        self.assertEqual(10, self.sizer.size)
+
+    def test_keep_when_near_target(self):
+        self.sizer.record(3.0, 0)
+        self.assertEqual(8, self.sizer.size)
+
+    def test_latency_only(self):
+        self.sizer.record(1.0)
+        self.assertEqual(10, self.sizer.size)
+        self.sizer.record(5.0)
+        self.assertEqual(5, self.sizer.size)
+
+    def test_shrink_when_slow(self):
+        self.sizer.record(5.0, 0)
+        self.assertEqual(4, self.sizer.size)
+
+    def test_shrink_when_master_busy(self):
+        self.sizer.record(1.0, 11)
+        self.assertEqual(4, self.sizer.size)
+
+    def test_shrink_bounded(self):
+        for _ in range(5):
+            self.sizer.shrink()
+        self.assertEqual(2, self.sizer.size)
+
+
+class BatchedDeletionTestCase(TestCase):
+    def build_deletion(self, index_names, size=2, max_length=100):
+        return BatchedDeletion(index_names,
+                               AdaptiveBatchSizer(initial_size=size),
+                               max_attempts=2,
+                               max_length=max_length)
+
+    def test_batch_size(self):
+        deletion = self.build_deletion(['a', 'b', 'c'])
+        self.assertEqual(['a', 'b'], deletion.next_batch())
+        self.assertEqual(['c'], deletion.next_batch())
+        self.assertEqual([], deletion.next_batch())
+
+    def test_batch_length(self):
+        deletion = self.build_deletion(['aaa', 'bbb'], max_length=6)
+        self.assertEqual(['aaa'], deletion.next_batch())
+
+    def test_oversized_name(self):
+        deletion = self.build_deletion(['aaaaaaaa'], max_length=6)
+        self.assertEqual(['aaaaaaaa'], deletion.next_batch())
+
+    def test_record_success(self):
+        deletion = self.build_deletion(['a', 'b'])
+        deletion.record_success(deletion.next_batch(), 0.1, 0)
+        self.assertEqual(['a', 'b'], deletion.deleted)
+
+    def test_record_failure_retries_remaining_first(self):
+        deletion = self.build_deletion(['a', 'b', 'c'])
+        batch = deletion.next_batch()
+        self.assertEqual(['b'], deletion.record_failure(batch, ['b']))
+        self.assertEqual(['a'], deletion.deleted)
+        self.assertEqual(['b'], deletion.next_batch())
+
+    def test_record_failure_shrinks(self):
+        deletion = self.build_deletion(['a', 'b', 'c'], size=4)
+        deletion.record_failure(deletion.next_batch(), ['a'])
+        self.assertEqual(2, deletion.sizer.size)
+
+    def test_record_failure_gives_up(self):
+        deletion = self.build_deletion(['a'])
+        deletion.record_failure(deletion.next_batch(), ['a'])
+        deletion.record_failure(deletion.next_batch(), ['a'])
+        self.assertEqual(['a'], deletion.failed)
+        self.assertEqual([], deletion.next_batch())
+
+
+class ChunkIndexNamesTestCase(TestCase):
+    def test_chunks_by_length(self):
+        self.assertEqual([['aaa', 'bbb'], ['ccc']],
+                         list(chunk_index_names(['aaa', 'bbb', 'ccc'], 8)))
+
+    def test_empty(self):
+        self.assertEqual([], list(chunk_index_names([])))
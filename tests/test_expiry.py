@@ -0,0 +1,195 @@
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import Mock
+
+from faker import Faker
+from freezegun import freeze_time
+
+from barito_curator.expiry import (DEFAULT_INDEX_NAME_PARSER,
+                                   ExpiryEvaluator, IndexDateFormat,
+                                   IndexNameParser, build_cutoff,
+                                   build_hour_cutoff, classify_indices,
+                                   get_index_name_parser, split_index_name)
+
+
+class BuildCutoffTestCase(TestCase):
+    def test_midnight(self):
+        self.assertEqual("2020.01.03",
+                         build_cutoff(datetime(2020, 1, 5), 2))
+
+    def test_past_midnight(self):
+        self.assertEqual("2020.01.04",
+                         build_cutoff(datetime(2020, 1, 5, 10), 2))
+
+    def test_month_boundary(self):
+        self.assertEqual("2019.12.31",
+                         build_cutoff(datetime(2020, 1, 2), 2))
+
+
+class BuildHourCutoffTestCase(TestCase):
+    def test_on_the_hour(self):
+        self.assertEqual("2020.01.03.10",
+                         build_hour_cutoff(datetime(2020, 1, 5, 10), 2))
+
+    def test_past_the_hour(self):
+        self.assertEqual("2020.01.03.11",
+                         build_hour_cutoff(datetime(2020, 1, 5, 10, 30), 2))
+
+
+class SplitIndexNameTestCase(TestCase):
+    def test_daily(self):
+        self.assertEqual(('app', '2020.01.02'),
+                         split_index_name('app-2020.01.02'))
+
+    def test_hourly(self):
+        self.assertEqual(('app', '2020.01.02.13'),
+                         split_index_name('app-2020.01.02.13'))
+
+    def test_rollover(self):
+        self.assertEqual(('app-web', '2020.01.02'),
+                         split_index_name('app-web-2020.01.02-000003'))
+
+    def test_iso(self):
+        self.assertEqual(('app', '2020.01.02'),
+                         split_index_name('app-2020-01-02'))
+
+    def test_topic_ending_with_date(self):
+        self.assertEqual(('app-2020.01.01', '2020.01.02'),
+                         split_index_name('app-2020.01.01-2020.01.02'))
+
+    def test_invalid(self):
+        for index_name in ('app', 'app-2020.01.02.24', 'app-2020.01.02-',
+                           '-2020.01.02', 'app-2020.01'):
+            self.assertIsNone(split_index_name(index_name), index_name)
+
+    def test_impossible_dates(self):
+        for index_name in ('app-2020.02.30', 'app-2019.02.29.10',
+                           'app-2020-04-31', 'app-2020.06.31-000001'):
+            self.assertIsNone(split_index_name(index_name), index_name)
+        self.assertEqual(('app', '2020.02.29'),
+                         split_index_name('app-2020.02.29'))
+
+    def test_custom_formats(self):
+        parser = IndexNameParser(
+            [IndexDateFormat('compact', r'{year}{month}{day}')])
+        self.assertEqual(('app', '2020.01.02'), parser.parse('app-20200102'))
+        self.assertIsNone(parser.parse('app-2020.01.02'))
+
+
+class GetIndexNameParserTestCase(TestCase):
+    def test_default(self):
+        self.assertIs(DEFAULT_INDEX_NAME_PARSER, get_index_name_parser())
+
+    def test_named_and_custom_formats(self):
+        parser = get_index_name_parser(('daily', r'{year}{month}{day}'))
+        self.assertEqual(('app', '2020.01.02'), parser.parse('app-20200102'))
+        self.assertEqual(('app', '2020.01.02'),
+                         parser.parse('app-2020.01.02'))
+        self.assertIsNone(parser.parse('app-2020-01-02'))
+
+    def test_invalid_formats(self):
+        for specs in ((r'{year}\.{month}', ), ('{week}', )):
+            with self.assertRaises(ValueError):
+                get_index_name_parser(specs)
+
+
+class ClassifyIndicesTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faker = Faker()
+
+    def setUp(self):
+        self.topic_name = self.faker.domain_word()
+        self.cluster_mock = Mock(index_name_parser=DEFAULT_INDEX_NAME_PARSER)
+        self.cluster_mock.get_log_retention_days = Mock(return_value=2)
+        self.now = datetime(2020, 1, 5)
+
+    def call_target(self, index_names):
+        return classify_indices(self.cluster_mock, index_names, self.now)
+
+    def test_expired(self):
+        index_name = f"{self.topic_name}-2020.01.02"
+        self.assertEqual({index_name}, self.call_target([index_name]).expired)
+
+    def test_kept(self):
+        index_name = f"{self.topic_name}-2020.01.03"
+        self.assertEqual({index_name}, self.call_target([index_name]).kept)
+
+    def test_topic_with_dash(self):
+        index_name = f"{self.topic_name}-{self.topic_name}-2020.01.02"
+        self.call_target([index_name])
+        self.cluster_mock.get_log_retention_days.assert_called_once_with(
+            f"{self.topic_name}-{self.topic_name}")
+
+    def test_unparseable(self):
+        index_names = [
+            self.topic_name, f"{self.topic_name}-2020.13.01",
+            f"{self.topic_name}-2020.1.01", "-2020.01.01",
+            f"{self.topic_name}-2020.02.30"
+        ]
+        self.assertEqual(set(index_names),
+                         self.call_target(index_names).unparseable)
+
+    def test_retention_looked_up_once_per_topic(self):
+        self.call_target([
+            f"{self.topic_name}-2020.01.0{day}" for day in range(1, 6)
+        ])
+        self.cluster_mock.get_log_retention_days.assert_called_once_with(
+            self.topic_name)
+
+    def test_hourly(self):
+        now = datetime(2020, 1, 5, 10, 30)
+        classification = classify_indices(
+            self.cluster_mock,
+            ['app-2020.01.03.10', 'app-2020.01.03.11', 'app-2020.01.03'], now)
+        self.assertEqual({'app-2020.01.03.10', 'app-2020.01.03'},
+                         classification.expired)
+        self.assertEqual({'app-2020.01.03.11'}, classification.kept)
+
+    def test_rollover_and_iso(self):
+        classification = self.call_target(
+            ['app-2020.01.02-000001', 'app-2020-01-02', 'app-2020-01-03'])
+        self.assertEqual({'app-2020.01.02-000001', 'app-2020-01-02'},
+                         classification.expired)
+
+    def test_per_topic_cutoff(self):
+        self.cluster_mock.get_log_retention_days.side_effect = (
+            lambda topic: 1 if topic == 'short' else 10)
+        classification = self.call_target(
+            ['short-2020.01.03', 'long-2020.01.03'])
+        self.assertEqual({'short-2020.01.03'}, classification.expired)
+        self.assertEqual({'long-2020.01.03'}, classification.kept)
+
+
+class ExpiryEvaluatorTestCase(TestCase):
+    def test_hourly_expiry_date(self):
+        cluster_mock = Mock(index_name_parser=DEFAULT_INDEX_NAME_PARSER)
+        cluster_mock.get_log_retention_days = Mock(return_value=2)
+        evaluator = ExpiryEvaluator(cluster_mock, datetime(2020, 1, 5, 13))
+        self.assertEqual('2020.01.05.13',
+                         evaluator.get_expiry_date('app-2020.01.03.13'))
+        self.assertFalse(evaluator.is_expiry_due('2020.01.05.13'))
+        self.assertTrue(evaluator.is_expiry_due('2020.01.05.12'))
+        self.assertTrue(evaluator.is_expiry_due('2020.01.04'))
+
+    def test_expiry_date_of_unparseable(self):
+        cluster_mock = Mock(index_name_parser=DEFAULT_INDEX_NAME_PARSER)
+        cluster_mock.get_log_retention_days = Mock(return_value=7)
+        evaluator = ExpiryEvaluator(cluster_mock, datetime(2020, 3, 1))
+        self.assertIsNone(evaluator.get_expiry_date('app-2020.02.30'))
+        self.assertEqual('2020.03.07',
+                         evaluator.get_expiry_date('app-2020.02.29'))
+
+    @freeze_time(datetime(2020, 1, 5, 10))
+    def test_default_now(self):
+        self.assertEqual(datetime(2020, 1, 5, 10),
+                         ExpiryEvaluator(Mock()).now)
+
+    def test_single_now_per_run(self):
+        cluster_mock = Mock(index_name_parser=DEFAULT_INDEX_NAME_PARSER)
+        cluster_mock.get_log_retention_days = Mock(return_value=2)
+        with freeze_time(datetime(2020, 1, 5)) as frozen_time:
+            evaluator = ExpiryEvaluator(cluster_mock)
+            frozen_time.tick(86400)
+            self.assertEqual({'app-2020.01.03'},
+                             evaluator.classify(['app-2020.01.03']).kept)
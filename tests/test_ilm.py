@@ -0,0 +1,158 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+from elasticsearch import TransportError
+
+from barito_curator.ilm import (DEFAULT_TEMPLATE_NAME, build_desired_state,
+                                get_template_name, rank_topic_patterns,
+                                reconcile_cluster)
+from barito_curator.metadata import Cluster, merge_clusters
+
+
+class RankTopicPatternsTestCase(TestCase):
+    def test_matcher_precedence(self):
+        self.assertEqual(['app-api', 'app-api*', 'app-*', 'a*', '*'],
+                         rank_topic_patterns(
+                             ['*', 'a*', 'app-*', 'app-api', 'app-api*']))
+
+
+class BuildDesiredStateTestCase(TestCase):
+    def test_policies_and_templates(self):
+        policies, templates = build_desired_state(
+            Cluster('a', 14, {'app-*': 7, 'app-api': 30}))
+        self.assertEqual([
+            'barito-curator-retention-7d', 'barito-curator-retention-14d',
+            'barito-curator-retention-30d'
+        ], list(policies))
+        self.assertEqual({'delete': {'min_age': '7d', 'actions': {'delete': {}}}},
+                         policies['barito-curator-retention-7d']['phases'])
+
+        default = templates[DEFAULT_TEMPLATE_NAME]
+        self.assertEqual(['*-20*'], default['index_patterns'])
+        api = templates[get_template_name('app-api')]
+        self.assertEqual(['app-api-20*'], api['index_patterns'])
+        self.assertEqual('barito-curator-retention-30d',
+                         api['settings']['index']['lifecycle']['name'])
+        glob = templates[get_template_name('app-*')]
+        self.assertGreater(api['order'], glob['order'])
+        self.assertGreater(glob['order'], default['order'])
+
+
+class ReconcileClusterTestCase(TestCase):
+    def setUp(self):
+        self.logger = Mock()
+        self.elastic = Mock()
+        self.cluster = Cluster('a', 14, {'app': 7})
+        policies, templates = build_desired_state(self.cluster)
+        self.elastic.ilm.get_lifecycle.return_value = {
+            name: {'version': 1, 'policy': policy}
+            for name, policy in policies.items()
+        }
+        self.elastic.indices.get_template.return_value = dict(templates)
+        self.elastic.indices.get_settings.return_value = {}
+
+    def test_up_to_date(self):
+        self.assertEqual([],
+                         reconcile_cluster(self.logger, self.elastic,
+                                           self.cluster))
+        self.elastic.ilm.put_lifecycle.assert_not_called()
+        self.elastic.indices.put_template.assert_not_called()
+
+    def test_skips_markets_disagreeing_on_retention(self):
+        cluster, = merge_clusters([Cluster('a', 7, {'*-api': 30}),
+                                  Cluster('a', 7, {'payment*': 3})])
+        self.assertEqual([],
+                         reconcile_cluster(self.logger, self.elastic, cluster))
+        self.logger.warning.assert_called_once()
+        self.elastic.ilm.get_lifecycle.assert_not_called()
+
+    def test_reconciles_markets_agreeing_on_retention(self):
+        cluster, = merge_clusters([Cluster('a', 14, {'app': 7}),
+                                  Cluster('a', 14, {'app': 7})])
+        self.assertEqual([],
+                         reconcile_cluster(self.logger, self.elastic, cluster))
+        self.logger.warning.assert_not_called()
+        self.elastic.ilm.get_lifecycle.assert_called_once()
+
+    def test_pushes_changes_only(self):
+        cluster = Cluster('a', 14, {'app': 30})
+        self.assertEqual([('put_policy', 'barito-curator-retention-30d'),
+                          ('put_template', get_template_name('app')),
+                          ('delete_policy', 'barito-curator-retention-7d')],
+                         reconcile_cluster(self.logger, self.elastic, cluster))
+        self.elastic.ilm.put_lifecycle.assert_called_once()
+        self.elastic.indices.put_template.assert_called_once()
+        self.elastic.ilm.delete_lifecycle.assert_called_once_with(
+            policy='barito-curator-retention-7d')
+
+    def test_moves_existing_indices(self):
+        self.elastic.indices.get_settings.return_value = {
+            'app-2020.01.01': {'settings': {
+                'index.lifecycle.name': 'barito-curator-retention-7d'}},
+            'web-2020.01.01': {'settings': {
+                'index.lifecycle.name': 'barito-curator-retention-14d'}},
+            'logs-2020.01.01': {'settings': {
+                'index.lifecycle.name': 'logs'}},
+            'db-2020.01.01': {'settings': {}},
+        }
+        cluster = Cluster('a', 14, {'app': 30})
+        self.assertEqual([('put_policy', 'barito-curator-retention-30d'),
+                          ('put_template', get_template_name('app')),
+                          ('put_index_policy', 'barito-curator-retention-30d'),
+                          ('delete_policy', 'barito-curator-retention-7d')],
+                         reconcile_cluster(self.logger, self.elastic, cluster))
+        self.elastic.indices.put_settings.assert_called_once_with(
+            index='app-2020.01.01',
+            body={'index.lifecycle.name': 'barito-curator-retention-30d'})
+        self.elastic.indices.get_settings.assert_called_once_with(
+            index='*-20*', name='index.lifecycle.name', flat_settings=True)
+
+    def test_restores_edited_policy(self):
+        policy = self.elastic.ilm.get_lifecycle.return_value[
+            'barito-curator-retention-7d']['policy']
+        policy['phases'] = {'delete': {'min_age': '1d', 'actions': {
+            'delete': {'delete_searchable_snapshot': True}}}}
+        self.assertEqual([('put_policy', 'barito-curator-retention-7d')],
+                         reconcile_cluster(self.logger, self.elastic,
+                                           self.cluster))
+
+    def test_ignores_filled_in_action_defaults(self):
+        policy = self.elastic.ilm.get_lifecycle.return_value[
+            'barito-curator-retention-7d']['policy']
+        policy['phases']['delete']['actions'] = {
+            'delete': {'delete_searchable_snapshot': True}}
+        self.assertEqual([],
+                         reconcile_cluster(self.logger, self.elastic,
+                                           self.cluster))
+
+    def test_removes_stale_templates(self):
+        cluster = Cluster('a', 14, {})
+        self.elastic.ilm.delete_lifecycle.side_effect = TransportError(
+            400, 'in use')
+        self.assertEqual(
+            [('delete_template', get_template_name('app'))],
+            reconcile_cluster(self.logger, self.elastic, cluster))
+        self.elastic.indices.delete_template.assert_called_once_with(
+            name=get_template_name('app'))
+
+    def test_ignores_unmanaged(self):
+        self.elastic.ilm.get_lifecycle.return_value['logs'] = {'policy': {}}
+        self.assertEqual([],
+                         reconcile_cluster(self.logger, self.elastic,
+                                           self.cluster))
+
+    def test_dry_run(self):
+        self.assertEqual([],
+                         reconcile_cluster(self.logger, self.elastic,
+                                           Cluster('a', 14, {'app': 30}),
+                                           dry_run=True))
+        self.elastic.ilm.put_lifecycle.assert_not_called()
+        self.logger.info.assert_any_call(
+            "DRY-RUN: put_policy `barito-curator-retention-30d`")
+
+    def test_unexpressible_patterns(self):
+        self.assertEqual([],
+                         reconcile_cluster(self.logger, self.elastic,
+                                           Cluster('a', 14, {'app-?': 7})))
+        self.elastic.ilm.get_lifecycle.assert_not_called()
+        self.logger.warning.assert_called_once()
@@ -1,11 +1,17 @@
 import json
+import os
+import tempfile
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import MagicMock, Mock, patch
 
 import requests
 from faker import Faker
 
-from barito_curator.metadata import Cluster, fetch, parse_json_structure
+from barito_curator.metadata import (FETCH_TIMEOUT, Cluster, fetch,
+                                     fetch_clusters, iter_json_array,
+                                     merge_clusters, parse_json_structure,
+                                     read_cached_etag, split_markets)
+from barito_curator.sharding import Shard, get_shard_index
 
 
 class ClusterTestCase(unittest.TestCase):
@@ -36,6 +42,44 @@ class ClusterTestCase(unittest.TestCase):
             self.default_log_retention_days,
             self.cluster.get_log_retention_days(self.missing_app_2_name))
 
+    def test_get_log_retention_days_pattern(self):
+        cluster = Cluster(self.address, 14, {'app-*': 7, 'app-api': 30})
+        self.assertEqual(7, cluster.get_log_retention_days('app-web'))
+        self.assertEqual(30, cluster.get_log_retention_days('app-api'))
+        self.assertEqual(14, cluster.get_log_retention_days('search'))
+
+    def test_single_node(self):
+        self.assertEqual([self.address], self.cluster.addresses)
+        self.assertFalse(self.cluster.sniff)
+
+    def test_multiple_nodes(self):
+        addresses = [self.address, self.faker.ipv4()]
+        cluster = Cluster(self.address, 1, {}, addresses=addresses, sniff=True)
+        self.assertEqual(self.address, cluster.address)
+        self.assertEqual(addresses, cluster.addresses)
+        self.assertTrue(cluster.sniff)
+
+    def test_no_disk_watermark(self):
+        self.assertIsNone(self.cluster.disk_watermark)
+
+    def test_get_log_priority(self):
+        cluster = Cluster(self.address, 1, {}, 85, {self.app_1_name: 5})
+        self.assertEqual(85, cluster.disk_watermark)
+        self.assertEqual(5, cluster.get_log_priority(self.app_1_name))
+        self.assertEqual(0, cluster.get_log_priority(self.missing_app_2_name))
+
+    def test_get_log_tiers(self):
+        default_tiers = [{'action': 'close', 'after_days': 7}]
+        app_tiers = [{'action': 'forcemerge', 'after_days': 1}]
+        cluster = Cluster(self.address, 14, {}, log_tiers=default_tiers,
+                          log_tiers_per_app={self.app_1_name: app_tiers})
+        self.assertTrue(cluster.has_log_tiers)
+        self.assertEqual(app_tiers, cluster.get_log_tiers(self.app_1_name))
+        self.assertEqual(default_tiers,
+                         cluster.get_log_tiers(self.missing_app_2_name))
+        self.assertFalse(self.cluster.has_log_tiers)
+        self.assertEqual([], self.cluster.get_log_tiers(self.app_1_name))
+
 
 class ParseJSONTestCase(unittest.TestCase):
     @classmethod
@@ -44,6 +88,7 @@ class ParseJSONTestCase(unittest.TestCase):
 
     def setUp(self):
         self.address = self.faker.ipv4()
+        self.second_address = self.faker.ipv4()
         self.default_log_retention_days = self.faker.pyint(min_value=10)
         self.app_1_name = self.faker.domain_word()
         self.app_1_log_retention_days = self.default_log_retention_days - 9
@@ -63,7 +108,20 @@ class ParseJSONTestCase(unittest.TestCase):
                 "log_retention_days": {self.default_log_retention_days},
                 "log_retention_days_per_topic": {{
                     "{self.app_1_name}": {self.app_1_log_retention_days}
-                }}
+                }},
+                "ipaddresses": ["{self.address}", "{self.second_address}"],
+                "sniff": true,
+                "disk_watermark": 85,
+                "log_priority_per_topic": {{
+                    "{self.app_1_name}": 5
+                }},
+                "log_tiers": [{{"action": "close", "after_days": 7}}],
+                "log_tiers_per_topic": {{
+                    "{self.app_1_name}": [
+                        {{"action": "forcemerge", "after_days": 1}}
+                    ]
+                }},
+                "index_date_formats": ["daily", "{{year}}{{month}}{{day}}"]
             }}
         ]
         """
@@ -85,6 +143,58 @@ class ParseJSONTestCase(unittest.TestCase):
     def test_parse_json_cluster_2_address(self):
         self.assertEqual(self.clusters[1].address, self.address)
 
+    def test_parse_json_addresses(self):
+        self.assertEqual([self.address], self.clusters[0].addresses)
+        self.assertFalse(self.clusters[0].sniff)
+        self.assertEqual([self.address, self.second_address],
+                         self.clusters[1].addresses)
+        self.assertTrue(self.clusters[1].sniff)
+
+    def test_parse_json_disk_watermark(self):
+        self.assertIsNone(self.clusters[0].disk_watermark)
+        self.assertEqual(85, self.clusters[1].disk_watermark)
+
+    def test_parse_json_log_priority(self):
+        self.assertEqual(5, self.clusters[1].get_log_priority(self.app_1_name))
+
+    def test_parse_json_log_tiers(self):
+        self.assertFalse(self.clusters[0].has_log_tiers)
+        self.assertEqual([{'action': 'close', 'after_days': 7}],
+                         self.clusters[1].log_tiers)
+        self.assertEqual([{'action': 'forcemerge', 'after_days': 1}],
+                         self.clusters[1].get_log_tiers(self.app_1_name))
+
+    def test_parse_json_index_date_formats(self):
+        self.assertIsNone(self.clusters[0].index_date_formats)
+        self.assertIsNone(
+            self.clusters[0].index_name_parser.parse('app-20200102'))
+        self.assertEqual(
+            ('app', '2020.01.02'),
+            self.clusters[1].index_name_parser.parse('app-20200102'))
+
+
+class IterJSONArrayTestCase(unittest.TestCase):
+    def test_single_chunk(self):
+        self.assertEqual([{'a': 1}, {'b': [2]}],
+                         list(iter_json_array(['[{"a": 1}, {"b": [2]}]'])))
+
+    def test_split_chunks(self):
+        data = '[{"a": "x,]"}, {"b": 2}]'
+        chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+        self.assertEqual([{'a': 'x,]'}, {'b': 2}],
+                         list(iter_json_array(chunks)))
+
+    def test_empty(self):
+        self.assertEqual([], list(iter_json_array([' [ ] '])))
+
+    def test_not_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['{}']))
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['[{"a": 1}, {"b"']))
+
 
 class FetchTestCase(unittest.TestCase):
     @classmethod
@@ -94,22 +204,194 @@ class FetchTestCase(unittest.TestCase):
     def setUp(self):
         self.api_url = self.faker.url()
         self.client_key = self.faker.password(length=128)
+        self.etag = f'"{self.faker.sha1()}"'
+        self.profile = [{'ipaddress': self.faker.ipv4()}]
+        self.body = json.dumps(self.profile).encode()
 
-        self.response_json_mock = Mock()
-        self.response_mock = Mock()
-        self.response_mock.json = Mock(return_value=self.response_json_mock)
-        self.requests_get_mock = Mock(return_value=self.response_mock)
+        self.response_mock = MagicMock()
+        self.response_mock.__enter__.return_value = self.response_mock
+        self.response_mock.status_code = 200
+        self.response_mock.headers = {'ETag': self.etag}
+        self.response_mock.iter_content = Mock(
+            side_effect=lambda size: iter([self.body[:5], self.body[5:]]))
+        self.session_mock = Mock()
+        self.session_mock.get = Mock(return_value=self.response_mock)
 
-    def call_target(self):
-        with patch('requests.get', self.requests_get_mock):
-            return fetch(self.api_url, self.client_key)
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.cache_dir.name, 'profile.json')
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def call_target(self, cache_path=None):
+        return list(
+            fetch(self.api_url, self.client_key, self.session_mock,
+                  cache_path))
 
     def test_fetch_url(self):
         self.call_target()
-        self.requests_get_mock.assert_called_with(self.api_url,
-                                                  params=[('client_key',
-                                                           self.client_key)])
+        self.session_mock.get.assert_called_with(
+            self.api_url,
+            params=[('client_key', self.client_key)],
+            headers={},
+            timeout=FETCH_TIMEOUT,
+            stream=True)
 
     def test_fetch_url_json(self):
-        response_json = self.call_target()
-        self.assertEqual(self.response_json_mock, response_json)
+        self.assertEqual(self.profile, self.call_target())
+
+    def test_http_error(self):
+        self.response_mock.raise_for_status.side_effect = (
+            requests.HTTPError(self.faker.sentence()))
+        with self.assertRaises(requests.HTTPError):
+            self.call_target()
+
+    def test_cache_written(self):
+        self.call_target(self.cache_path)
+        with open(self.cache_path, 'rb') as cache_file:
+            self.assertEqual(self.body, cache_file.read())
+        self.assertEqual(self.etag, read_cached_etag(self.cache_path))
+
+    def test_if_none_match(self):
+        self.call_target(self.cache_path)
+        self.call_target(self.cache_path)
+        self.assertEqual(
+            {'If-None-Match': self.etag},
+            self.session_mock.get.call_args.kwargs['headers'])
+
+    def test_not_modified(self):
+        self.call_target(self.cache_path)
+        self.response_mock.status_code = 304
+        self.response_mock.iter_content.side_effect = AssertionError
+        self.assertEqual(self.profile, self.call_target(self.cache_path))
+
+
+class FetchClustersTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faker = Faker()
+
+    def setUp(self):
+        self.address = self.faker.ipv4()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.cache_dir.name, 'profile.json')
+        with open(self.cache_path, 'w') as cache_file:
+            json.dump([{
+                'ipaddress': self.address,
+                'log_retention_days': 7,
+                'log_retention_days_per_topic': {}
+            }], cache_file)
+        self.fetch_mock = Mock(
+            side_effect=requests.ConnectionError(self.faker.sentence()))
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_cache_fallback(self):
+        with patch('barito_curator.metadata.fetch', self.fetch_mock):
+            clusters = fetch_clusters(self.faker.url(), '', self.cache_path)
+        self.assertEqual(self.address, clusters[0].address)
+
+    def test_no_cache(self):
+        with self.assertRaises(requests.ConnectionError):
+            with patch('barito_curator.metadata.fetch', self.fetch_mock):
+                fetch_clusters(self.faker.url(), '')
+
+    def test_shard(self):
+        shard_index = get_shard_index(self.address, 2)
+        with patch('barito_curator.metadata.fetch', self.fetch_mock):
+            owned = fetch_clusters(self.faker.url(), '', self.cache_path,
+                                   Shard(shard_index, 2))
+            other = fetch_clusters(self.faker.url(), '', self.cache_path,
+                                   Shard(1 - shard_index, 2))
+        self.assertEqual([self.address], [cluster.address for cluster in owned])
+        self.assertEqual([], other)
+
+    def test_multiple_markets(self):
+        profiles = {
+            'https://a': [{
+                'ipaddress': self.address,
+                'log_retention_days': 7,
+                'log_retention_days_per_topic': {'app': 3}
+            }],
+            'https://b': [{
+                'ipaddress': self.address,
+                'log_retention_days': 14,
+                'log_retention_days_per_topic': {}
+            }, {
+                'ipaddress': 'other',
+                'log_retention_days': 1,
+                'log_retention_days_per_topic': {}
+            }],
+        }
+        fetch_mock = Mock(
+            side_effect=lambda api_url, *_, **__: iter(profiles[api_url]))
+        with patch('barito_curator.metadata.fetch', fetch_mock):
+            clusters = fetch_clusters('https://a, https://b', 'k1,k2')
+        self.assertEqual([self.address, 'other'],
+                         [cluster.address for cluster in clusters])
+        self.assertEqual(14, clusters[0].get_log_retention_days('app'))
+        fetch_mock.assert_any_call('https://b', 'k2', cache_path=None)
+
+
+class SplitMarketsTestCase(unittest.TestCase):
+    def test_single_market(self):
+        self.assertEqual([('https://a', 'k')], split_markets('https://a', 'k'))
+
+    def test_shared_client_key(self):
+        self.assertEqual([('https://a', 'k'), ('https://b', 'k')],
+                         split_markets('https://a,https://b', 'k'))
+
+    def test_mismatched_client_keys(self):
+        with self.assertRaises(ValueError):
+            split_markets('https://a,https://b,https://c', 'k1,k2')
+
+
+class MergeClustersTestCase(unittest.TestCase):
+    def test_distinct_addresses_untouched(self):
+        clusters = [Cluster('a', 1, {}), Cluster('b', 2, {})]
+        self.assertEqual(clusters, merge_clusters(clusters))
+
+    def test_most_lenient_rules(self):
+        tiers = [{'action': 'close', 'after_days': 3}]
+        cluster = merge_clusters([
+            Cluster('a', 7, {'app-*': 30, 'db': 2}, 80, {'db': 5},
+                    ['a', 'b'], log_tiers=tiers),
+            Cluster('a', 14, {'app-api': 3}, 90, {'app-api': 1}, ['a', 'c'],
+                    True, log_tiers=[])
+        ])[0]
+        self.assertEqual(14, cluster.default_log_retention_days)
+        self.assertEqual({'app-*': 30, 'db': 14, 'app-api': 30},
+                         cluster.log_retention_days_per_app)
+        self.assertEqual(30, cluster.get_log_retention_days('app-api'))
+        self.assertEqual(90, cluster.disk_watermark)
+        self.assertEqual(5, cluster.get_log_priority('db'))
+        self.assertEqual(['a', 'b', 'c'], cluster.addresses)
+        self.assertFalse(cluster.sniff)
+        self.assertFalse(cluster.has_log_tiers)
+
+    def test_overlapping_patterns(self):
+        cluster = merge_clusters([
+            Cluster('a', 3, {'*-api': 30}, log_priority_per_app={'*-api': 1}),
+            Cluster('a', 3, {'payment*': 3},
+                    log_priority_per_app={'payment*': 0})
+        ])[0]
+        self.assertEqual(30, cluster.get_log_retention_days('payment-api'))
+        self.assertEqual(3, cluster.get_log_retention_days('payment-db'))
+        self.assertEqual(3, cluster.get_log_retention_days('search'))
+        self.assertEqual(1, cluster.get_log_priority('payment-api'))
+
+    def test_index_date_formats_combined(self):
+        cluster = merge_clusters([
+            Cluster('a', 1, {}),
+            Cluster('a', 1, {}, index_date_formats=['{year}{month}{day}'])
+        ])[0]
+        self.assertEqual(['daily', 'hourly', 'rollover', 'iso',
+                          '{year}{month}{day}'], cluster.index_date_formats)
+        self.assertEqual(('app', '2020.01.02'),
+                         cluster.index_name_parser.parse('app-20200102'))
+
+    def test_missing_watermark_disables_budget(self):
+        cluster = merge_clusters([Cluster('a', 1, {}, 80),
+                                  Cluster('a', 1, {})])[0]
+        self.assertIsNone(cluster.disk_watermark)
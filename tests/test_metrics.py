@@ -0,0 +1,87 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from faker import Faker
+
+from barito_curator.metrics import (Metrics, count_deleted, count_evaluated,
+                                    count_failure, time_phase)
+
+
+class MetricsTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faker = Faker()
+
+    def setUp(self):
+        self.address = self.faker.ipv4()
+        self.metrics = Metrics()
+        self.patcher = patch('barito_curator.metrics._metrics', self.metrics)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def get_sample(self, name, **labels):
+        return self.metrics.registry.get_sample_value(name, labels)
+
+    def test_time_phase(self):
+        with time_phase(self.address, 'list'):
+            pass
+        self.assertEqual(
+            1,
+            self.get_sample('barito_curator_phase_duration_seconds_count',
+                            cluster=self.address,
+                            phase='list'))
+
+    def test_count_evaluated(self):
+        count_evaluated(self.address, 10, 2)
+        self.assertEqual(
+            10,
+            self.get_sample('barito_curator_indices_evaluated_total',
+                            cluster=self.address))
+        self.assertEqual(
+            2,
+            self.get_sample('barito_curator_indices_unparseable_total',
+                            cluster=self.address))
+
+    def test_count_deleted(self):
+        count_deleted(self.address, 3, 4096)
+        self.assertEqual(
+            3,
+            self.get_sample('barito_curator_indices_deleted_total',
+                            cluster=self.address))
+        self.assertEqual(
+            4096,
+            self.get_sample('barito_curator_freed_bytes_total',
+                            cluster=self.address))
+
+    def test_count_failure(self):
+        count_failure(self.address)
+        self.assertEqual(
+            1,
+            self.get_sample('barito_curator_cluster_failures_total',
+                            cluster=self.address))
+
+    def test_write_textfile(self):
+        count_deleted(self.address, 3, 4096)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'barito_curator.prom')
+            self.metrics.write_textfile(path)
+            with open(path) as textfile:
+                content = textfile.read()
+        self.assertIn(
+            f'barito_curator_indices_deleted_total{{cluster="{self.address}"}} 3.0',
+            content)
+        self.assertIn('barito_curator_last_run_timestamp_seconds', content)
+
+
+class DisabledMetricsTestCase(TestCase):
+    def test_noop(self):
+        with patch('barito_curator.metrics._metrics', None):
+            with time_phase('', 'fetch'):
+                pass
+            count_evaluated('', 1, 0)
+            count_deleted('', 1, 1)
+            count_failure('')
@@ -0,0 +1,140 @@
+import json
+import os
+import tempfile
+from datetime import date
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from faker import Faker
+from freezegun import freeze_time
+
+from barito_curator.metadata import Cluster
+from barito_curator.plan import (apply_cluster_plan, apply_plan,
+                                 build_cluster_plan, read_plan, write_plan)
+
+
+class BuildClusterPlanTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faker = Faker()
+
+    def setUp(self):
+        self.address = self.faker.ipv4()
+        self.cluster = Cluster(self.address, 2, {'app': 1})
+        self.elastic = Mock()
+        self.elastic.cat.indices.return_value = [
+            {'index': name, 'store.size': '1024'} for name in (
+                'app-2020.01.01', 'app-2020.01.03', 'app-2020.01.04',
+                'web-2020.01.01', 'web-2020.01.03', 'test')
+        ]
+        self.logger = Mock()
+
+    @freeze_time(date(2020, 1, 5))
+    def test_groups_expired_indices_by_rule(self):
+        plan = build_cluster_plan(self.logger, self.elastic, self.cluster)
+        self.assertEqual(self.address, plan['address'])
+        self.assertEqual([self.address], plan['addresses'])
+        self.assertEqual([{
+            'topic': 'app',
+            'retention_days': 1,
+            'cutoff': '2020.01.04',
+            'indices': ['app-2020.01.01', 'app-2020.01.03'],
+        }, {
+            'topic': 'web',
+            'retention_days': 2,
+            'cutoff': '2020.01.03',
+            'indices': ['web-2020.01.01'],
+        }], plan['rules'])
+        self.logger.warning.assert_called_once_with(
+            "Unable to check index `test`: No date information in index name")
+
+
+class WritePlanTestCase(TestCase):
+    @freeze_time(date(2020, 1, 5))
+    def test_write_plan(self):
+        clusters = [Cluster('a', 2, {}), Cluster('b', 2, {})]
+        elastic = Mock()
+        elastic.cat.indices.return_value = [
+            {'index': 'app-2020.01.01', 'store.size': '1024'}]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'plan.jsonl')
+            with patch('barito_curator.plan.fetch_clusters',
+                       return_value=clusters), \
+                    patch('barito_curator.plan.connect_to_elasticsearch',
+                          return_value=elastic):
+                write_plan(Mock(), 'url', 'key', path)
+            with open(path) as plan_file:
+                lines = plan_file.read().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertNotIn(' ', lines[0])
+        plans = sorted((json.loads(line) for line in lines),
+                       key=lambda plan: plan['address'])
+        self.assertEqual(['a', 'b'], [plan['address'] for plan in plans])
+        self.assertEqual(['app-2020.01.01'], plans[0]['rules'][0]['indices'])
+
+    def test_skips_failed_cluster(self):
+        logger = Mock()
+        child_logger = logger.getChild.return_value
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'plan.jsonl')
+            with patch('barito_curator.plan.fetch_clusters',
+                       return_value=[Cluster('a', 2, {})]), \
+                    patch('barito_curator.plan.connect_to_elasticsearch',
+                          side_effect=ConnectionError('down')):
+                write_plan(logger, 'url', 'key', path)
+            self.assertEqual([], list(read_plan(path)))
+        child_logger.warning.assert_called_once_with(
+            "Unable to plan expired indices: down")
+
+
+class ApplyClusterPlanTestCase(TestCase):
+    def setUp(self):
+        self.cluster_plan = {
+            'address': 'a',
+            'rules': [{
+                'topic': 'app',
+                'retention_days': 1,
+                'cutoff': '2020.01.04',
+                'indices': ['app-2020.01.01', 'app-2020.01.02'],
+            }],
+        }
+        self.elastic = Mock()
+        self.elastic.indices.get_alias.return_value = {'app-2020.01.02': {}}
+        self.elastic.cluster.pending_tasks.return_value = {'tasks': []}
+        self.logger = Mock()
+
+    def test_deletes_existing_indices_only(self):
+        deleted = apply_cluster_plan(self.logger, self.elastic,
+                                     self.cluster_plan, 10)
+        self.assertEqual(['app-2020.01.02'], deleted)
+        self.elastic.cat.indices.assert_not_called()
+        self.elastic.indices.get_alias.assert_called_once_with(
+            index='app-2020.01.01,app-2020.01.02', ignore_unavailable=True)
+        self.elastic.indices.delete.assert_called_once_with(
+            index='app-2020.01.02',
+            master_timeout='10s',
+            ignore_unavailable=True)
+
+    def test_dry_run(self):
+        deleted = apply_cluster_plan(self.logger, self.elastic,
+                                     self.cluster_plan, 10, dry_run=True)
+        self.assertEqual([], deleted)
+        self.elastic.indices.delete.assert_not_called()
+
+    def test_records_state(self):
+        state = Mock()
+        apply_cluster_plan(self.logger, self.elastic, self.cluster_plan, 10,
+                           state=state)
+        state.record_deleted.assert_called_once_with('a', ['app-2020.01.02'])
+
+    def test_apply_plan(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'plan.jsonl')
+            with open(path, 'w') as plan_file:
+                plan_file.write(json.dumps(self.cluster_plan) + '\n\n')
+            with patch('barito_curator.plan.connect_to_elasticsearch',
+                       return_value=self.elastic) as connect:
+                apply_plan(self.logger, path, 10)
+        connect.assert_called_once_with(['a'])
+        self.elastic.indices.delete.assert_called_once()
+
@@ -0,0 +1,77 @@
+import json
+import os
+import pstats
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from barito_curator.metrics import time_phase
+from barito_curator.profiling import Profiler, trace_span
+
+
+class ProfilerTestCase(TestCase):
+    def setUp(self):
+        self.profiler = Profiler(cprofile=True)
+        self.patcher = patch('barito_curator.profiling._profiler',
+                             self.profiler)
+        self.patcher.start()
+        self.trace_dir = tempfile.TemporaryDirectory()
+        self.trace_path = os.path.join(self.trace_dir.name, 'trace.json')
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.trace_dir.cleanup()
+
+    def record_sweeps(self):
+        with time_phase('', 'fetch'):
+            pass
+        for address in ('a', 'b'):
+            with trace_span('sweep', address, 'cluster'):
+                with time_phase(address, 'list'):
+                    pass
+                with time_phase(address, 'filter'):
+                    sorted(range(1000))
+
+    def test_trace_file(self):
+        self.record_sweeps()
+        self.profiler.write(self.trace_path)
+        with open(self.trace_path) as trace_file:
+            events = json.load(trace_file)['traceEvents']
+
+        lanes = {
+            event['args']['name']: event['tid']
+            for event in events if event['ph'] == 'M'
+        }
+        self.assertEqual({'Barito Market', 'a', 'b'}, set(lanes))
+        spans = [(event['name'], event['tid']) for event in events
+                 if event['ph'] == 'X']
+        self.assertEqual([('fetch', lanes['Barito Market']),
+                          ('list', lanes['a']), ('filter', lanes['a']),
+                          ('sweep', lanes['a']), ('list', lanes['b']),
+                          ('filter', lanes['b']), ('sweep', lanes['b'])],
+                         spans)
+        stats = pstats.Stats(f"{self.trace_path}.prof")
+        self.assertTrue(stats.total_calls > 0)
+
+    def test_summary(self):
+        self.record_sweeps()
+        slowest_clusters, slowest_phases = self.profiler.summarize()
+        self.assertEqual({'a', 'b'},
+                         {address for address, _ in slowest_clusters})
+        self.assertEqual({'fetch', 'list', 'filter'},
+                         {phase for phase, _ in slowest_phases})
+        logger = Mock()
+        self.profiler.log_summary(logger)
+        self.assertEqual(2, logger.info.call_count)
+
+    def test_nested_spans_counted_once(self):
+        self.profiler.record('sweep', 'cluster', 'a', 10, 5)
+        self.profiler.record('list', 'phase', 'a', 11, 2)
+        self.profiler.record('sample', 'phase', 'a', 20, 1)
+        self.assertEqual([('a', 6)], self.profiler.summarize()[0])
+
+
+class DisabledProfilingTestCase(TestCase):
+    def test_trace_span_without_profiler(self):
+        with trace_span('list', 'a'):
+            pass
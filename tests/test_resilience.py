@@ -0,0 +1,122 @@
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock, Mock, patch
+
+from elasticsearch import ConnectionTimeout, NotFoundError, TransportError
+
+from barito_curator.resilience import (CircuitBreaker, ClusterGuard,
+                                       DeadlineExceeded, ResiliencePolicy,
+                                       is_retryable)
+from barito_curator.state import StateStore
+
+
+class IsRetryableTestCase(TestCase):
+    def test_connection_errors(self):
+        self.assertTrue(is_retryable(ConnectionTimeout('TIMEOUT', 'x', None)))
+        self.assertTrue(is_retryable(ConnectionError('reset')))
+
+    def test_status_codes(self):
+        self.assertTrue(is_retryable(TransportError(503, 'unavailable')))
+        self.assertTrue(is_retryable(TransportError(429, 'rejected')))
+        self.assertFalse(is_retryable(NotFoundError(404, 'missing')))
+
+    def test_other_errors(self):
+        self.assertFalse(is_retryable(ValueError()))
+
+
+class ClusterGuardTestCase(TestCase):
+    def test_unbounded(self):
+        guard = ClusterGuard()
+        self.assertIsNone(guard.request_timeout())
+        self.assertEqual({'master_timeout': '3600s'},
+                         guard.build_delete_params(3600))
+
+    def test_delete_params_bounded_by_deadline(self):
+        params = ClusterGuard(60).build_delete_params(3600)
+        self.assertIn(params['master_timeout'], ('59s', '60s'))
+        self.assertLessEqual(params['request_timeout'], 60)
+
+    def test_check_expired(self):
+        with self.assertRaises(DeadlineExceeded):
+            ClusterGuard(0).check('list')
+
+    def test_retries_retryable_errors(self):
+        func = Mock(side_effect=[ConnectionError('reset'), 'ok'])
+        with patch('barito_curator.resilience.time.sleep') as sleep:
+            self.assertEqual('ok',
+                             ClusterGuard(60, 3).call('list', func, 'a'))
+        func.assert_called_with('a')
+        sleep.assert_called_once()
+        self.assertLessEqual(sleep.call_args.args[0], 1)
+
+    def test_bounded_attempts(self):
+        func = Mock(side_effect=ConnectionError('reset'))
+        with patch('barito_curator.resilience.time.sleep'):
+            with self.assertRaises(ConnectionError):
+                ClusterGuard(60, 3).call('list', func)
+        self.assertEqual(3, func.call_count)
+
+    def test_no_retry_for_other_errors(self):
+        func = Mock(side_effect=ValueError())
+        with self.assertRaises(ValueError):
+            ClusterGuard(60, 3).call('list', func)
+        self.assertEqual(1, func.call_count)
+
+    def test_no_retry_past_deadline(self):
+        func = Mock(side_effect=ConnectionError('reset'))
+        with self.assertRaises(ConnectionError):
+            ClusterGuard(0.1, 3, backoff_factor=10).call('list', func)
+        self.assertEqual(1, func.call_count)
+
+
+class ClusterGuardAsyncTestCase(IsolatedAsyncioTestCase):
+    async def test_retries_retryable_errors(self):
+        func = AsyncMock(side_effect=[ConnectionError('reset'), 'ok'])
+        guard = ClusterGuard(60, 3, backoff_factor=0)
+        self.assertEqual('ok', await guard.call_async('list', func))
+        self.assertEqual(2, func.await_count)
+
+
+class CircuitBreakerTestCase(TestCase):
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+        breaker.record_failure('a', 100)
+        self.assertFalse(breaker.is_open('a', 101))
+        breaker.record_failure('a', 100)
+        self.assertTrue(breaker.is_open('a', 101))
+        self.assertFalse(breaker.is_open('b', 101))
+
+    def test_closes_after_cooldown(self):
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=60)
+        breaker.record_failure('a', 100)
+        self.assertFalse(breaker.is_open('a', 160))
+
+    def test_success_resets(self):
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=60)
+        breaker.record_failure('a', 100)
+        breaker.record_success('a')
+        self.assertFalse(breaker.is_open('a', 101))
+
+    def test_persisted_in_state(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'state.db')
+            state = StateStore(path)
+            CircuitBreaker(state, failure_threshold=1).record_failure('a', 100)
+            state.close()
+            state = StateStore(path)
+            self.assertTrue(
+                CircuitBreaker(state, failure_threshold=1).is_open('a', 101))
+            state.close()
+
+
+class ResiliencePolicyTestCase(TestCase):
+    def test_without_breaker(self):
+        policy = ResiliencePolicy()
+        policy.record_failure('a')
+        self.assertTrue(policy.allows('a'))
+
+    def test_with_breaker(self):
+        policy = ResiliencePolicy(breaker=CircuitBreaker(failure_threshold=1))
+        policy.record_failure('a')
+        self.assertFalse(policy.allows('a'))
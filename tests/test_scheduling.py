@@ -0,0 +1,58 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+from barito_curator.metadata import Cluster
+from barito_curator.scheduling import (ClusterSample, get_disk_headroom,
+                                       schedule_samples)
+
+
+def build_sample(address, disk_used, overdue_count=0, status='green',
+                 disk_watermark=None, disk_total=1000):
+    return ClusterSample(Cluster(address, 1, {}, disk_watermark), status,
+                         disk_used, disk_total, overdue_count, 0)
+
+
+class GetDiskHeadroomTestCase(TestCase):
+    def test_default_watermark(self):
+        self.assertAlmostEqual(0.4, get_disk_headroom(build_sample('a', 500)))
+
+    def test_cluster_watermark(self):
+        self.assertAlmostEqual(
+            -0.1, get_disk_headroom(build_sample('a', 900, disk_watermark=80)))
+
+    def test_unknown_disk_total(self):
+        self.assertAlmostEqual(
+            0.9, get_disk_headroom(build_sample('a', 0, disk_total=0)))
+
+
+class ScheduleSamplesTestCase(TestCase):
+    def setUp(self):
+        self.logger_mock = Mock()
+
+    def schedule(self, samples):
+        return [
+            sample.cluster.address
+            for sample in schedule_samples(self.logger_mock, samples)
+        ]
+
+    def test_closest_to_watermark_first(self):
+        self.assertEqual(['c', 'b', 'a'], self.schedule([
+            build_sample('a', 100),
+            build_sample('b', 700, disk_watermark=80),
+            build_sample('c', 850),
+        ]))
+
+    def test_overdue_breaks_ties(self):
+        self.assertEqual(['b', 'a'], self.schedule([
+            build_sample('a', 100, overdue_count=1),
+            build_sample('b', 100, overdue_count=5),
+        ]))
+
+    def test_skips_red(self):
+        self.assertEqual(['a'], self.schedule([
+            build_sample('a', 100),
+            build_sample('b', 950, status='red'),
+        ]))
+        self.logger_mock.getChild.assert_called_once_with("Cluster `b`")
+        self.logger_mock.getChild.return_value.warning.assert_called_once_with(
+            "Skipping cluster: health is red")
@@ -0,0 +1,41 @@
+from collections import Counter
+from unittest import TestCase
+
+from barito_curator.metadata import Cluster
+from barito_curator.sharding import Shard, get_shard_index
+
+ADDRESSES = [f"10.0.{i // 256}.{i % 256}" for i in range(1000)]
+
+
+class GetShardIndexTestCase(TestCase):
+    def test_stable(self):
+        self.assertEqual([get_shard_index(address, 4) for address in ADDRESSES],
+                         [get_shard_index(address, 4) for address in ADDRESSES])
+
+    def test_balanced(self):
+        counts = Counter(get_shard_index(address, 4) for address in ADDRESSES)
+        self.assertEqual(4, len(counts))
+        for count in counts.values():
+            self.assertTrue(200 < count < 300, counts)
+
+    def test_adding_a_shard_moves_few_clusters(self):
+        moved = [
+            address for address in ADDRESSES
+            if get_shard_index(address, 4) != get_shard_index(address, 5)
+        ]
+        self.assertLess(len(moved), 300)
+        for address in moved:
+            self.assertEqual(4, get_shard_index(address, 5))
+
+
+class ShardTestCase(TestCase):
+    def test_shards_partition_clusters(self):
+        clusters = [Cluster(address, 1, {}) for address in ADDRESSES[:50]]
+        selected = [Shard(index, 3).select(clusters) for index in range(3)]
+        self.assertEqual(sorted(ADDRESSES[:50]),
+                         sorted(cluster.address for shard_clusters in selected
+                                for cluster in shard_clusters))
+
+    def test_invalid_index(self):
+        with self.assertRaises(ValueError):
+            Shard(3, 3)
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def run_python(code):
+    return subprocess.run([sys.executable, '-c', code],
+                          cwd=ROOT,
+                          stdout=subprocess.PIPE,
+                          check=True,
+                          text=True).stdout.split()
+
+
+class StartupTestCase(TestCase):
+    def test_import_loads_no_heavy_dependency(self):
+        loaded = run_python("""
+import sys
+import barito_curator
+for module in ('aiohttp', 'curator', 'elasticsearch', 'requests'):
+    if module in sys.modules:
+        print(module)
+""")
+        self.assertEqual([], loaded)
+
+    def test_dry_run_does_not_import_curator(self):
+        loaded = run_python("""
+import sys
+from unittest.mock import Mock
+from barito_curator.metadata import Cluster
+from barito_curator.utils import delete_expired_indices_with_client
+elastic = Mock()
+elastic.cat.indices.return_value = [{'index': 'app-2020.01.01',
+                                     'store.size': '1024'}]
+delete_expired_indices_with_client(Mock(), elastic, Cluster('a', 1, {}), 10,
+                                   dry_run=True)
+print('curator' in sys.modules)
+""")
+        self.assertEqual(['False'], loaded)
@@ -0,0 +1,130 @@
+import os
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import Mock
+
+from faker import Faker
+
+from barito_curator.metadata import Cluster
+from barito_curator.state import StateStore, build_retention_fingerprint
+
+
+class BuildRetentionFingerprintTestCase(TestCase):
+    def test_same_settings(self):
+        self.assertEqual(
+            build_retention_fingerprint(Cluster('a', 7, {'x': 1, 'y': 2})),
+            build_retention_fingerprint(Cluster('b', 7, {'y': 2, 'x': 1})))
+
+    def test_changed_settings(self):
+        self.assertNotEqual(
+            build_retention_fingerprint(Cluster('a', 7, {'x': 1})),
+            build_retention_fingerprint(Cluster('a', 7, {'x': 2})))
+
+    def test_changed_index_date_formats(self):
+        self.assertNotEqual(
+            build_retention_fingerprint(Cluster('a', 7, {})),
+            build_retention_fingerprint(
+                Cluster('a', 7, {}, index_date_formats=['daily'])))
+
+
+class StateStoreTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faker = Faker()
+
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.state = StateStore(os.path.join(self.state_dir.name, 'state.db'))
+        self.address = self.faker.ipv4()
+        self.cluster = Cluster(self.address, 2, {})
+        self.now = datetime(2020, 1, 5)
+
+    def tearDown(self):
+        self.state.close()
+        self.state_dir.cleanup()
+
+    def test_first_run(self):
+        classification = self.state.classify(
+            self.cluster, ['app-2020.01.02', 'app-2020.01.03', 'app'],
+            self.now)
+        self.assertEqual({'app-2020.01.02'}, classification.expired)
+        self.assertEqual({'app-2020.01.03'}, classification.kept)
+        self.assertEqual({'app'}, classification.unparseable)
+
+    def test_impossible_date_unparseable(self):
+        classification = self.state.classify(self.cluster, ['app-2020.02.30'],
+                                             self.now)
+        self.assertEqual({'app-2020.02.30'}, classification.unparseable)
+        self.assertEqual({'app-2020.02.30': None},
+                         self.state.get_known_indices(self.cluster))
+
+    def test_known_index_expires(self):
+        self.state.classify(self.cluster, ['app-2020.01.03'], self.now)
+        classification = self.state.classify(self.cluster, ['app-2020.01.03'],
+                                             datetime(2020, 1, 5, 1))
+        self.assertEqual({'app-2020.01.03'}, classification.expired)
+
+    def test_known_index_not_reevaluated(self):
+        cluster_mock = Mock(wraps=self.cluster)
+        cluster_mock.address = self.address
+        cluster_mock.default_log_retention_days = 2
+        cluster_mock.log_retention_days_per_app = {}
+        cluster_mock.index_date_formats = None
+        self.state.classify(cluster_mock, ['app-2020.01.03'], self.now)
+        cluster_mock.get_log_retention_days.reset_mock()
+        self.state.classify(cluster_mock, ['app-2020.01.03'], self.now)
+        self.assertFalse(cluster_mock.get_log_retention_days.called)
+
+    def test_known_unparseable_not_reported(self):
+        self.state.classify(self.cluster, ['app'], self.now)
+        self.assertEqual(
+            set(),
+            self.state.classify(self.cluster, ['app'], self.now).unparseable)
+
+    def test_known_unparseable_reevaluated(self):
+        self.state.save_indices(self.cluster, self.now, {}, [],
+                                {'app-2020-01-02': None})
+        classification = self.state.classify(self.cluster, ['app-2020-01-02'],
+                                             self.now)
+        self.assertEqual({'app-2020-01-02'}, classification.expired)
+        self.assertEqual({'app-2020-01-02': '2020.01.04'},
+                         self.state.get_known_indices(self.cluster))
+
+    def test_retention_change_reevaluates(self):
+        self.state.classify(self.cluster, ['app-2020.01.03'], self.now)
+        classification = self.state.classify(Cluster(self.address, 1, {}),
+                                             ['app-2020.01.03'], self.now)
+        self.assertEqual({'app-2020.01.03'}, classification.expired)
+
+    def test_vanished_index_forgotten(self):
+        self.state.classify(self.cluster, ['app-2020.01.02'], self.now)
+        self.state.classify(self.cluster, [], self.now)
+        self.assertEqual({}, self.state.get_known_indices(self.cluster))
+
+    def test_record_deleted(self):
+        self.state.classify(self.cluster, ['app-2020.01.02'], self.now)
+        self.state.record_deleted(self.address, ['app-2020.01.02'], self.now)
+        self.assertEqual({}, self.state.get_known_indices(self.cluster))
+
+    def test_cluster_failures(self):
+        self.assertIsNone(self.state.get_cluster_failures(self.address))
+        self.state.record_cluster_failure(self.address, 100.0)
+        self.state.record_cluster_failure(self.address, 200.0)
+        self.assertEqual((2, 200.0),
+                         self.state.get_cluster_failures(self.address))
+        self.state.clear_cluster_failures(self.address)
+        self.assertIsNone(self.state.get_cluster_failures(self.address))
+
+    def test_tier_actions(self):
+        self.state.record_tier_actions(self.address, 'forcemerge',
+                                       ['app-2020.01.02', 'app-2020.01.03'])
+        self.state.record_tier_actions(self.address, 'close',
+                                       ['app-2020.01.02'])
+        self.assertEqual(
+            {'app-2020.01.02': {'forcemerge', 'close'},
+             'app-2020.01.03': {'forcemerge'}},
+            self.state.get_tier_actions(self.address))
+        self.state.record_deleted(self.address, ['app-2020.01.02'], self.now)
+        self.assertEqual({'app-2020.01.03': {'forcemerge'}},
+                         self.state.get_tier_actions(self.address))
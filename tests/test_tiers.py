@@ -0,0 +1,239 @@
+import asyncio
+import os
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import AsyncMock, Mock
+
+from elasticsearch import TransportError
+
+from barito_curator.metadata import Cluster
+from barito_curator.resilience import ClusterGuard
+from barito_curator.state import StateStore
+from barito_curator.tiers import (apply_tier_actions, apply_tier_actions_async,
+                                  build_tier_requests, parse_done_tier_actions,
+                                  select_tier_actions)
+
+NOW = datetime(2020, 1, 10, 12)
+
+
+class SelectTierActionsTestCase(TestCase):
+    def setUp(self):
+        self.cluster = Cluster(
+            'a', 30, {},
+            log_tiers=[{'action': 'forcemerge', 'after_days': 2},
+                       {'action': 'close', 'after_days': 7}],
+            log_tiers_per_app={'audit-*': [{'action': 'read_only',
+                                            'after_days': 1}]})
+
+    def test_tiers_by_age(self):
+        self.assertEqual(
+            {'forcemerge': ['app-2020.01.05', 'app-2020.01.08'],
+             'close': ['app-2020.01.01']},
+            select_tier_actions(self.cluster, [
+                'app-2020.01.01', 'app-2020.01.05', 'app-2020.01.08',
+                'app-2020.01.09', 'app'
+            ], now=NOW))
+
+    def test_per_topic_tiers(self):
+        self.assertEqual({'read_only': ['audit-api-2020.01.09']},
+                         select_tier_actions(self.cluster,
+                                             ['audit-api-2020.01.09'],
+                                             now=NOW))
+
+    def test_hourly_indices(self):
+        self.assertEqual({'forcemerge': ['app-2020.01.08.11']},
+                         select_tier_actions(
+                             self.cluster,
+                             ['app-2020.01.08.11', 'app-2020.01.08.12'],
+                             now=NOW))
+
+    def test_skips_done_actions(self):
+        self.assertEqual({},
+                         select_tier_actions(self.cluster,
+                                             ['app-2020.01.01',
+                                              'app-2020.01.05'],
+                                             {'app-2020.01.01': {'close'},
+                                              'app-2020.01.05':
+                                              {'forcemerge'}}, NOW))
+
+    def test_ignores_unknown_actions(self):
+        cluster = Cluster('a', 30, {},
+                          log_tiers=[{'action': 'shrink', 'after_days': 1}])
+        self.assertEqual({}, select_tier_actions(cluster, ['app-2020.01.01'],
+                                                 now=NOW))
+
+
+class BuildTierRequestsTestCase(TestCase):
+    def test_merges_one_index_per_request(self):
+        self.assertEqual(
+            [('forcemerge', ['a-2020.01.01']),
+             ('forcemerge', ['a-2020.01.02']),
+             ('close', ['a-2020.01.03', 'a-2020.01.04'])],
+            build_tier_requests({
+                'forcemerge': ['a-2020.01.01', 'a-2020.01.02'],
+                'close': ['a-2020.01.03', 'a-2020.01.04']
+            }))
+
+
+class ParseDoneTierActionsTestCase(TestCase):
+    def test_done_actions(self):
+        self.assertEqual(
+            {'a-2020.01.01': {'forcemerge', 'read_only', 'close'},
+             'a-2020.01.02': {'forcemerge', 'read_only'},
+             'a-2020.01.03': set()},
+            parse_done_tier_actions(
+                [{'index': 'a-2020.01.01', 'status': 'close'},
+                 {'index': 'a-2020.01.02', 'status': 'open'},
+                 {'index': 'a-2020.01.03', 'status': 'open'}],
+                {'a-2020.01.02': {'settings': {
+                    'index.blocks.write': 'true',
+                    'index.number_of_shards': '2'}},
+                 'a-2020.01.03': {'settings': {
+                     'index.number_of_shards': '2'}}},
+                {'indices': {
+                    'a-2020.01.02': {'primaries': {'segments': {'count': 2}}},
+                    'a-2020.01.03': {'primaries': {'segments': {'count': 9}}}
+                }}))
+
+
+class ApplyTierActionsTestCase(TestCase):
+    def setUp(self):
+        self.logger = Mock()
+        self.elastic = Mock()
+        self.cluster = Cluster(
+            'a', 30, {},
+            log_tiers=[{'action': 'forcemerge', 'after_days': 2},
+                       {'action': 'read_only', 'after_days': 2},
+                       {'action': 'close', 'after_days': 7}])
+        self.index_names = ['app-2020.01.01', 'app-2020.01.05']
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.state = StateStore(os.path.join(self.state_dir.name, 'state.db'))
+
+    def tearDown(self):
+        self.state.close()
+        self.state_dir.cleanup()
+
+    def test_applies_and_records(self):
+        applied = apply_tier_actions(self.logger, self.elastic, self.cluster,
+                                     self.index_names, state=self.state,
+                                     now=NOW)
+        self.assertEqual(
+            {'forcemerge': ['app-2020.01.05'],
+             'read_only': ['app-2020.01.05'],
+             'close': ['app-2020.01.01']}, applied)
+        self.elastic.indices.forcemerge.assert_called_once_with(
+            index='app-2020.01.05', max_num_segments=1)
+        self.elastic.indices.put_settings.assert_called_once_with(
+            index='app-2020.01.05', body={'index.blocks.write': True})
+        self.elastic.indices.close.assert_called_once_with(
+            index='app-2020.01.01')
+
+        self.elastic.reset_mock()
+        self.assertEqual({},
+                         apply_tier_actions(self.logger, self.elastic,
+                                            self.cluster, self.index_names,
+                                            state=self.state, now=NOW))
+        self.elastic.indices.forcemerge.assert_not_called()
+
+    def test_failed_action_retried_next_run(self):
+        self.elastic.indices.close.side_effect = TransportError(500, 'error')
+        applied = apply_tier_actions(self.logger, self.elastic, self.cluster,
+                                     ['app-2020.01.01'], state=self.state,
+                                     now=NOW)
+        self.assertEqual({}, applied)
+        self.assertEqual({}, self.state.get_tier_actions('a'))
+        self.logger.warning.assert_called_once()
+
+    def set_tier_status(self, elastic, closed=False, blocked=False,
+                        segment_count=5):
+        elastic.cat.indices.return_value = [
+            {'index': 'app-2020.01.01',
+             'status': 'close' if closed else 'open'},
+            {'index': 'app-2020.01.05', 'status': 'open'}]
+        elastic.indices.get_settings.return_value = {
+            'app-2020.01.05': {'settings': {
+                'index.blocks.write': 'true' if blocked else 'false',
+                'index.number_of_shards': '1'}}}
+        elastic.indices.stats.return_value = {'indices': {
+            'app-2020.01.05': {'primaries': {
+                'segments': {'count': segment_count}}}}}
+
+    def test_reads_status_without_state(self):
+        self.set_tier_status(self.elastic, closed=True, blocked=True)
+        self.assertEqual({'forcemerge': ['app-2020.01.05']},
+                         apply_tier_actions(self.logger, self.elastic,
+                                            self.cluster, self.index_names,
+                                            now=NOW))
+        self.elastic.cat.indices.assert_called_once_with(
+            index='app-2020.01.01,app-2020.01.05', h='index,status',
+            format='json')
+        self.elastic.indices.stats.assert_called_once_with(
+            index='app-2020.01.05', metric='segments')
+        self.elastic.indices.put_settings.assert_not_called()
+        self.elastic.indices.close.assert_not_called()
+
+    def test_nothing_left_without_state(self):
+        self.set_tier_status(self.elastic, closed=True, blocked=True,
+                             segment_count=1)
+        self.assertEqual({},
+                         apply_tier_actions(self.logger, self.elastic,
+                                            self.cluster, self.index_names,
+                                            now=NOW))
+        self.elastic.indices.forcemerge.assert_not_called()
+
+    def test_status_unavailable(self):
+        self.elastic.cat.indices.side_effect = TransportError(500, 'error')
+        self.assertEqual({},
+                         apply_tier_actions(self.logger, self.elastic,
+                                            self.cluster, self.index_names,
+                                            now=NOW))
+        self.elastic.indices.close.assert_not_called()
+        self.logger.warning.assert_called_once()
+
+    def test_dry_run(self):
+        self.set_tier_status(self.elastic)
+        self.assertEqual({},
+                         apply_tier_actions(self.logger, self.elastic,
+                                            self.cluster, self.index_names,
+                                            dry_run=True, now=NOW))
+        self.elastic.indices.close.assert_not_called()
+        self.logger.info.assert_any_call(
+            "DRY-RUN: close index `app-2020.01.01`")
+
+    def test_deadline_reached(self):
+        self.assertEqual({},
+                         apply_tier_actions(self.logger, self.elastic,
+                                            self.cluster, self.index_names,
+                                            guard=ClusterGuard(0), now=NOW))
+        self.elastic.indices.close.assert_not_called()
+
+    def test_async(self):
+        elastic = Mock()
+        elastic.indices.forcemerge = AsyncMock()
+        elastic.indices.put_settings = AsyncMock()
+        elastic.indices.close = AsyncMock()
+        applied = asyncio.run(
+            apply_tier_actions_async(self.logger, elastic, self.cluster,
+                                     self.index_names, state=self.state,
+                                     now=NOW))
+        self.assertEqual(['app-2020.01.01'], applied['close'])
+        elastic.indices.close.assert_awaited_once_with(index='app-2020.01.01')
+        self.assertEqual({'app-2020.01.01': {'close'},
+                          'app-2020.01.05': {'forcemerge', 'read_only'}},
+                         self.state.get_tier_actions('a'))
+
+    def test_async_reads_status_without_state(self):
+        elastic = Mock()
+        self.set_tier_status(elastic, blocked=True, segment_count=1)
+        for method in (elastic.cat.indices, elastic.indices.get_settings,
+                       elastic.indices.stats):
+            method.side_effect = AsyncMock(return_value=method.return_value)
+        elastic.indices.close = AsyncMock()
+        self.assertEqual({'close': ['app-2020.01.01']},
+                         asyncio.run(
+                             apply_tier_actions_async(self.logger, elastic,
+                                                      self.cluster,
+                                                      self.index_names,
+                                                      now=NOW)))
+        elastic.indices.close.assert_awaited_once_with(index='app-2020.01.01')
@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+from barito_curator.topics import (TopicMatcher, count_literal_characters,
+                                   is_glob, translate_glob)
+
+
+class TranslateGlobTestCase(TestCase):
+    def test_wildcards(self):
+        self.assertEqual('app\\-.*', translate_glob('app-*'))
+        self.assertEqual('a.c', translate_glob('a?c'))
+
+    def test_character_classes(self):
+        self.assertEqual('[abc]x', translate_glob('[abc]x'))
+        self.assertEqual('[^abc]x', translate_glob('[!abc]x'))
+        self.assertEqual('\\[x', translate_glob('[x'))
+
+    def test_is_glob(self):
+        self.assertTrue(is_glob('app-*'))
+        self.assertFalse(is_glob('app'))
+
+    def test_count_literal_characters(self):
+        self.assertEqual(4, count_literal_characters('app-*'))
+        self.assertEqual(2, count_literal_characters('a?c[de]'))
+
+
+class TopicMatcherTestCase(TestCase):
+    def setUp(self):
+        self.matcher = TopicMatcher(
+            {
+                'payment-*': 30,
+                'payment-api': 90,
+                'payment-api-*': 60,
+                '*-debug': 1,
+                'payment-*-debug': 3,
+                'log-?': 5,
+            }, 7)
+
+    def test_exact_wins(self):
+        self.assertEqual(90, self.matcher.match('payment-api'))
+
+    def test_longest_prefix_wins(self):
+        self.assertEqual(60, self.matcher.match('payment-api-v2'))
+        self.assertEqual(30, self.matcher.match('payment-web'))
+
+    def test_most_literal_characters_win(self):
+        self.assertEqual(3, self.matcher.match('payment-web-debug'))
+        self.assertEqual(1, self.matcher.match('search-debug'))
+        # `payment-*-debug` has more literal characters than `payment-api-*`.
+        self.assertEqual(3, self.matcher.match('payment-api-debug'))
+
+    def test_single_character(self):
+        self.assertEqual(5, self.matcher.match('log-a'))
+        self.assertEqual(7, self.matcher.match('log-ab'))
+
+    def test_default(self):
+        self.assertEqual(7, self.matcher.match('search'))
+
+    def test_tie_goes_to_first_rule(self):
+        matcher = TopicMatcher({'a*': 1, '*a': 2}, 0)
+        self.assertEqual(1, matcher.match('aa'))
+        matcher = TopicMatcher({'*a': 2, 'a*': 1}, 0)
+        self.assertEqual(2, matcher.match('aa'))
+
+    def test_memoized(self):
+        self.assertEqual(self.matcher.match('payment-web'),
+                         self.matcher.match('payment-web'))
+
+    def test_empty(self):
+        self.assertEqual(7, TopicMatcher({}, 7).match('app'))
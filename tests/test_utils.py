@@ -1,16 +1,24 @@
+import time
 from datetime import date
 from unittest import TestCase
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
 
-from elasticsearch import ElasticsearchException
+from elasticsearch import TransportError
 from faker import Faker
 from freezegun import freeze_time
 
+from barito_curator.expiry import IndexClassification
+from barito_curator.metadata import Cluster
+from barito_curator.resilience import CircuitBreaker, ResiliencePolicy
+from barito_curator.scheduling import ClusterSample
 from barito_curator.utils import (build_delete_action_for_expired_indices,
                                   connect_to_elasticsearch,
-                                  delete_expired_indices,
                                   delete_expired_indices_in_clusters,
-                                  filter_expired_indices, is_index_expired)
+                                  delete_expired_indices_in_sample,
+                                  delete_expired_indices_with_client,
+                                  delete_indices, filter_expired_index_names,
+                                  filter_expired_indices, is_index_expired,
+                                  list_indices, sample_cluster)
 
 
 class IsIndexExpiredTestCase(TestCase):
@@ -147,19 +155,34 @@ class ConnectToElasticSearchTestCase(TestCase):
         self.es_mock = self.build_es_mock(self.es_connection_mock)
 
     def test_init_call(self):
-        with patch('barito_curator.utils.Elasticsearch', self.es_mock):
+        with patch('elasticsearch.Elasticsearch', self.es_mock):
             connect_to_elasticsearch(self.address)
-        self.es_mock.assert_called_once_with(self.address, timeout=300)
+        self.es_mock.assert_called_once_with([self.address],
+                                             timeout=300,
+                                             max_retries=0,
+                                             http_compress=True)
+
+    def test_multiple_nodes_with_sniffing(self):
+        addresses = [self.address, self.faker.ipv4()]
+        with patch('elasticsearch.Elasticsearch', self.es_mock):
+            connect_to_elasticsearch(addresses, 60, sniff=True)
+        self.es_mock.assert_called_once_with(addresses,
+                                             timeout=60,
+                                             max_retries=1,
+                                             http_compress=True,
+                                             sniff_on_start=True,
+                                             sniff_on_connection_fail=True,
+                                             sniffer_timeout=60)
 
     def test_return(self):
-        with patch('barito_curator.utils.Elasticsearch', self.es_mock):
+        with patch('elasticsearch.Elasticsearch', self.es_mock):
             elastic = connect_to_elasticsearch(self.address)
         self.assertEqual(self.es_connection_mock, elastic)
 
     def test_unpingable(self):
         self.es_connection_mock.ping.return_value = False
         with self.assertRaises(ConnectionError):
-            with patch('barito_curator.utils.Elasticsearch', self.es_mock):
+            with patch('elasticsearch.Elasticsearch', self.es_mock):
                 connect_to_elasticsearch(self.address)
 
 
@@ -185,10 +208,10 @@ class BuildDeleteActionForExpiredIndicesTestCase(TestCase):
 
         @patch('barito_curator.utils.connect_to_elasticsearch',
                self.connect_to_elasticsearch_mock)
-        @patch('barito_curator.utils.IndexList', self.index_list_init_mock)
+        @patch('curator.IndexList', self.index_list_init_mock)
         @patch('barito_curator.utils.filter_expired_indices',
                self.filter_expired_indices_mock)
-        @patch('barito_curator.utils.DeleteIndices',
+        @patch('curator.DeleteIndices',
                self.delete_indices_init_mock)
         def func():
             return build_delete_action_for_expired_indices(
@@ -216,51 +239,264 @@ class BuildDeleteActionForExpiredIndicesTestCase(TestCase):
         self.assertEqual(self.delete_indices_mock, self.target_return_value)
 
 
-class DeleteExpiredIndices(TestCase):
+class FilterExpiredIndexNamesTestCase(TestCase):
     @classmethod
     def setUpClass(cls):
         cls.faker = Faker()
 
     def setUp(self):
-        self.delete_timeout = 10
+        self.index_1_name = f"{self.faker.domain_word()}-2020.01.01"
+        self.index_2_name = f"{self.faker.domain_word()}-2020.01.02"
+        self.index_3_name = self.faker.domain_word()
         self.cluster_mock = Mock()
-        self.child_logger_mock = Mock()
+        self.classify_indices_mock = Mock(return_value=IndexClassification(
+            {self.index_2_name, self.index_1_name}, set(),
+            {self.index_3_name}))
         self.logger_mock = Mock()
-        self.logger_mock.getChild = Mock(return_value=self.child_logger_mock)
-        self.delete_action_mock = Mock()
-        self.delete_action_mock.do_action = Mock()
-        self.build_delete_action_for_expired_indices_mock = Mock(
-            return_value=self.delete_action_mock)
-        self.elasticsearch_exception = ElasticsearchException(
-            self.faker.sentence())
 
-    def call_target(self, cluster, delete_timeout, **kwargs):
-        with patch(
-                'barito_curator.utils.build_delete_action_for_expired_indices',
-                self.build_delete_action_for_expired_indices_mock):
-            delete_expired_indices(self.logger_mock, cluster, delete_timeout, **kwargs)
+    def call_target(self):
+        with patch('barito_curator.utils.classify_indices',
+                   self.classify_indices_mock):
+            return filter_expired_index_names(
+                self.logger_mock,
+                [self.index_1_name, self.index_2_name, self.index_3_name],
+                self.cluster_mock)
+
+    def test_expired_only(self):
+        self.assertEqual(sorted([self.index_1_name, self.index_2_name]),
+                         self.call_target())
+
+    def test_state_classify_call(self):
+        state_mock = Mock()
+        state_mock.classify = self.classify_indices_mock
+        filter_expired_index_names(self.logger_mock, [self.index_1_name],
+                                   self.cluster_mock, state_mock)
+        state_mock.classify.assert_called_once_with(self.cluster_mock,
+                                                    [self.index_1_name])
+
+    def test_classify_indices_call(self):
+        self.call_target()
+        self.classify_indices_mock.assert_called_once_with(
+            self.cluster_mock,
+            [self.index_1_name, self.index_2_name, self.index_3_name])
 
-    def test_build_delete_action_for_expired_indices_mock_call(self):
-        self.call_target(self.cluster_mock, self.delete_timeout)
-        self.build_delete_action_for_expired_indices_mock.assert_called_once_with(
-            self.child_logger_mock, self.cluster_mock, self.delete_timeout)
+    def test_unparseable_log(self):
+        self.call_target()
+        self.logger_mock.warning.assert_called_once_with(
+            f"Unable to check index `{self.index_3_name}`: "
+            "No date information in index name")
 
-    def test_logger_get_child_prefix(self):
-        self.call_target(self.cluster_mock, self.delete_timeout)
-        self.logger_mock.getChild.assert_called_once_with(
-            f"Cluster `{self.cluster_mock.address}`")
 
-    def test_do_action_call(self):
+class ListIndicesTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faker = Faker()
+
+    def setUp(self):
+        self.index_names = [
+            f"{self.faker.domain_word()}-2020.01.0{day}" for day in range(1, 4)
+        ]
+        self.elastic_mock = Mock()
+        self.elastic_mock.cat.indices = Mock(return_value=[{
+            'index': name,
+            'store.size': str(size)
+        } for size, name in enumerate(self.index_names)])
+
+    def test_cat_indices_call(self):
+        list_indices(self.elastic_mock)
+        self.elastic_mock.cat.indices.assert_called_once_with(
+            format='json',
+            h='index,store.size',
+            bytes='b',
+            expand_wildcards='open,closed')
+
+    def test_return(self):
+        self.assertEqual(
+            {name: size
+             for size, name in enumerate(self.index_names)},
+            list_indices(self.elastic_mock))
+
+    def test_closed_index_size(self):
+        self.elastic_mock.cat.indices.return_value = [{
+            'index': self.index_names[0],
+            'store.size': None
+        }]
+        self.assertEqual({self.index_names[0]: None},
+                         list_indices(self.elastic_mock))
+
+
+class DeleteIndicesTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faker = Faker()
+
+    def setUp(self):
+        self.delete_timeout = 10
+        self.logger_mock = Mock()
+        self.elastic_mock = Mock()
+        self.elastic_mock.cluster.pending_tasks = Mock(
+            return_value={'tasks': []})
+        self.index_names = [
+            f"{self.faker.domain_word()}-2020.01.0{day}" for day in range(1, 4)
+        ]
+
+    def test_delete_call(self):
+        delete_indices(self.logger_mock, self.elastic_mock, self.index_names,
+                       self.delete_timeout)
+        self.elastic_mock.indices.delete.assert_called_once_with(
+            index=','.join(self.index_names),
+            master_timeout=f"{self.delete_timeout}s",
+            ignore_unavailable=True)
+
+    def test_return_deleted(self):
+        self.assertEqual(
+            self.index_names,
+            delete_indices(self.logger_mock, self.elastic_mock,
+                           self.index_names, self.delete_timeout))
+
+    def test_partial_failure_retried(self):
+        self.elastic_mock.indices.delete.side_effect = [
+            TransportError(500, self.faker.sentence()), None
+        ]
+        self.elastic_mock.indices.get_alias.return_value = {
+            self.index_names[0]: {}
+        }
+        deleted = delete_indices(self.logger_mock, self.elastic_mock,
+                                 self.index_names, self.delete_timeout)
+        self.elastic_mock.indices.delete.assert_called_with(
+            index=self.index_names[0],
+            master_timeout=f"{self.delete_timeout}s",
+            ignore_unavailable=True)
+        self.assertEqual(sorted(self.index_names), sorted(deleted))
+
+    def test_gives_up_after_retries(self):
+        self.elastic_mock.indices.delete.side_effect = TransportError(
+            500, self.faker.sentence())
+        self.elastic_mock.indices.get_alias.return_value = {
+            self.index_names[0]: {}
+        }
+        delete_indices(self.logger_mock, self.elastic_mock, self.index_names,
+                       self.delete_timeout)
+        self.logger_mock.warning.assert_called_with(
+            f"Unable to delete index `{self.index_names[0]}` after retries")
+
+    def test_pending_tasks_unavailable(self):
+        self.elastic_mock.cluster.pending_tasks.side_effect = TransportError(
+            500, self.faker.sentence())
+        self.assertEqual(
+            self.index_names,
+            delete_indices(self.logger_mock, self.elastic_mock,
+                           self.index_names, self.delete_timeout))
+
+    def test_existence_check_unavailable(self):
+        self.elastic_mock.indices.delete.side_effect = [
+            TransportError(500, self.faker.sentence()), None
+        ]
+        self.elastic_mock.indices.get_alias.side_effect = TransportError(
+            500, self.faker.sentence())
+        self.assertEqual(
+            self.index_names,
+            delete_indices(self.logger_mock, self.elastic_mock,
+                           self.index_names, self.delete_timeout))
+        self.elastic_mock.indices.delete.assert_called_with(
+            index=','.join(self.index_names),
+            master_timeout=f"{self.delete_timeout}s",
+            ignore_unavailable=True)
+
+    def test_dry_run_not_deleting(self):
+        delete_indices(self.logger_mock, self.elastic_mock, self.index_names,
+                       self.delete_timeout, dry_run=True)
+        self.assertFalse(self.elastic_mock.indices.delete.called)
+
+    def test_dry_run_log(self):
+        delete_indices(self.logger_mock, self.elastic_mock, self.index_names,
+                       self.delete_timeout, dry_run=True)
+        self.logger_mock.info.assert_any_call(
+            f"DRY-RUN: delete index `{self.index_names[0]}`")
+
+    def test_empty(self):
+        delete_indices(self.logger_mock, self.elastic_mock, [],
+                       self.delete_timeout)
+        self.assertFalse(self.elastic_mock.indices.delete.called)
+
+
+class DeleteExpiredIndicesWithClientTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faker = Faker()
+
+    def setUp(self):
+        self.delete_timeout = 10
+        self.cluster_mock = Mock()
+        self.cluster_mock.disk_watermark = None
+        self.cluster_mock.has_log_tiers = False
+        self.logger_mock = Mock()
+        self.elastic_mock = Mock()
+        self.index_names = {self.faker.domain_word(): 1024}
+        self.list_indices_mock = Mock(return_value=self.index_names)
+        self.expired_index_names = [self.faker.domain_word()]
+        self.filter_expired_index_names_mock = Mock(
+            return_value=self.expired_index_names)
+        self.delete_indices_mock = Mock(return_value=[])
+
+    def call_target(self, cluster, delete_timeout, **kwargs):
+        with patch('barito_curator.utils.list_indices',
+                   self.list_indices_mock), \
+                patch('barito_curator.utils.filter_expired_index_names',
+                      self.filter_expired_index_names_mock), \
+                patch('barito_curator.utils.delete_indices',
+                      self.delete_indices_mock):
+            delete_expired_indices_with_client(self.logger_mock,
+                                               self.elastic_mock, cluster,
+                                               delete_timeout, **kwargs)
+
+    def test_filter_expired_index_names_call(self):
         self.call_target(self.cluster_mock, self.delete_timeout)
-        self.delete_action_mock.do_action.assert_called_once_with()
+        self.filter_expired_index_names_mock.assert_called_once_with(
+            self.logger_mock, self.index_names, self.cluster_mock, None)
+
+    def test_reuses_listing(self):
+        self.call_target(self.cluster_mock, self.delete_timeout,
+                         index_sizes=self.index_names)
+        self.list_indices_mock.assert_not_called()
+
+    def test_state_record_deleted(self):
+        state_mock = Mock()
+        self.delete_indices_mock.return_value = self.expired_index_names
+        self.call_target(self.cluster_mock, self.delete_timeout,
+                         state=state_mock)
+        state_mock.record_deleted.assert_called_once_with(
+            self.cluster_mock.address, self.expired_index_names)
 
-    def test_do_dry_run_call(self):
-        self.call_target(self.cluster_mock, self.delete_timeout, dry_run=True)
-        self.delete_action_mock.do_dry_run.assert_called_once_with()
+    def test_delete_indices_call(self):
+        self.call_target(self.cluster_mock, self.delete_timeout)
+        self.delete_indices_mock.assert_called_once_with(
+            self.logger_mock, self.elastic_mock, self.expired_index_names,
+            self.delete_timeout, False, ANY)
 
-    def test_dry_run_not_doing_any_action(self):
+    def test_dry_run_call(self):
         self.call_target(self.cluster_mock, self.delete_timeout, dry_run=True)
-        self.assertFalse(self.delete_action_mock.do_action.called)
+        self.delete_indices_mock.assert_called_once_with(
+            self.logger_mock, self.elastic_mock, self.expired_index_names,
+            self.delete_timeout, True, ANY)
+
+    def test_over_budget_indices_deleted(self):
+        self.cluster_mock.disk_watermark = 80
+        over_budget_index_names = [self.faker.domain_word()]
+        self.elastic_mock.cat.allocation.return_value = [{
+            'disk.used': '900',
+            'disk.total': '1000'
+        }]
+        with patch('barito_curator.utils.select_over_budget_indices',
+                   return_value=over_budget_index_names) as select_mock:
+            self.call_target(self.cluster_mock, self.delete_timeout)
+        select_mock.assert_called_once_with(self.cluster_mock,
+                                            self.index_names, 900, 1000,
+                                            set(self.expired_index_names))
+        self.delete_indices_mock.assert_called_once_with(
+            self.logger_mock, self.elastic_mock,
+            self.expired_index_names + over_budget_index_names,
+            self.delete_timeout, False, ANY)
 
 
 class DeleteExpiredIndicesInClustersTestCase(TestCase):
@@ -268,35 +504,177 @@ class DeleteExpiredIndicesInClustersTestCase(TestCase):
     def setUpClass(cls):
         cls.faker = Faker()
 
+    def build_sample(self, status='green'):
+        return ClusterSample(Mock(disk_watermark=None), status, 0, 0, 0, 0)
+
     def setUp(self):
-        self.cluster_1_mock = Mock()
-        self.cluster_2_mock = Mock()
+        self.samples = [self.build_sample(), self.build_sample()]
+        self.clusters = [sample.cluster for sample in self.samples]
         self.logger_mock = Mock()
         self.dry_run = self.faker.pybool()
-        self.delete_expired_indices_mock = Mock()
+        self.sample_cluster_mock = Mock(side_effect=lambda logger, cluster, policy: {
+            sample.cluster: sample
+            for sample in self.samples
+        }.get(cluster))
+        self.delete_mock = Mock()
         self.delete_timeout = 10
 
-    def call_target(self, clusters):
-        with patch('barito_curator.utils.delete_expired_indices',
-                   self.delete_expired_indices_mock):
-            delete_expired_indices_in_clusters(self.logger_mock, clusters, self.delete_timeout,
-                                               self.dry_run)
+    def call_target(self, **kwargs):
+        with patch('barito_curator.utils.sample_cluster',
+                   self.sample_cluster_mock), \
+                patch('barito_curator.utils.delete_expired_indices_in_sample',
+                      self.delete_mock):
+            delete_expired_indices_in_clusters(self.logger_mock, self.clusters,
+                                               self.delete_timeout,
+                                               self.dry_run, **kwargs)
 
     def test_single_cluster(self):
-        self.call_target([self.cluster_1_mock])
-        self.delete_expired_indices_mock.assert_called_once_with(
-            self.logger_mock, self.cluster_1_mock, self.delete_timeout, self.dry_run)
-
-    def test_multiple_clusters(self):
-        self.call_target([self.cluster_1_mock, self.cluster_2_mock])
-        self.delete_expired_indices_mock.assert_called_with(
-            self.logger_mock, self.cluster_2_mock, self.delete_timeout, self.dry_run)
+        self.samples = self.samples[:1]
+        self.clusters = self.clusters[:1]
+        self.call_target()
+        self.delete_mock.assert_called_once_with(self.logger_mock,
+                                                 self.samples[0],
+                                                 self.delete_timeout,
+                                                 self.dry_run,
+                                                 state=None,
+                                                 stop_at=None,
+                                                 policy=None)
 
     def test_multiple_clusters_all_deleted(self):
-        calls = set()
-        self.delete_expired_indices_mock.side_effect = lambda *args: calls.add(
-            (*args, ))
-        self.call_target([self.cluster_1_mock, self.cluster_2_mock])
+        self.call_target()
+        self.assertEqual(
+            {id(sample) for sample in self.samples},
+            {id(call.args[1]) for call in self.delete_mock.call_args_list})
+
+    def test_skips_unsampled_and_red_clusters(self):
+        self.samples.append(self.build_sample('red'))
+        self.clusters = self.clusters + [Mock(), self.samples[2].cluster]
+        self.call_target()
+        self.assertEqual(2, self.delete_mock.call_count)
+
+    def test_deadline(self):
+        started = time.monotonic()
+        self.call_target(deadline=30)
+        stop_at = self.delete_mock.call_args.kwargs['stop_at']
+        self.assertLessEqual(started + 30, stop_at)
+        self.assertLessEqual(stop_at, time.monotonic() + 30)
 
-        self.assertIn((self.logger_mock, self.cluster_1_mock, self.delete_timeout, self.dry_run),
-                      calls)
+
+class SampleClusterTestCase(TestCase):
+    def setUp(self):
+        self.cluster = Cluster('a', 1, {})
+        self.elastic_mock = Mock()
+        self.elastic_mock.cluster.health.return_value = {'status': 'yellow'}
+        self.elastic_mock.cat.allocation.return_value = [{
+            'disk.used': '900',
+            'disk.total': '1000'
+        }]
+        self.elastic_mock.cat.indices.return_value = [{
+            'index': 'app-2020.01.01',
+            'store.size': '1024'
+        }, {
+            'index': 'app-2020.01.05',
+            'store.size': '1024'
+        }]
+        self.logger_mock = Mock()
+
+    @freeze_time(date(2020, 1, 5))
+    def test_sample(self):
+        with patch('barito_curator.utils.connect_to_elasticsearch',
+                   return_value=self.elastic_mock):
+            sample = sample_cluster(self.logger_mock, self.cluster)
+        self.assertEqual(
+            ClusterSample(self.cluster, 'yellow', 900, 1000, 1, ANY), sample)
+        self.elastic_mock.close.assert_called_once_with()
+
+    def test_sweep_after_waiting(self):
+        policy = Mock(wraps=ResiliencePolicy(cluster_timeout=0.5))
+        self.elastic_mock.cluster.pending_tasks.return_value = {'tasks': []}
+        with patch('barito_curator.utils.connect_to_elasticsearch',
+                   return_value=self.elastic_mock):
+            sample = sample_cluster(self.logger_mock, self.cluster, policy)
+            time.sleep(0.6)
+            delete_expired_indices_in_sample(self.logger_mock, sample, 10,
+                                             policy=policy)
+        self.elastic_mock.indices.delete.assert_called_once()
+        policy.new_guard.assert_called_with(sample.sample_time)
+        self.assertLess(sample.sample_time, 0.5)
+
+    def test_unreachable(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        policy = ResiliencePolicy(max_attempts=1, breaker=breaker)
+        with patch('barito_curator.utils.connect_to_elasticsearch',
+                   side_effect=ConnectionError('down')):
+            self.assertIsNone(
+                sample_cluster(self.logger_mock, self.cluster, policy))
+        self.logger_mock.getChild.return_value.warning.assert_called_once_with(
+            "Unable to sample cluster: down")
+        self.assertTrue(breaker.is_open(self.cluster.address))
+
+    def test_retries_transient_errors(self):
+        policy = ResiliencePolicy(backoff_factor=0)
+        self.elastic_mock.cluster.health.side_effect = [
+            ConnectionError('reset'), {'status': 'green'}]
+        with patch('barito_curator.utils.connect_to_elasticsearch',
+                   return_value=self.elastic_mock):
+            sample = sample_cluster(self.logger_mock, self.cluster, policy)
+        self.assertEqual('green', sample.status)
+
+    def test_circuit_open(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record_failure(self.cluster.address)
+        with patch('barito_curator.utils.connect_to_elasticsearch') as connect:
+            self.assertIsNone(sample_cluster(
+                self.logger_mock, self.cluster,
+                ResiliencePolicy(breaker=breaker)))
+        connect.assert_not_called()
+        self.logger_mock.getChild.return_value.warning.assert_called_once_with(
+            "Skipping cluster: circuit open after repeated failures")
+
+
+class DeleteExpiredIndicesInSampleTestCase(TestCase):
+    def setUp(self):
+        self.sample = ClusterSample(Mock(), 'green', 900, 1000, 1, 0)
+        self.elastic_mock = Mock()
+        self.logger_mock = Mock()
+        self.child_logger_mock = self.logger_mock.getChild.return_value
+
+    def call_target(self, **kwargs):
+        with patch('barito_curator.utils.connect_to_elasticsearch',
+                   return_value=self.elastic_mock), \
+                patch('barito_curator.utils.delete_expired_indices_with_client'
+                      ) as delete_mock:
+            delete_expired_indices_in_sample(self.logger_mock, self.sample, 10,
+                                             **kwargs)
+        return delete_mock
+
+    def test_lists_again_and_closes_client(self):
+        delete_mock = self.call_target()
+        delete_mock.assert_called_once_with(self.child_logger_mock,
+                                            self.elastic_mock,
+                                            self.sample.cluster, 10, False,
+                                            None, guard=ANY)
+        self.elastic_mock.close.assert_called_once_with()
+
+    def test_deadline_reached(self):
+        delete_mock = self.call_target(stop_at=time.monotonic())
+        delete_mock.assert_not_called()
+        self.child_logger_mock.warning.assert_called_once_with(
+            "Skipping cluster: run deadline reached")
+
+    def test_exception_log(self):
+        policy = Mock(wraps=ResiliencePolicy())
+        with patch('barito_curator.utils.connect_to_elasticsearch',
+                   side_effect=ConnectionError('down')):
+            delete_expired_indices_in_sample(self.logger_mock, self.sample, 10,
+                                             policy=policy)
+        self.child_logger_mock.warning.assert_called_once_with(
+            "Unable to delete expired indices: down")
+        policy.record_failure.assert_called_once_with(
+            self.sample.cluster.address)
+
+    def test_records_success(self):
+        policy = Mock(wraps=ResiliencePolicy())
+        self.call_target(policy=policy)
+        policy.record_success.assert_called_once_with(
+            self.sample.cluster.address)